@@ -1,36 +1,160 @@
-from flask import Flask, render_template, request
-from search import perform_search
+import os
+from flask import Flask, Response, render_template, request, jsonify
+from live_index import LiveIndex
+from query_log import QueryLog
+from search import OR_MODE, QUERY_MODES
+from scoring import DEFAULT_SCORER, SCORERS
+from metrics import QueryTrace, query_metrics
+from text_processing import stem_cache
+from snippets import snippet_text
+from completions import SUGGESTIONS
 
 app = Flask(__name__)
 results_per_page = 10
+# Load the index once at startup, every request is served by the engine of the published build
+# A new build (or an update of this one) is opened and verified in the background, and swapped in without
+# interrupting the requests in progress (see live_index.py)
+# When served by gunicorn with preload_app (see gunicorn.conf.py), the engine is created once in the master
+# process before it forks, so all workers share the same memory-mapped index pages
+# For a sharded index, the shards are searched by a local process pool, or by the shard servers started with
+# "python3 shards.py" if SHARD_PORT is set to the port of their first shard
+# (gunicorn workers are forked from the same process and can't share a local pool, so set SHARD_PORT under gunicorn)
+# If CHAMPIONS is set to 1, top-k queries are answered from the champion lists of an index built with --binary first
+# (faster for common words, but approximate, see SearchEngine.rank_champions)
+# If QUERY_LOG is set, the searched queries are appended to that file, and every engine (at startup and after a swap)
+# warms its posting cache with the terms of the most recent ones (see SearchEngine.warm_posting_cache)
+shard_port = os.environ.get("SHARD_PORT")
+query_log_file = os.environ.get("QUERY_LOG")
+live_index = LiveIndex(port=int(shard_port) if shard_port else None, query_log=query_log_file,
+                       champions=os.environ.get("CHAMPIONS") == "1")
+query_log = QueryLog(query_log_file) if query_log_file else None
+
+def get_page(query: str, page: int, per_page: int, trace: QueryTrace = None, mode: str = OR_MODE,
+             scorer: str = DEFAULT_SCORER, correct: bool = True) -> tuple:
+    # Returns the total number of results, the results on the page, the total number of pages and the spelling
+    # corrections of the query
+    # Each result is a dictionary with the url, title and snippet of the document (see SearchEngine.search_results)
+    # Misspelled words are searched as their corrections (the corrected query), unless correct is False
+    # Otherwise, a query with words that have much more frequent spellings gets a suggested query ("did you mean")
+    total_results = 0
+    paginated_results = []
+    spelling = dict(corrected_query=None, suggested_query=None)
+
+    # Only the results of the requested page are ranked and looked up (and get a snippet)
+    if query:
+        # The trace starts before the spelling correction, so that the whole query is timed
+        if trace is None:
+            trace = QueryTrace()
+        query_tokens = query.split()
+        # The whole query uses the same engine, even if a new build is swapped in meanwhile
+        with live_index.acquire() as engine:
+            corrected, suggested = engine.correct_query(query_tokens, trace)
+            if corrected is not None and correct:
+                query_tokens = corrected
+                spelling["corrected_query"] = " ".join(corrected)
+            elif suggested is not None:
+                spelling["suggested_query"] = " ".join(suggested)
+            # The searched query is logged, so corrected misspellings warm the postings of their corrections
+            if query_log is not None and page == 1:
+                query_log.append(" ".join(query_tokens))
+            start = (page - 1) * per_page
+            total_results, paginated_results = engine.search_results(query_tokens, start, per_page, trace, mode,
+                                                                     scorer)
+
+    total_pages = total_results // per_page
+    if total_results % per_page != 0:
+        total_pages += 1
+    return total_results, paginated_results, total_pages, spelling
+
+def get_mode(mode: str) -> str:
+    # Unknown query modes fall back to the default (OR)
+    return mode if mode in QUERY_MODES else OR_MODE
+
+def get_scorer(scorer: str) -> str:
+    # Unknown scorers fall back to the default (tf-idf)
+    return scorer if scorer in SCORERS else DEFAULT_SCORER
+
+def get_correct(correct: str) -> bool:
+    # Misspelled words are corrected unless correct=0 ("search instead for" what was typed)
+    return correct != "0"
 
 @app.route("/", methods=["GET", "POST"])
 def index():
-    query = ""
-    results = []
-    
     if request.method == "POST":
         query = request.form["query"]
-        query_tokens = query.split()
-        results = perform_search(query_tokens)
+        mode = get_mode(request.form.get("mode", OR_MODE))
+        scorer = get_scorer(request.form.get("scorer", DEFAULT_SCORER))
+        correct = True
         page = 1
     else:
         query = request.args.get("query", "")
+        mode = get_mode(request.args.get("mode", OR_MODE))
+        scorer = get_scorer(request.args.get("scorer", DEFAULT_SCORER))
+        correct = get_correct(request.args.get("correct"))
         page = int(request.args.get("page", 1))
-        
-        if query:
-            query_tokens = query.split()
-            results = perform_search(query_tokens)
 
-    start = (page - 1) * results_per_page
-    end = min(start + results_per_page, len(results))
-    paginated_results = results[start:end]
+    _, paginated_results, total_pages, spelling = get_page(query, page, results_per_page, mode=mode, scorer=scorer,
+                                                           correct=correct)
+    return render_template("interface.html", query=query, mode=mode, modes=QUERY_MODES, scorer=scorer,
+                           scorers=SCORERS, results=paginated_results, page=page, total_pages=total_pages,
+                           correct=correct, **spelling)
 
-    total_pages = len(results) // results_per_page
-    if len(results) % results_per_page != 0:
-        total_pages += 1
+@app.route("/api/search")
+def api_search():
+    # JSON version of the search page
+    # EX: /api/search?query=career+fair&page=2&per_page=10
+    # Add mode=and (every word) or mode=phrase (the exact phrase) to change which docs match, the default is or
+    # Add scorer=cosine or scorer=bm25 to change how the matched docs are ranked, the default is tfidf
+    # A word ending with * matches the most frequent words starting with it (EX: query=comput*+science)
+    # Misspelled words are searched as their corrections (EX: query=carrer+fair returns corrected_query "career fair"),
+    # add correct=0 to search the query as typed
+    # A query without misspelled words may get a suggested_query instead ("did you mean")
+    # Add trace=1 to get the time spent in each stage of this query
+    # Each result has the url, the title and the snippet of the document, with the [start, end) character offsets
+    # of the highlighted query words in the snippet
+    query = request.args.get("query", "")
+    mode = get_mode(request.args.get("mode", OR_MODE))
+    scorer = get_scorer(request.args.get("scorer", DEFAULT_SCORER))
+    page = max(1, request.args.get("page", 1, type=int))
+    per_page = min(100, max(1, request.args.get("per_page", results_per_page, type=int)))
+    correct = get_correct(request.args.get("correct"))
+    trace = QueryTrace() if request.args.get("trace") == "1" else None
+
+    total_results, paginated_results, total_pages, spelling = get_page(query, page, per_page, trace, mode, scorer,
+                                                                       correct)
+    results = []
+    for result in paginated_results:
+        snippet, highlights = snippet_text(result["snippet"])
+        results.append(dict(url=result["url"], title=result["title"], snippet=snippet, highlights=highlights))
+    response = dict(query=query, mode=mode, scorer=scorer, page=page, per_page=per_page,
+                    total_results=total_results, total_pages=total_pages, results=results, **spelling)
+    if trace is not None:
+        response["trace"] = trace.to_dict()
+    return jsonify(response)
+
+@app.route("/suggest")
+def suggest():
+    # Completions of the last word of a partly typed query, the most frequent first
+    # EX: /suggest?query=career+fa&count=5 -> "career fair", "career faculty", ...
+    query = request.args.get("query", "")
+    count = min(20, max(1, request.args.get("count", SUGGESTIONS, type=int)))
+    with live_index.acquire() as engine:
+        suggestions = engine.suggest(query, count)
+    return jsonify(query=query, suggestions=suggestions)
+
+@app.route("/metrics")
+def metrics():
+    # Query latency histograms (total and per stage) and counters, in the Prometheus text format
+    return Response(query_metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
-    return render_template("interface.html", query=query, results=paginated_results, page=page, total_pages=total_pages)
+@app.route("/stats")
+def stats():
+    # Hit rates and memory use of the caches (one block cache per document store, one posting cache per shard),
+    # and the build being served
+    with live_index.acquire() as engine:
+        return jsonify(query_cache=engine.query_cache.stats(), stem_cache=stem_cache.stats(),
+                       docstore_caches=engine.docstore_stats(), posting_caches=engine.posting_cache_stats(),
+                       index=live_index.stats())
 
 if __name__ == "__main__":
     app.run(debug=False)
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import argparse
+from search import OR_MODE, CACHED_RESULTS, get_default_engine, get_token_dict
+from scoring import DEFAULT_SCORER, SCORERS
+from metrics import QueryTrace
+from benchmarks.bench_query import QUERY_KINDS, query_terms, make_query_mix
+from benchmarks.load_test import percentile
+# Compares top-k OR queries answered from the champion lists (tier 1, see SearchEngine.rank_champions) with the
+# exhaustive ranking of the full postings, on the query mix of bench_query
+# For each kind of query it reports the latency of both, the postings decoded, how many queries fell back to tier 2,
+# and the recall of tier 1: the share of the exhaustive top k that tier 1 also ranks in its top k
+# Run from the project root on an index built in the binary format by inverted_index.py or benchmarks.bench_index:
+# python3 -m benchmarks.bench_champions --index-dir /tmp/bench/index --output champion_results.json
+
+# Sizes of the top k whose recall is measured (the first page, and the CACHED_RESULTS docs ranked per query)
+RECALL_DEPTHS = (10, CACHED_RESULTS)
+
+def rank_query(engine, query: list, use_champions: bool, scorer: str) -> tuple:
+    # Returns the top CACHED_RESULTS doc ids of the query, the ranking time in milliseconds and the trace
+    engine.use_champions = use_champions
+    trace = QueryTrace()
+    start_time = time.perf_counter()
+    _, ranked_docs = engine.rank(get_token_dict(query), CACHED_RESULTS, trace, OR_MODE, scorer=scorer)
+    return ranked_docs, (time.perf_counter() - start_time) * 1000, trace
+
+def run_benchmark(queries_per_kind: int, rounds: int, seed: int, scorer: str) -> dict:
+    engine = get_default_engine()
+    if not any(segment.has_champions for segment in engine.segments):
+        raise SystemExit("The index has no champion lists, rebuild it in the binary format")
+    # Both rankings decode their postings, instead of reading what the other one left in the posting cache
+    engine.posting_cache = None
+    mix = make_query_mix(query_terms("."), queries_per_kind, seed)
+    results = {"scorer": scorer, "kinds": {}}
+    for kind in QUERY_KINDS:
+        latencies = {"exhaustive": [], "champions": []}
+        postings_decoded = {"exhaustive": 0, "champions": 0}
+        recalls = {depth: [] for depth in RECALL_DEPTHS}
+        fallbacks = 0
+        for round_number in range(rounds):
+            for query in mix[kind]:
+                exhaustive, exhaustive_ms, exhaustive_trace = rank_query(engine, query, False, scorer)
+                tiered, tiered_ms, tiered_trace = rank_query(engine, query, True, scorer)
+                latencies["exhaustive"].append(exhaustive_ms)
+                latencies["champions"].append(tiered_ms)
+                if round_number != 0:
+                    continue
+                postings_decoded["exhaustive"] += exhaustive_trace.counters["postings_decoded"]
+                postings_decoded["champions"] += tiered_trace.counters["postings_decoded"]
+                fallbacks += tiered_trace.counters["tier2_fallbacks"]
+                for depth in RECALL_DEPTHS:
+                    expected = set(exhaustive[:depth])
+                    if len(expected) != 0:
+                        recalls[depth].append(len(expected & set(tiered[:depth])) / len(expected))
+
+        summary = {}
+        for path, path_latencies in latencies.items():
+            path_latencies.sort()
+            summary[path] = {"p50_ms": percentile(path_latencies, 0.50), "p99_ms": percentile(path_latencies, 0.99),
+                             "postings_decoded": postings_decoded[path] // len(mix[kind])}
+        summary["tier2_fallbacks"] = fallbacks
+        for depth, depth_recalls in recalls.items():
+            summary[f"recall@{depth}"] = sum(depth_recalls) / len(depth_recalls) if depth_recalls else 1.0
+        results["kinds"][kind] = summary
+    engine.use_champions = False
+    return results
+
+def print_results(results: dict) -> None:
+    print(f"scorer {results['scorer']}")
+    for kind, summary in results["kinds"].items():
+        recalls = "  ".join(f"{key} {value:.3f}" for key, value in summary.items() if key.startswith("recall"))
+        print(f"{kind:<8} {recalls}  tier 2 fallbacks {summary['tier2_fallbacks']}")
+        for path in ("exhaustive", "champions"):
+            print(f"  {path:<11} p50 {summary[path]['p50_ms']:8.2f} ms  p99 {summary[path]['p99_ms']:8.2f} ms  "
+                  f"{summary[path]['postings_decoded']:8d} postings decoded per query")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compares champion list (tier 1) and exhaustive top-k rankings")
+    parser.add_argument("--index-dir", default=".", help="directory of the index")
+    parser.add_argument("--queries", type=int, default=50, help="number of queries of each kind")
+    parser.add_argument("--rounds", type=int, default=3, help="number of times the mix is replayed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scorer", choices=SCORERS, default=DEFAULT_SCORER, help="scorer of every query")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    output_file_name = os.path.abspath(args.output) if args.output else None
+    # The engine uses paths relative to the index directory
+    os.chdir(args.index_dir)
+    benchmark_results = run_benchmark(args.queries, args.rounds, args.seed, args.scorer)
+    print_results(benchmark_results)
+    if output_file_name:
+        with open(output_file_name, "w") as output_file:
+            json.dump(benchmark_results, output_file, indent=2)
@@ -0,0 +1,70 @@
+import os
+import time
+import random
+import argparse
+from bisect import bisect_left
+from completions import SUGGESTIONS, PREFIX_END, rank_range
+from search import get_default_engine
+from benchmarks.load_test import percentile
+# Times prefix completions (the /suggest endpoint) and wildcard queries against an index
+# For each prefix length, prefixes are taken from the words of the completion index with a fixed seed, and completed
+# with the stored completions of heavy prefixes (as the engine does) and by scanning the prefix's whole range
+# (what a lexicon without them would have to do), which must give the same completions
+# Run from the project root on an index built by inverted_index.py or benchmarks.bench_index --work-dir:
+# python3 -m benchmarks.bench_completions --index-dir /tmp/bench/index
+
+PREFIX_LENGTHS = (1, 2, 3, 4, 6)
+
+def time_calls(function, arguments: list) -> list:
+    # Returns the time of each call in microseconds
+    latencies = []
+    for argument in arguments:
+        start_time = time.perf_counter()
+        function(argument)
+        latencies.append((time.perf_counter() - start_time) * 1000000)
+    return sorted(latencies)
+
+def scan_completions(completion_index, prefix: str, count: int) -> list:
+    start = bisect_left(completion_index.words, prefix)
+    end = bisect_left(completion_index.words, prefix + PREFIX_END, start)
+    return [(completion_index.words[position], completion_index.terms[position], completion_index.dfs[position])
+            for position in rank_range(completion_index.words, completion_index.terms, completion_index.dfs,
+                                       start, end, count)]
+
+def run_benchmark(prefixes_per_length: int, seed: int) -> None:
+    engine = get_default_engine()
+    if len(engine.completion_indexes) != 1:
+        raise SystemExit("The index has no completion index (or several segments), rebuild or compact it first")
+    completion_index = engine.completion_indexes[0]
+    rng = random.Random(seed)
+    words = [word for word in completion_index.words if len(word) >= max(PREFIX_LENGTHS)]
+
+    print(f"{len(completion_index.words)} words, {len(completion_index.prefixes)} stored prefixes")
+    for length in PREFIX_LENGTHS:
+        prefixes = [word[:length] for word in rng.sample(words, min(prefixes_per_length, len(words)))]
+        for prefix in prefixes:
+            assert engine.complete(prefix) == scan_completions(completion_index, prefix, SUGGESTIONS), prefix
+        stored = time_calls(engine.complete, prefixes)
+        scanned = time_calls(lambda prefix: scan_completions(completion_index, prefix, SUGGESTIONS), prefixes)
+        print(f"  prefix length {length}  complete p50 {percentile(stored, 0.50):9.1f} us  "
+              f"p99 {percentile(stored, 0.99):9.1f} us   scan p50 {percentile(scanned, 0.50):9.1f} us  "
+              f"p99 {percentile(scanned, 0.99):9.1f} us")
+
+        # The first page of a wildcard query, with the query cache cleared
+        def wildcard_query(prefix: str) -> None:
+            engine.query_cache.clear()
+            engine.search_results([prefix + "*"], 0, 10)
+        queries = time_calls(wildcard_query, prefixes)
+        print(f"  prefix length {length}  wildcard query p50 {percentile(queries, 0.50) / 1000:7.2f} ms  "
+              f"p99 {percentile(queries, 0.99) / 1000:7.2f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times prefix completions and wildcard queries against an index")
+    parser.add_argument("--index-dir", default=".", help="directory of the index")
+    parser.add_argument("--prefixes", type=int, default=200, help="number of prefixes of each length")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # The engine uses paths relative to the index directory
+    os.chdir(args.index_dir)
+    run_benchmark(args.prefixes, args.seed)
@@ -0,0 +1,128 @@
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from collections import Counter
+import inverted_index
+from extraction import SOUP_EXTRACTOR, EXTRACTOR_FUNCTIONS, MalformedPage, available_extractors, extract_with_soup
+from text_processing import tokenize
+from benchmarks.corpus import generate_corpus
+# Compares the text extraction backends of the indexer (see extraction.py) on the same pages
+# extract -> extraction alone, the pages already in memory (docs/s and MB/s of HTML)
+# process -> process_web_page(), as in creating_partial_indexes: read the page, extract, tokenize, stem, weigh
+# For each backend, also reports the pages it handed over to BeautifulSoup (fallbacks) and the pages
+# whose text, important-tag tokens or title differ from the soup backend
+# Run from the project root: python3 -m benchmarks.bench_extraction --docs 5000 --output extraction_results.json
+
+def load_pages(paths: list) -> list:
+    contents = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as page_file:
+            contents.append(json.load(page_file)['content'])
+    return contents
+
+def important_tokens(important_texts: list) -> Counter:
+    return Counter(token for text in important_texts for token in tokenize(text))
+
+def time_extraction(extractor: str, contents: list, rounds: int) -> dict:
+    # Best of rounds, so a slow round (EX: another process on the machine) doesn't count
+    extract = EXTRACTOR_FUNCTIONS[extractor]
+    best_seconds = None
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        for content in contents:
+            try:
+                extract(content)
+            except MalformedPage:
+                extract_with_soup(content)
+        seconds = time.perf_counter() - start_time
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+    megabytes = sum(len(content) for content in contents) / 2**20
+    return {"extract_seconds": best_seconds, "extract_docs_per_s": len(contents) / best_seconds,
+            "extract_mb_per_s": megabytes / best_seconds}
+
+def time_processing(extractor: str, paths: list) -> dict:
+    start_time = time.perf_counter()
+    for path in paths:
+        inverted_index.process_web_page(path, extractor=extractor)
+    seconds = time.perf_counter() - start_time
+    return {"process_seconds": seconds, "process_docs_per_s": len(paths) / seconds}
+
+def compare_with_soup(extractor: str, contents: list, references: list) -> dict:
+    fallbacks = 0
+    text_differences = 0
+    weight_differences = 0
+    title_differences = 0
+    for content, (reference_text, reference_tokens, reference_title) in zip(contents, references):
+        try:
+            text, important_texts, title = EXTRACTOR_FUNCTIONS[extractor](content)
+        except MalformedPage:
+            fallbacks += 1
+            continue
+        text_differences += text != reference_text
+        weight_differences += important_tokens(important_texts) != reference_tokens
+        title_differences += title != reference_title
+    return {"fallbacks": fallbacks, "text_differences": text_differences, "weight_differences": weight_differences,
+            "title_differences": title_differences}
+
+def run_benchmark(paths: list, extractors: list, rounds: int) -> dict:
+    contents = load_pages(paths)
+    references = []
+    for content in contents:
+        text, important_texts, title = extract_with_soup(content)
+        references.append((text, important_tokens(important_texts), title))
+    # One untimed pass, so the stem cache and the page cache of the OS are warm for every backend
+    for path in paths:
+        inverted_index.process_web_page(path, extractor=SOUP_EXTRACTOR)
+
+    results = {"pages": len(paths), "html_mb": sum(len(content) for content in contents) / 2**20}
+    for extractor in extractors:
+        results[extractor] = time_extraction(extractor, contents, rounds)
+        results[extractor].update(time_processing(extractor, paths))
+        if extractor != SOUP_EXTRACTOR:
+            results[extractor].update(compare_with_soup(extractor, contents, references))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the text extraction backends of the indexer")
+    parser.add_argument("--docs", type=int, default=5000, help="number of pages in the synthetic corpus")
+    parser.add_argument("--words", type=int, default=300, help="mean number of words per page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", help="use the pages of this corpus folder instead of generating them")
+    parser.add_argument("--limit", type=int, help="only use the first LIMIT pages of the corpus")
+    parser.add_argument("--extractors", nargs="+", choices=available_extractors(), default=available_extractors(),
+                        help="backends to benchmark (lxml is only available if it's installed)")
+    parser.add_argument("--rounds", type=int, default=3, help="timed rounds of extraction, the best one counts")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    work_dir = None
+    if args.corpus:
+        corpus_dir = args.corpus
+    else:
+        work_dir = Path(tempfile.mkdtemp(prefix="bench_extraction_"))
+        corpus_dir = generate_corpus(work_dir / "corpus", args.docs, mean_words=args.words, seed=args.seed)
+    try:
+        paths = inverted_index.list_web_pages(corpus_dir)[:args.limit]
+        if len(paths) == 0:
+            sys.exit(f"No web pages found in {corpus_dir}")
+        results = run_benchmark(paths, args.extractors, args.rounds)
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir)
+
+    print(f"{results['pages']} pages, {results['html_mb']:.1f} MB of HTML")
+    for extractor in args.extractors:
+        result = results[extractor]
+        line = (f"  {extractor:<7} extract {result['extract_docs_per_s']:9.1f} docs/s "
+                f"{result['extract_mb_per_s']:6.2f} MB/s   process {result['process_docs_per_s']:8.1f} docs/s")
+        if extractor != SOUP_EXTRACTOR:
+            line += (f"   fallbacks {result['fallbacks']}, differs from soup: text {result['text_differences']}, "
+                     f"weights {result['weight_differences']}, titles {result['title_differences']}")
+        print(line)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
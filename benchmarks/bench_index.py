@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+import inverted_index
+from index_format import BINARY_FORMAT, TEXT_FORMAT, LEXICON, LEXICON_TERMS, DOCUMENT_MAPPING, postings_file
+from near_duplicates import NearDuplicateIndex
+from benchmarks.corpus import generate_corpus
+# Times the two phases of a full build on a synthetic corpus (see benchmarks/corpus.py):
+# creating_partial_indexes (parse, tokenize, stem, write partial indexes) and merging_indexes (k-way merge)
+# Reports docs/s per phase, peak RSS and the on-disk size of the index, and can save them as JSON
+# The build runs in its own process, so that its peak RSS isn't mixed with generating the corpus
+# Run from the project root: python3 -m benchmarks.bench_index --docs 20000 --output index_results.json
+
+def directory_size(paths) -> int:
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+def run_build(corpus_dir: str, workers: int, index_format: str, near_dup_threshold: int = None,
+              memory_budget: float = inverted_index.MEMORY_BUDGET_MB) -> None:
+    # Runs inside the child process (cwd = the index directory), prints its results as JSON
+    inverted_index.partial_index_count = 0
+    inverted_index.indexed_doc_count = 0
+    inverted_index.unique_term_count = 0
+    inverted_index.indexed_posting_count = 0
+    inverted_index.near_duplicate_count = 0
+    inverted_index.near_duplicate_posting_count = 0
+    inverted_index.set_up_files()
+    near_duplicates = NearDuplicateIndex(near_dup_threshold) if near_dup_threshold is not None else None
+    startup_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start_time = time.perf_counter()
+    web_pages = inverted_index.stat_web_pages(inverted_index.list_web_pages(corpus_dir))
+    file_state = inverted_index.creating_partial_indexes(web_pages, workers, near_duplicates=near_duplicates,
+                                                         memory_budget=memory_budget)
+    partial_seconds = time.perf_counter() - start_time
+    # ru_maxrss is in KB on Linux
+    partial_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start_time = time.perf_counter()
+    inverted_index.merging_indexes(inverted_index.partial_index_count, index_format)
+    merge_seconds = time.perf_counter() - start_time
+    inverted_index.write_file_state(file_state)
+
+    doc_count = inverted_index.indexed_doc_count
+    partial_files = [inverted_index.get_partial_index_file_name(n)
+                     for n in range(1, inverted_index.partial_index_count + 1)]
+    print(json.dumps({
+        "pages": len(web_pages), "docs": doc_count, "terms": inverted_index.unique_term_count,
+        "workers": workers, "format": index_format, "memory_budget": memory_budget,
+        "near_dup_threshold": near_dup_threshold, "near_duplicates": inverted_index.near_duplicate_count,
+        "postings": inverted_index.indexed_posting_count,
+        "near_duplicate_postings": inverted_index.near_duplicate_posting_count,
+        "partial_indexes": inverted_index.partial_index_count,
+        "partial_seconds": partial_seconds, "partial_docs_per_s": doc_count / partial_seconds,
+        "merge_seconds": merge_seconds, "merge_docs_per_s": doc_count / merge_seconds,
+        "total_seconds": partial_seconds + merge_seconds,
+        "startup_rss_mb": startup_rss_kb / 1024, "partial_peak_rss_mb": partial_rss_kb / 1024,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        "partial_mb": directory_size(partial_files) / 2**20,
+        "postings_mb": directory_size([postings_file(index_format)]) / 2**20,
+        "lexicon_mb": directory_size([LEXICON, LEXICON_TERMS]) / 2**20,
+        "document_mapping_mb": directory_size([DOCUMENT_MAPPING]) / 2**20}))
+
+def run_benchmark(args) -> dict:
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix="bench_index_"))
+    try:
+        if args.corpus:
+            corpus_dir = Path(args.corpus).resolve()
+        else:
+            start_time = time.perf_counter()
+            corpus_dir = generate_corpus(work_dir / "corpus", args.docs, args.vocabulary, args.zipf,
+                                         args.words, seed=args.seed,
+                                         near_duplicate_rate=args.near_duplicates).resolve()
+            print(f"Generated {args.docs} pages in {time.perf_counter() - start_time:.1f} s")
+
+        index_dir = work_dir / "index"
+        index_dir.mkdir(parents=True, exist_ok=True)
+        project_root = Path(__file__).resolve().parent.parent
+        env = dict(os.environ, PYTHONPATH=str(project_root))
+        index_format = BINARY_FORMAT if args.binary else TEXT_FORMAT
+        command = [sys.executable, "-m", "benchmarks.bench_index", "--run", str(corpus_dir),
+                   "--workers", str(args.workers), "--format", index_format,
+                   "--memory-budget", str(args.memory_budget)]
+        if args.near_dup_threshold is not None:
+            command += ["--near-dup-threshold", str(args.near_dup_threshold)]
+        output = subprocess.run(command, cwd=index_dir, env=env, capture_output=True, text=True, check=True).stdout
+        results = json.loads(output.strip().splitlines()[-1])
+        results["corpus"] = {"docs": args.docs, "vocabulary": args.vocabulary, "zipf": args.zipf,
+                             "words": args.words, "seed": args.seed,
+                             "near_duplicates": args.near_duplicates} if not args.corpus else str(corpus_dir)
+        return results
+    finally:
+        # With --work-dir the corpus and index are kept (EX: to run benchmarks.bench_query on the index)
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks a full build of the index on a synthetic corpus")
+    parser.add_argument("--docs", type=int, default=10000, help="number of pages in the synthetic corpus")
+    parser.add_argument("--vocabulary", type=int, default=50000, help="number of distinct words")
+    parser.add_argument("--zipf", type=float, default=1.1, help="exponent of the Zipfian word distribution")
+    parser.add_argument("--words", type=int, default=300, help="mean number of words per page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--near-duplicates", type=float, default=0.0,
+                        help="fraction of pages that repeat an earlier page with a few words added")
+    parser.add_argument("--corpus", help="index this corpus folder instead of generating one")
+    parser.add_argument("--work-dir", help="keep the corpus and the index in this directory")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for creating partial indexes")
+    parser.add_argument("--binary", action="store_true", help="build the binary index format")
+    parser.add_argument("--near-dup-threshold", type=int, help="drop near-duplicate pages (see inverted_index.py)")
+    parser.add_argument("--memory-budget", type=float, default=inverted_index.MEMORY_BUDGET_MB, metavar="MB",
+                        help="memory the partial index may take before it's written to a partial index file")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--format", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_build(args.run, args.workers, args.format, args.near_dup_threshold, args.memory_budget)
+        sys.exit(0)
+
+    results = run_benchmark(args)
+    print(f"{results['docs']} docs, {results['terms']} terms, {results['partial_indexes']} partial indexes "
+          f"({results['workers']} workers, {results['format']} format)")
+    print(f"  partial indexes {results['partial_seconds']:8.2f} s  {results['partial_docs_per_s']:9.1f} docs/s")
+    print(f"  merge           {results['merge_seconds']:8.2f} s  {results['merge_docs_per_s']:9.1f} docs/s")
+    if results["near_dup_threshold"] is not None:
+        print(f"  near-duplicates dropped: {results['near_duplicates']} documents, "
+              f"{results['near_duplicate_postings']} <term, doc> pairs "
+              f"({results['near_duplicate_postings'] / max(1, results['postings']):.1%} of the indexed pairs)")
+    print(f"  peak RSS {results['peak_rss_mb']:.1f} MB (workers {results['worker_peak_rss_mb']:.1f} MB)")
+    print(f"  on disk: postings {results['postings_mb']:.1f} MB, lexicon {results['lexicon_mb']:.1f} MB, "
+          f"partial indexes {results['partial_mb']:.1f} MB")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
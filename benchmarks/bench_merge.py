@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+from sortedcontainers import SortedDict
+import inverted_index
+# Compares the merge phase before and after partial indexes were streamed line by line
+# "legacy"    -> whole-file JSON partial indexes, re-loaded by load_chunk for every chunk of terms
+# "streaming" -> line-delimited partial indexes, read once through read_partial_index
+# Each mode runs in its own process, so that its peak RSS can be measured on its own
+# Run from the project root: python3 -m benchmarks.bench_merge
+
+def generate_partial_indexes(directory: Path, partial_count: int, terms_per_partial: int,
+                             docs_per_partial: int, seed: int) -> int:
+    # Writes the same synthetic partial indexes in both formats, returns the number of documents
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(terms_per_partial * 2)]
+    (directory / "json").mkdir()
+    (directory / "txt").mkdir()
+    (directory / "bin").mkdir()
+
+    for partial_number in range(1, partial_count + 1):
+        first_doc = (partial_number - 1) * docs_per_partial + 1
+        partial_index = SortedDict()
+        for term in rng.sample(vocabulary, terms_per_partial):
+            df = min(docs_per_partial, int(rng.paretovariate(1.2)))
+            doc_ids = sorted(rng.sample(range(first_doc, first_doc + docs_per_partial), df))
+            partial_index[term] = {doc_id: round(rng.uniform(0.1, 2.0), 5) for doc_id in doc_ids}
+
+        with open(directory / f"json/partial_index{partial_number}.json", "w") as json_file:
+            json_file.write(json.dumps(partial_index))
+        with open(directory / inverted_index.get_partial_index_file_name(partial_number), "w") as txt_file:
+            for term, posting in partial_index.items():
+                txt_file.write(f"{term}|{json.dumps(posting)}\n")
+
+    return partial_count * docs_per_partial
+
+def legacy_load_chunk(partial_index_id: int, positions: list, chunk_size: int) -> dict:
+    # The load_chunk used before streaming: loads the whole partial index to return one chunk of it
+    with open(f"json/partial_index{partial_index_id + 1}.json", "r") as file:
+        partial_index = json.load(file)
+        terms = list(partial_index.keys())
+        current_pos = positions[partial_index_id]
+        if current_pos == len(terms):
+            return {}
+        end_pos = min(current_pos + chunk_size, len(terms))
+        positions[partial_index_id] = end_pos
+        return {term: partial_index[term] for term in terms[current_pos:end_pos]}
+
+def legacy_merging_indexes(partial_index_count: int, chunk_size: int) -> None:
+    # The chunked k-way merge used before streaming, writing through the same IndexWriter
+    positions = [0] * partial_index_count
+    chunks = [legacy_load_chunk(i, positions, chunk_size) for i in range(partial_index_count)]
+    trackers = [iter(chunk) for chunk in chunks]
+    min_heap = []
+    for partial_index_id, tracker in enumerate(trackers):
+        term = next(tracker, "")
+        if term != "":
+            heapq.heappush(min_heap, (term, partial_index_id))
+
+    index_writer = inverted_index.IndexWriter(inverted_index.indexed_doc_count)
+    merged_postings = dict()
+    last_term = ""
+    while len(min_heap) != 0:
+        current_term, partial_index_id = heapq.heappop(min_heap)
+        if last_term != current_term:
+            if last_term != "":
+                inverted_index.write_term(index_writer, last_term, merged_postings)
+                merged_postings = dict()
+            last_term = current_term
+        merged_postings.update(chunks[partial_index_id][current_term])
+
+        next_term = next(trackers[partial_index_id], "")
+        if next_term == "":
+            chunks[partial_index_id] = legacy_load_chunk(partial_index_id, positions, chunk_size)
+            trackers[partial_index_id] = iter(chunks[partial_index_id])
+            next_term = next(trackers[partial_index_id], "")
+        if next_term != "":
+            heapq.heappush(min_heap, (next_term, partial_index_id))
+    if last_term != "":
+        inverted_index.write_term(index_writer, last_term, merged_postings)
+    index_writer.close()
+
+def run_merge(mode: str, partial_count: int, doc_count: int, chunk_size: int) -> None:
+    # Runs inside the child process (cwd = the benchmark directory), prints its results as JSON
+    inverted_index.indexed_doc_count = doc_count
+    inverted_index.unique_term_count = 0
+    baseline_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start_time = time.perf_counter()
+    if mode == "legacy":
+        legacy_merging_indexes(partial_count, chunk_size)
+    else:
+        inverted_index.merging_indexes(partial_count)
+    elapsed = time.perf_counter() - start_time
+
+    # ru_maxrss is in KB on Linux
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "seconds": elapsed, "peak_rss_mb": peak_rss_kb / 1024,
+                      "startup_rss_mb": baseline_rss_kb / 1024}))
+
+def run_benchmark(args) -> None:
+    directory = Path(tempfile.mkdtemp(prefix="bench_merge_"))
+    try:
+        doc_count = generate_partial_indexes(directory, args.partials, args.terms, args.docs, args.seed)
+        partial_bytes = sum(f.stat().st_size for f in (directory / "txt").glob("partial_index*.txt"))
+        print(f"{args.partials} partial indexes x {args.terms} terms ({partial_bytes / 2**20:.1f} MB of postings)")
+
+        project_root = Path(__file__).resolve().parent.parent
+        env = dict(os.environ, PYTHONPATH=str(project_root))
+        results = []
+        for mode in ("legacy", "streaming"):
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_merge", "--run", mode,
+                                     "--partials", str(args.partials), "--doc-count", str(doc_count),
+                                     "--chunk-size", str(args.chunk_size)],
+                                    cwd=directory, env=env, capture_output=True, text=True, check=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+            if mode == "legacy":
+                legacy_index = (directory / inverted_index.COMPLETE_INDEX).read_bytes()
+
+        # Both merges have to produce the same complete index
+        assert legacy_index == (directory / inverted_index.COMPLETE_INDEX).read_bytes(), "merged indexes differ"
+
+        for result in results:
+            print(f"  {result['mode']:<10} {result['seconds']:8.2f} s   peak RSS {result['peak_rss_mb']:8.1f} MB"
+                  f"   (startup {result['startup_rss_mb']:.1f} MB)")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the merge phase of inverted_index.py")
+    parser.add_argument("--partials", type=int, default=8, help="number of partial indexes")
+    parser.add_argument("--terms", type=int, default=50000, help="number of terms per partial index")
+    parser.add_argument("--docs", type=int, default=5000, help="number of documents per partial index")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="terms per chunk for the legacy merge")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--run", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--doc-count", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_merge(args.run, args.partials, args.doc_count, args.chunk_size)
+    else:
+        run_benchmark(args)
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import random
+import argparse
+from collections import OrderedDict
+from search import OR_MODE, CACHED_RESULTS, get_default_engine, get_token_dict
+from posting_cache import PostingCache
+from metrics import QueryTrace
+from benchmarks.bench_query import query_terms
+from benchmarks.load_test import percentile
+# Replays a Zipfian stream of queries (a few terms are in most queries, most terms are rare) without a posting cache,
+# with a plain LRU posting cache and with the W-TinyLFU posting cache of posting_cache.py (both of the same size),
+# and with the W-TinyLFU cache warmed from a recorded query log of the same traffic (see warm_posting_cache)
+# Queries are ranked directly (SearchEngine.rank), so the query result cache doesn't hide the postings read
+# Run from the project root on an index built by inverted_index.py or benchmarks.bench_index --work-dir:
+# python3 -m benchmarks.bench_postings_cache --index-dir /tmp/bench/index --output posting_cache_results.json
+
+# Number of terms the queries are drawn from (the most frequent terms of the index, in a random order of popularity)
+VOCABULARY_SIZE = 20000
+# Exponent of the Zipf distribution of the query terms
+ZIPF_EXPONENT = 1.0
+
+class LRUPostingCache:
+    # Baseline: the same byte bound as PostingCache, but every posting is admitted and the least recently used ones
+    # are evicted
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size: int) -> None:
+        if key in self.entries or size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size_bytes -= evicted_size
+            self.evictions += 1
+
+    def record(self, key, count: int) -> None:
+        pass
+
+    def reset_counters(self) -> None:
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "size_bytes": self.size_bytes, "evictions": self.evictions}
+
+def make_query_stream(terms: list, num_queries: int, seed: int) -> list:
+    # Returns num_queries queries of 1 to 3 terms, each term drawn with a probability of 1 / rank^ZIPF_EXPONENT
+    # Popularity isn't tied to the document frequency: the ranks are a random order of the vocabulary
+    rng = random.Random(seed)
+    vocabulary = [term for term, df in terms[:VOCABULARY_SIZE] if df > 1]
+    rng.shuffle(vocabulary)
+    weights = [1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(len(vocabulary))]
+    return [" ".join(rng.choices(vocabulary, weights, k=rng.randint(1, 3))) for _ in range(num_queries)]
+
+def replay(engine, queries: list) -> dict:
+    # Ranks every query, returns the latencies and the posting cache counters of the stream
+    latencies = []
+    hits = 0
+    misses = 0
+    postings_decoded = 0
+    for query in queries:
+        trace = QueryTrace()
+        start_time = time.perf_counter()
+        engine.rank(get_token_dict(query.split()), CACHED_RESULTS, trace, OR_MODE)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        hits += trace.counters["posting_cache_hits"]
+        misses += trace.counters["posting_cache_misses"]
+        postings_decoded += trace.counters["postings_decoded"]
+    latencies.sort()
+    lookups = hits + misses
+    return {"p50_ms": percentile(latencies, 0.50), "p99_ms": percentile(latencies, 0.99),
+            "mean_ms": sum(latencies) / len(latencies), "hit_rate": hits / lookups if lookups != 0 else 0.0,
+            "postings_decoded": postings_decoded}
+
+def run_benchmark(num_queries: int, cache_bytes: int, seed: int) -> dict:
+    engine = get_default_engine()
+    # The first half of the stream is the recorded query log, the second half is replayed
+    stream = make_query_stream(query_terms("."), 2 * num_queries, seed)
+    query_log, queries = stream[:num_queries], stream[num_queries:]
+    results = {"queries": num_queries, "cache_bytes": cache_bytes, "caches": {}}
+    caches = (("none", lambda: None), ("lru", lambda: LRUPostingCache(cache_bytes)),
+              ("w-tinylfu", lambda: PostingCache(cache_bytes)), ("w-tinylfu warmed", lambda: PostingCache(cache_bytes)))
+    default_cache = engine.posting_cache
+    for name, make_cache in caches:
+        engine.posting_cache = make_cache()
+        warmed = engine.warm_posting_cache(query_log) if name.endswith("warmed") else 0
+        summary = replay(engine, queries)
+        summary["warmed_postings"] = warmed
+        if engine.posting_cache is not None:
+            cache_stats = engine.posting_cache.stats()
+            summary.update(size_bytes=cache_stats["size_bytes"], evictions=cache_stats["evictions"])
+        results["caches"][name] = summary
+    engine.posting_cache = default_cache
+    return results
+
+def print_results(results: dict) -> None:
+    print(f"{results['queries']} queries, {results['cache_bytes'] / 2**20:.1f} MB posting cache")
+    for name, summary in results["caches"].items():
+        print(f"  {name:<17} p50 {summary['p50_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms  "
+              f"mean {summary['mean_ms']:8.2f} ms  hit rate {summary['hit_rate']:.3f}  "
+              f"{summary['postings_decoded']:10d} postings decoded", end="")
+        if "size_bytes" in summary:
+            print(f"  {summary['size_bytes'] / 2**20:6.1f} MB  {summary['evictions']:6d} evictions", end="")
+        print()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replays a Zipfian query stream with and without posting caches")
+    parser.add_argument("--index-dir", default=".", help="directory of the index")
+    parser.add_argument("--queries", type=int, default=5000, help="number of queries replayed (and in the log)")
+    parser.add_argument("--cache-mb", type=float, default=16, help="size of the posting caches in MB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    output_file_name = os.path.abspath(args.output) if args.output else None
+    # The engine uses paths relative to the index directory
+    os.chdir(args.index_dir)
+    benchmark_results = run_benchmark(args.queries, int(args.cache_mb * 2**20), args.seed)
+    print_results(benchmark_results)
+    if output_file_name:
+        with open(output_file_name, "w") as output_file:
+            json.dump(benchmark_results, output_file, indent=2)
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from collections import defaultdict
+from index_format import read_lexicon, read_shard_manifest
+from metrics import STAGES, QueryTrace
+from search import OR_MODE, QUERY_MODES, get_default_engine, perform_search
+from scoring import DEFAULT_SCORER, SCORERS
+from text_processing import porter_stemmer
+from benchmarks.load_test import percentile
+# Replays a fixed mix of queries against an index and reports latency percentiles per kind of query
+# short   -> 1-2 terms of moderate df, the common case
+# long    -> 6-10 terms, many postings to read and join
+# high_df -> 2-3 of the most frequent terms, the longest postings in the index
+# Queries are drawn from the index's own lexicon with a fixed seed, so the same index always gets the same mix
+# Every query is timed twice with the query cache cleared: perform_search (every matched url, as on the command line)
+# and the first page of engine.search_results (as the web app does, titles and snippets included), with the
+# per-stage breakdown of the trace
+# Run from the project root on an index built by inverted_index.py or benchmarks.bench_index --work-dir:
+# python3 -m benchmarks.bench_query --index-dir /tmp/bench/index --output query_results.json
+
+QUERY_KINDS = ("short", "long", "high_df")
+# Number of most frequent terms that high_df queries are drawn from
+HIGH_DF_TERMS = 50
+# Results per page of the web app
+PAGE_SIZE = 10
+
+def query_terms(index_dir: str) -> list:
+    # Returns the (term, df) pairs of the index whose stem is the term itself, most frequent first
+    # (a query made of those terms looks up exactly those terms after tokenizing and stemming)
+    shard_manifest = read_shard_manifest(index_dir)
+    if shard_manifest is not None:
+        # Every shard stores the document frequencies of the whole collection, the first shard is enough
+        index_dir = os.path.join(index_dir, shard_manifest["shards"][0])
+    terms, _, _, dfs, _ = read_lexicon(index_dir)
+    pairs = [(term, df) for term, df in zip(terms, dfs) if term.isalpha() and porter_stemmer.stem(term) == term]
+    pairs.sort(key=lambda pair: (-pair[1], pair[0]))
+    return pairs
+
+def make_query_mix(terms: list, queries_per_kind: int, seed: int) -> dict:
+    # Returns <kind, list of queries> pairs, each query being a list of words (like sys.argv for search.py)
+    rng = random.Random(seed)
+    frequent = [term for term, _ in terms[:HIGH_DF_TERMS]]
+    # Moderate df: below the most frequent terms, but still in more than one document
+    moderate = [term for term, df in terms[HIGH_DF_TERMS:] if df > 1] or frequent
+    return {"short": [rng.sample(moderate, rng.randint(1, 2)) for _ in range(queries_per_kind)],
+            "long": [rng.sample(moderate + frequent, rng.randint(6, 10)) for _ in range(queries_per_kind)],
+            "high_df": [rng.sample(frequent, min(len(frequent), rng.randint(2, 3))) for _ in range(queries_per_kind)]}
+
+def summarize(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    return {"queries": len(latencies),
+            "p50_ms": percentile(latencies, 0.50), "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99), "mean_ms": sum(latencies) / len(latencies),
+            "max_ms": latencies[-1]}
+
+def run_benchmark(query_mix: dict, rounds: int, mode: str = OR_MODE, scorer: str = DEFAULT_SCORER) -> dict:
+    engine = get_default_engine()
+    # One untimed pass, so the postings are paged in and every round measures the same warm state
+    for queries in query_mix.values():
+        for query in queries:
+            engine.search_results(query, 0, PAGE_SIZE, mode=mode, scorer=scorer)
+
+    results = dict()
+    for kind in QUERY_KINDS:
+        full_latencies = []
+        page_latencies = []
+        stage_seconds = defaultdict(float)
+        counters = defaultdict(int)
+        for _ in range(rounds):
+            for query in query_mix[kind]:
+                engine.query_cache.clear()
+                start_time = time.perf_counter()
+                perform_search(query, mode, scorer)
+                full_latencies.append((time.perf_counter() - start_time) * 1000)
+
+                engine.query_cache.clear()
+                trace = QueryTrace()
+                engine.search_results(query, 0, PAGE_SIZE, trace, mode, scorer)
+                page_latencies.append(trace.total() * 1000)
+                for stage, seconds in trace.stages.items():
+                    stage_seconds[stage] += seconds
+                for counter, amount in trace.counters.items():
+                    counters[counter] += amount
+
+        query_count = len(page_latencies)
+        results[kind] = {"perform_search": summarize(full_latencies), "first_page": summarize(page_latencies),
+                         "stages_mean_ms": {stage: stage_seconds[stage] * 1000 / query_count
+                                            for stage in STAGES if stage in stage_seconds},
+                         "counters_mean": {counter: amount / query_count for counter, amount in counters.items()}}
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replays a short/long/high-df query mix against an index")
+    parser.add_argument("--index-dir", default=".", help="directory of the index")
+    parser.add_argument("--queries", type=int, default=50, help="number of queries of each kind")
+    parser.add_argument("--rounds", type=int, default=3, help="number of times the mix is replayed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=QUERY_MODES, default=OR_MODE, help="query mode of every query")
+    parser.add_argument("--scorer", choices=SCORERS, default=DEFAULT_SCORER, help="scorer of every query")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    output_file_name = os.path.abspath(args.output) if args.output else None
+    # The engine and perform_search use paths relative to the index directory
+    os.chdir(args.index_dir)
+    terms = query_terms(".")
+    if len(terms) == 0:
+        sys.exit("The index has no terms to build queries from")
+    query_mix = make_query_mix(terms, args.queries, args.seed)
+    results = run_benchmark(query_mix, args.rounds, args.mode, args.scorer)
+
+    for kind in QUERY_KINDS:
+        for timing in ("perform_search", "first_page"):
+            summary = results[kind][timing]
+            print(f"  {kind:<8} {timing:<15} p50 {summary['p50_ms']:7.2f} ms   p95 {summary['p95_ms']:7.2f} ms"
+                  f"   p99 {summary['p99_ms']:7.2f} ms   max {summary['max_ms']:7.2f} ms")
+    if output_file_name:
+        results["mode"] = args.mode
+        results["scorer"] = args.scorer
+        results["queries"] = {kind: [" ".join(query) for query in queries] for kind, queries in query_mix.items()}
+        with open(output_file_name, "w") as output_file:
+            json.dump(results, output_file, indent=2)
@@ -0,0 +1,55 @@
+import time
+import random
+import argparse
+import numpy as np
+from search import union, rank_docs, top_k_docs, rank_docs_numpy
+# Compares the pure Python rank_docs (+ the MaxScore top_k_docs) against the NumPy scoring path
+# Run from the project root: python3 -m benchmarks.bench_scoring
+
+def make_posting(doc_count: int, df: int, rng: random.Random) -> tuple:
+    # A posting list with df random docs (sorted by doc id) and tf-idf-like scores rounded to 5 decimals
+    doc_ids = np.array(sorted(rng.sample(range(1, doc_count + 1), df)), dtype=np.int64)
+    scores = np.array([round(rng.uniform(0.001, 2.0), 5) for _ in range(df)], dtype=np.float64)
+    return doc_ids, scores
+
+def time_call(function, repeat: int) -> tuple:
+    # Returns the result of the last call and the average time per call in ms
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start_time) * 1000 / repeat
+
+def run_benchmark(doc_count: int, query_dfs: list, k: int, repeat: int, seed: int) -> None:
+    rng = random.Random(seed)
+    postings = [make_posting(doc_count, df, rng) for df in query_dfs]
+    upper_bounds = [float(scores.max()) for _, scores in postings]
+
+    full_ranking, rank_docs_ms = time_call(lambda: rank_docs(postings, union(postings)), repeat)
+    top_k, top_k_ms = time_call(lambda: top_k_docs(postings, upper_bounds, k), repeat)
+    (_, numpy_full), numpy_full_ms = time_call(lambda: rank_docs_numpy(postings), repeat)
+    (_, numpy_top_k), numpy_top_k_ms = time_call(lambda: rank_docs_numpy(postings, k), repeat)
+
+    # Every path has to produce the same ranking as rank_docs
+    assert numpy_full == full_ranking, "rank_docs_numpy differs from rank_docs"
+    assert numpy_top_k == full_ranking[:k], "rank_docs_numpy top k differs from rank_docs"
+    assert top_k == full_ranking[:k], "top_k_docs differs from rank_docs"
+
+    print(f"query dfs = {query_dfs}, matched docs = {len(full_ranking)}, k = {k}")
+    print(f"  rank_docs (full sort)      {rank_docs_ms:9.2f} ms")
+    print(f"  top_k_docs (MaxScore)      {top_k_ms:9.2f} ms")
+    print(f"  rank_docs_numpy (full)     {numpy_full_ms:9.2f} ms")
+    print(f"  rank_docs_numpy (top k)    {numpy_top_k_ms:9.2f} ms")
+    print(f"  speedup over rank_docs     {rank_docs_ms / numpy_top_k_ms:9.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the scoring paths of search.py")
+    parser.add_argument("--docs", type=int, default=55000, help="number of documents in the collection")
+    parser.add_argument("--k", type=int, default=10, help="number of top documents to retrieve")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs per scoring path")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Short, long and high-df (stopword-like) query shapes
+    query_shapes = [[200, 50], [5000, 1200, 300], [40000, 30000, 2000], [50000, 45000, 40000, 8000, 600, 30]]
+    for query_dfs in query_shapes:
+        run_benchmark(args.docs, query_dfs, args.k, args.repeat, args.seed)
@@ -0,0 +1,104 @@
+import os
+import time
+import random
+import argparse
+from spelling import (MIN_CORRECTION_DF, SPELLING_BUDGET, edit_distance, max_edit_distance, is_correctable, term_df,
+                      best_correction, SpellingTimeout)
+from search import get_default_engine
+from benchmarks.load_test import percentile
+# Times the spelling correction of misspelled query words against an index
+# Misspellings are made from the words of the completion index with a fixed seed (one deleted, swapped or replaced
+# letter), and corrected with the spelling index (as the engine does) and by computing the edit distance to every
+# word of the index (what a lexicon without it would have to do), which must give the same corrections
+# Run from the project root on an index built by inverted_index.py or benchmarks.bench_index --work-dir:
+# python3 -m benchmarks.bench_spelling --index-dir /tmp/bench/index
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+def misspell(word: str, rng: random.Random) -> str:
+    position = rng.randrange(1, len(word) - 1)
+    edit = rng.randrange(3)
+    if edit == 0:
+        return word[:position] + word[position + 1:]
+    if edit == 1:
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return word[:position] + rng.choice(LETTERS) + word[position + 1:]
+
+def scan_correction(spelling_indexes: list, words: list, word: str):
+    # The correction of a word that isn't in the index, by comparing it with every word
+    max_distance = max_edit_distance(word)
+    best = None
+    for candidate, term in words:
+        distance = edit_distance(word, candidate, max_distance)
+        if distance <= max_distance and candidate != word:
+            key = (distance, -term_df(spelling_indexes, term), candidate)
+            if best is None or key < best:
+                best = key
+    return best[2] if best is not None else None
+
+def budgeted_correction(spelling_indexes: list, word: str, deadline: float):
+    # The correction of a word with a deadline, None if it ran out of time (the engine keeps the word as typed)
+    try:
+        return best_correction(spelling_indexes, word, 0, deadline)
+    except SpellingTimeout:
+        return None
+
+def time_calls(function, arguments: list) -> list:
+    # Returns the time of each call in milliseconds
+    latencies = []
+    for argument in arguments:
+        start_time = time.perf_counter()
+        function(argument)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return sorted(latencies)
+
+def run_benchmark(word_count: int, seed: int) -> None:
+    engine = get_default_engine()
+    if len(engine.spelling_indexes) == 0:
+        raise SystemExit("The index has no spelling index, rebuild it first")
+    spelling_indexes = engine.spelling_indexes
+    completion_index = spelling_indexes[0].completion_index
+    rng = random.Random(seed)
+
+    # Misspellings that aren't words of the index, of words that can be suggested as corrections
+    words = [(word, term) for word, term in zip(completion_index.words, completion_index.terms)
+             if is_correctable(word) and term_df(spelling_indexes, term) >= MIN_CORRECTION_DF]
+    known = set(completion_index.words)
+    misspellings = []
+    for word, _ in rng.sample(words, len(words)):
+        misspelling = misspell(word, rng) if len(word) > 3 else word
+        if is_correctable(misspelling) and misspelling not in known:
+            misspellings.append((misspelling, word))
+            if len(misspellings) == word_count:
+                break
+
+    print(f"{len(completion_index.words)} words, {sum(len(index.hashes) for index in spelling_indexes)} deletes")
+    corrections = [best_correction(spelling_indexes, misspelling, 0, float("inf")) for misspelling, _ in misspellings]
+    scanned = misspellings[:max(1, word_count // 10)]
+    for (misspelling, _), correction in zip(scanned, corrections):
+        assert correction == scan_correction(spelling_indexes, words, misspelling), misspelling
+    restored = sum(1 for (_, word), correction in zip(misspellings, corrections) if correction == word)
+    print(f"  {restored} of {len(misspellings)} misspellings corrected to the original word "
+          f"(the others have a closer or more frequent word)")
+
+    for name, deadline in (("no budget", None), (f"{SPELLING_BUDGET * 1000:g} ms budget", SPELLING_BUDGET)):
+        latencies = time_calls(lambda misspelling: budgeted_correction(
+            spelling_indexes, misspelling, time.perf_counter() + deadline if deadline is not None else float("inf")),
+            [misspelling for misspelling, _ in misspellings])
+        label = f"index ({name})"
+        print(f"  {label:<22} p50 {percentile(latencies, 0.50):8.3f} ms  p99 {percentile(latencies, 0.99):8.3f} ms"
+              f"  max {latencies[-1]:8.3f} ms")
+    latencies = time_calls(lambda misspelling: scan_correction(spelling_indexes, words, misspelling),
+                           [misspelling for misspelling, _ in scanned])
+    print(f"  {'scan':<22} p50 {percentile(latencies, 0.50):8.3f} ms  p99 {percentile(latencies, 0.99):8.3f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times the spelling correction of misspelled words against an index")
+    parser.add_argument("--index-dir", default=".", help="directory of the index")
+    parser.add_argument("--words", type=int, default=500, help="number of misspelled words")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # The engine uses paths relative to the index directory
+    os.chdir(args.index_dir)
+    run_benchmark(args.words, args.seed)
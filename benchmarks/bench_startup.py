@@ -0,0 +1,47 @@
+import os
+import time
+import argparse
+from index_format import read_build_manifest, current_build_dir
+from shards import open_engine
+from benchmarks.load_test import percentile
+# Times opening the search engine (which only compares the file sizes with the build manifests) against verifying
+# the checksums of every file, which is what a hot swap does before serving a new build (see live_index.py)
+# The page cache is warm after the first round, so this measures the work of the engine rather than the disk
+# Run from the project root on an index built by inverted_index.py or benchmarks.bench_index --work-dir:
+# python3 -m benchmarks.bench_startup --index-dir /tmp/bench/index
+
+def time_call(function) -> float:
+    # Returns the time of the call in milliseconds
+    start_time = time.perf_counter()
+    function()
+    return (time.perf_counter() - start_time) * 1000
+
+def run_benchmark(rounds: int) -> None:
+    build_dir = current_build_dir(".")
+    build_manifest = read_build_manifest(build_dir)
+    if build_manifest is None:
+        raise SystemExit("The index has no build manifest, rebuild it first")
+    index_size = sum(entry["size"] for entry in build_manifest["files"].values())
+    print(f"{len(build_manifest['files'])} files, {index_size / 2**20:.1f} MB in the base segment")
+
+    open_latencies = []
+    verify_latencies = []
+    for _ in range(rounds):
+        engines = []
+        open_ms = time_call(lambda: engines.append(open_engine()))
+        open_latencies.append(open_ms)
+        verify_latencies.append(open_ms + time_call(engines[0].verify))
+        engines[0].close()
+    for name, latencies in (("open", open_latencies), ("open + verify", verify_latencies)):
+        latencies.sort()
+        print(f"  {name:<14} p50 {percentile(latencies, 0.50):9.2f} ms  max {latencies[-1]:9.2f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times opening the search engine and verifying the index checksums")
+    parser.add_argument("--index-dir", default=".", help="directory of the index")
+    parser.add_argument("--rounds", type=int, default=5, help="number of times the engine is opened")
+    args = parser.parse_args()
+
+    # The engine uses paths relative to the index directory
+    os.chdir(args.index_dir)
+    run_benchmark(args.rounds)
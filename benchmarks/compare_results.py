@@ -0,0 +1,71 @@
+import sys
+import json
+import argparse
+# Compares two JSON results of the same benchmark (bench_index, bench_query or load_test) and flags regressions
+# Exits with status 1 if any metric got worse by more than the threshold, so it can gate a change
+# Run from the project root: python3 -m benchmarks.compare_results baseline.json candidate.json --threshold 0.10
+
+# Suffixes of metrics where lower is better (times, memory, sizes) and where higher is better (throughput)
+LOWER_IS_BETTER = ("_ms", "_s", "seconds", "_mb")
+HIGHER_IS_BETTER = ("per_s", "qps")
+# Timings this small are mostly noise, their changes are shown but never flagged
+MIN_FLAGGED_MS = 0.05
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    # <"kind.mode.metric", number> pairs of every numeric value in the nested results
+    values = dict()
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+def direction(name: str) -> int:
+    # 1 if lower is better, -1 if higher is better, 0 if the metric isn't a cost (EX: a count)
+    metric = name.rsplit(".", 1)[-1]
+    if metric.endswith(HIGHER_IS_BETTER):
+        return -1
+    if metric.endswith(LOWER_IS_BETTER):
+        return 1
+    return 0
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> list:
+    # Returns (metric, baseline value, candidate value, relative change, regressed) for every shared metric
+    baseline_values = flatten(baseline)
+    candidate_values = flatten(candidate)
+    rows = []
+    for name in sorted(baseline_values.keys() & candidate_values.keys()):
+        old = baseline_values[name]
+        new = candidate_values[name]
+        change = (new - old) / old if old != 0 else 0.0
+        sign = direction(name)
+        regressed = sign != 0 and change * sign > threshold
+        if regressed and name.endswith("_ms") and max(old, new) < MIN_FLAGGED_MS:
+            regressed = False
+        rows.append((name, old, new, change, regressed))
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Flags regressions between two benchmark result files")
+    parser.add_argument("baseline", help="JSON results before the change")
+    parser.add_argument("candidate", help="JSON results after the change")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change flagged as a regression")
+    parser.add_argument("--all", action="store_true", help="show every metric, not only the costs")
+    args = parser.parse_args()
+
+    with open(args.baseline, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.candidate, "r") as candidate_file:
+        candidate = json.load(candidate_file)
+
+    rows = compare(baseline, candidate, args.threshold)
+    for name, old, new, change, regressed in rows:
+        if args.all or direction(name) != 0:
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{name:<50} {old:12.3f} -> {new:12.3f}  {change:+7.1%}{flag}")
+    regressions = [row for row in rows if row[4]]
+    print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+    if len(regressions) != 0:
+        sys.exit(1)
@@ -0,0 +1,110 @@
+import json
+import random
+import argparse
+from pathlib import Path
+from itertools import accumulate
+# Deterministic synthetic corpus in the same layout as developer/DEV: one folder per domain,
+# one {"url", "content"} JSON file per web page
+# Words are drawn from a Zipfian distribution (the frequency of the i-th most common word ~ 1 / i^s),
+# so the postings have the same long tail as a real crawl: a few huge postings and many tiny ones
+# The same arguments always produce byte-identical pages, so results of different runs can be compared
+# Run from the project root: python3 -m benchmarks.corpus --docs 20000 --output /tmp/corpus
+# Imported data structures/functions comments:
+# random.choices() with cum_weights -> O(k log n), where k = # of words drawn and n = # of words in the vocabulary
+
+# Pages per domain folder
+PAGES_PER_DOMAIN = 500
+
+# Syllables that words are built from, so the vocabulary looks like words to the tokenizer and the stemmer
+ONSETS = ["b", "c", "d", "f", "g", "h", "l", "m", "n", "p", "r", "s", "t", "v", "z", "br", "cl", "st", "tr"]
+VOWELS = ["a", "e", "i", "o", "u", "ai", "ea", "ou"]
+CODAS = ["", "n", "r", "s", "t", "ck", "ng", "st"]
+
+def make_vocabulary(size: int, seed: int) -> list:
+    # Returns size distinct lowercase words, the most frequent word first
+    rng = random.Random(seed)
+    vocabulary = []
+    seen = set()
+    while len(vocabulary) < size:
+        # Frequent words are short, like in natural language
+        syllables = 1 + min(3, len(vocabulary) * 4 // size) + rng.randint(0, 1)
+        word = "".join(rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS) for _ in range(syllables))
+        if word not in seen:
+            seen.add(word)
+            vocabulary.append(word)
+    return vocabulary
+
+def zipf_cum_weights(size: int, exponent: float) -> list:
+    # Cumulative weights for random.choices(), rank i (starting at 1) has weight 1 / i^exponent
+    return list(accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
+def make_text(rng: random.Random, vocabulary: list, cum_weights: list, count: int) -> str:
+    return " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=count))
+
+def make_page(rng: random.Random, vocabulary: list, cum_weights: list, words: int) -> str:
+    # HTML with the tags the indexer weighs (title, headings, bold) and a script block it has to skip
+    def text(count: int) -> str:
+        return make_text(rng, vocabulary, cum_weights, count)
+    paragraphs = []
+    remaining = words
+    while remaining > 0:
+        length = min(remaining, rng.randint(20, 120))
+        paragraphs.append(f"<p>{text(length)} <b>{text(2)}</b></p>")
+        remaining -= length
+    script = "<script>var x = 1;</script>" if rng.random() < 0.3 else ""
+    return (f"<html><head><title>{text(rng.randint(2, 6))}</title>{script}</head><body>"
+            f"<h1>{text(rng.randint(1, 4))}</h1>{''.join(paragraphs)}</body></html>")
+
+def make_near_duplicate(rng: random.Random, vocabulary: list, cum_weights: list, content: str) -> str:
+    # The same page with a few more words, like a calendar view or a listing under another session parameter
+    return content.replace("</body>", f"<p>{make_text(rng, vocabulary, cum_weights, rng.randint(1, 5))}</p></body>")
+
+def generate_corpus(output_dir: str, doc_count: int, vocabulary_size: int = 50000, exponent: float = 1.1,
+                    mean_words: int = 300, duplicate_rate: float = 0.02, seed: int = 0,
+                    near_duplicate_rate: float = 0.0) -> Path:
+    # Writes the corpus to output_dir/developer/DEV and returns that folder
+    # duplicate_rate of the pages repeat the content of an earlier page (the indexer skips exact duplicates)
+    # and near_duplicate_rate of the pages repeat it with a few words added (see --near-dup-threshold)
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, seed)
+    cum_weights = zipf_cum_weights(vocabulary_size, exponent)
+    corpus_dir = Path(output_dir) / "developer" / "DEV"
+    contents = []
+
+    for doc_number in range(doc_count):
+        domain = doc_number // PAGES_PER_DOMAIN
+        domain_dir = corpus_dir / f"domain{domain:04}"
+        if doc_number % PAGES_PER_DOMAIN == 0:
+            domain_dir.mkdir(parents=True, exist_ok=True)
+        if len(contents) != 0 and rng.random() < duplicate_rate:
+            content = rng.choice(contents)
+        # Only drawn with near-duplicates, so the pages of a corpus without them are the same as before
+        elif len(contents) != 0 and near_duplicate_rate > 0 and rng.random() < near_duplicate_rate:
+            content = make_near_duplicate(rng, vocabulary, cum_weights, rng.choice(contents))
+        else:
+            # Page lengths vary around the mean, with a few much longer pages
+            words = max(10, int(rng.expovariate(1 / mean_words)))
+            content = make_page(rng, vocabulary, cum_weights, words)
+            contents.append(content)
+        page = {"url": f"https://domain{domain}.example.edu/page{doc_number}", "content": content}
+        with open(domain_dir / f"page{doc_number % PAGES_PER_DOMAIN:04}.json", "w") as page_file:
+            json.dump(page, page_file)
+
+    return corpus_dir
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates a synthetic Zipfian corpus in the developer/DEV layout")
+    parser.add_argument("--docs", type=int, default=10000, help="number of web pages")
+    parser.add_argument("--vocabulary", type=int, default=50000, help="number of distinct words")
+    parser.add_argument("--zipf", type=float, default=1.1, help="exponent of the Zipfian word distribution")
+    parser.add_argument("--words", type=int, default=300, help="mean number of words per page")
+    parser.add_argument("--duplicates", type=float, default=0.02, help="fraction of exact duplicate pages")
+    parser.add_argument("--near-duplicates", type=float, default=0.0,
+                        help="fraction of pages that repeat an earlier page with a few words added")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="directory to write developer/DEV into")
+    args = parser.parse_args()
+
+    corpus_dir = generate_corpus(args.output, args.docs, args.vocabulary, args.zipf, args.words,
+                                 args.duplicates, args.seed, args.near_duplicates)
+    print(f"Wrote {args.docs} pages to {corpus_dir}")
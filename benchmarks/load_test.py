@@ -0,0 +1,97 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+# Local load generator for the search API: replays a query log against a running server and reports
+# latency percentiles and throughput
+# Start the server first (python3 app.py or gunicorn app:app), then run from the project root:
+# python3 -m benchmarks.load_test --queries query_log.txt --concurrency 8 --duration 30
+
+# Used when no query log is given (the sample queries from the README)
+SAMPLE_QUERIES = ["Architecture", "Artificial intelligence", "Bayesian model", "Capstone projects", "Career fair",
+                  "Compiler programming", "Constraint networks course", "Database systems", "Neuroscience",
+                  "Pythagorean theorem", "Probabilistic reasoning", "Reinforcement learning", "Security",
+                  "Software engineering degree"]
+
+def load_queries(file_name: str) -> list:
+    # One query per line, blank lines are skipped
+    with open(file_name, "r") as query_file:
+        return [line.strip() for line in query_file if line.strip() != ""]
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    if len(sorted_values) == 0:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def run_client(base_url: str, queries: list, deadline: float, max_requests: int, counter: list,
+               lock: threading.Lock, latencies: list, errors: list, seed: int) -> None:
+    # Sends requests back to back until the deadline (or until max_requests were sent by all clients)
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        with lock:
+            if max_requests and counter[0] >= max_requests:
+                return
+            counter[0] += 1
+        query = rng.choice(queries)
+        page = 1 if rng.random() < 0.8 else rng.randint(2, 5)
+        url = f"{base_url}/api/search?" + urllib.parse.urlencode({"query": query, "page": page})
+
+        start_time = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+            latencies.append((time.perf_counter() - start_time) * 1000)
+        except Exception as e:
+            errors.append(str(e))
+
+def run_load_test(base_url: str, queries: list, concurrency: int, duration: float, max_requests: int) -> dict:
+    latencies = []
+    errors = []
+    counter = [0]
+    lock = threading.Lock()
+    start_time = time.perf_counter()
+    deadline = start_time + duration
+    clients = [threading.Thread(target=run_client, args=(base_url, queries, deadline, max_requests, counter, lock,
+                                                         latencies, errors, seed))
+               for seed in range(concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start_time
+
+    latencies.sort()
+    return {"requests": len(latencies), "errors": len(errors), "concurrency": concurrency,
+            "seconds": elapsed, "qps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": percentile(latencies, 0.50), "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99), "max_ms": latencies[-1] if latencies else 0.0}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replays a query log against the search API")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="base url of the running server")
+    parser.add_argument("--queries", help="query log with one query per line (default: the README sample queries)")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run for")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0 = no limit)")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries) if args.queries else SAMPLE_QUERIES
+    results = run_load_test(args.url.rstrip("/"), queries, args.concurrency, args.duration, args.requests)
+
+    print(f"{results['requests']} requests ({results['errors']} errors) in {results['seconds']:.1f} s "
+          f"with {results['concurrency']} clients")
+    print(f"  QPS {results['qps']:.1f}")
+    print(f"  p50 {results['p50_ms']:.1f} ms   p95 {results['p95_ms']:.1f} ms   p99 {results['p99_ms']:.1f} ms"
+          f"   max {results['max_ms']:.1f} ms")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if results["errors"] != 0:
+        sys.exit(1)
@@ -0,0 +1,173 @@
+import os
+import heapq
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+from index_format import (COMPLETION_WORDS, COMPLETION_DFS, COMPLETION_PREFIXES, COMPLETIONS, COMPLETION_RECORD,
+                          STORED_COMPLETIONS, NO_COMPLETION)
+from text_processing import stem_cache
+# Prefix completion of query words, for search-as-you-type suggestions and wildcard queries (EX: "comput*")
+# The lexicon holds stems, which aren't what users type (EX: "comput"), so completions are looked up in the sorted
+# list of the words seen while indexing, each with the stem it's indexed under and the df of that stem
+# The words starting with a prefix are a contiguous range of the sorted list (found by 2 binary searches), like the
+# subtree of a trie node: the completions of the prefix are the stems of the range with the highest dfs,
+# each shown as its shortest word in the range (EX: "comp" -> "compute", "company", "computer" is left out)
+# A short prefix (EX: "c") covers too many words to rank them per keystroke, so the indexer ranks the completions
+# of every prefix covering more than SCAN_LIMIT words ahead of time (the heavy nodes of the trie), any other prefix
+# is ranked by scanning its range
+# Imported data structures/functions comments:
+# bisect_left() on a sorted list -> O(log n), where n = # of words
+# heapq.nsmallest() -> O(n log k), where n = # of stems in the range and k = # of completions
+# itertools.groupby() -> O(n), where n = # of elements in the iterable
+
+# Prefixes covering at most this many words are ranked at query time (a scan of a few tens of microseconds)
+SCAN_LIMIT = 64
+# Heavy prefixes are only stored up to this length (longer prefixes almost never cover more than SCAN_LIMIT words)
+MAX_PREFIX_LENGTH = 8
+# Number of suggestions returned for search-as-you-type
+SUGGESTIONS = 8
+# A word ending with WILDCARD matches the MAX_WILDCARD_TERMS most frequent stems with a word starting with it,
+# so a short prefix never turns a query into thousands of postings to read
+WILDCARD = "*"
+MAX_WILDCARD_TERMS = 20
+# Words are lowercase letters and digits, so every word starting with a prefix sorts before prefix + PREFIX_END
+PREFIX_END = "\x7f"
+
+def rank_range(words: list, terms: list, dfs, start: int, end: int, count: int) -> list:
+    # Returns the positions of the completions of words[start:end]: the count stems with the highest dfs
+    # (then in alphabetical order), each at the position of its shortest word in the range
+    shortest = dict()
+    for position in range(start, end):
+        best = shortest.get(terms[position])
+        if best is None or len(words[position]) < len(words[best]):
+            shortest[terms[position]] = position
+    return heapq.nsmallest(count, shortest.values(), key=lambda position: (-dfs[position], terms[position]))
+
+# <word, stem> pairs of every word seen while indexing pages in this process
+# Worker processes send the words they see for the first time back with each page, and the main process merges them
+# in (see index_web_pages), so the main process ends up with the words of the whole corpus
+# (unlike the stem cache, it holds no word of an earlier build and never stops growing)
+seen_words = dict()
+
+def record_words(tokens: list, new_words: dict) -> None:
+    # Adds the <word, stem> pairs of the tokens that this process hasn't seen yet to seen_words and to new_words
+    for token in tokens:
+        word = token.lower()
+        if word not in seen_words:
+            seen_words[word] = new_words[word] = stem_cache.stem(token)
+
+def indexed_words() -> dict:
+    # Returns the <word, stem> pairs of the words seen while indexing
+    return dict(seen_words)
+
+def write_completion_index(index_dir: str, terms: list, dfs, word_terms: dict) -> tuple:
+    # Writes the completion index of an index directory, from its lexicon (terms and dfs) and <word, stem> pairs
+    # Returns its sorted words and the dfs of their stems (for the spelling index, see spelling.py)
+    # Words whose stem isn't in the lexicon are left out, and a stem without any word completes as itself
+    term_dfs = dict(zip(terms, dfs))
+    entries = {word: term for word, term in word_terms.items() if term in term_dfs}
+    for term in term_dfs.keys() - set(entries.values()):
+        entries.setdefault(term, term)
+    words = sorted(entries)
+    word_terms = [entries[word] for word in words]
+    word_dfs = array("I", [term_dfs[term] for term in word_terms])
+
+    with open(os.path.join(index_dir, COMPLETION_WORDS), "w") as words_file:
+        for word, term in zip(words, word_terms):
+            words_file.write(f"{word} {term}\n")
+    with open(os.path.join(index_dir, COMPLETION_DFS), "wb") as dfs_file:
+        word_dfs.tofile(dfs_file)
+
+    # Find the heavy prefixes one length at a time: only the range of a heavy prefix can hold longer heavy prefixes
+    heavy_prefixes = []
+    ranges = [(0, len(words))]
+    for length in range(1, MAX_PREFIX_LENGTH + 1):
+        next_ranges = []
+        for start, end in ranges:
+            group_start = start
+            for prefix, group in groupby(range(start, end), key=lambda position: words[position][:length]):
+                group_end = group_start + sum(1 for _ in group)
+                # Words shorter than the prefix length form a group of their own, which isn't a prefix of this length
+                if len(prefix) == length and group_end - group_start > SCAN_LIMIT:
+                    heavy_prefixes.append((prefix, rank_range(words, word_terms, word_dfs, group_start, group_end,
+                                                              STORED_COMPLETIONS)))
+                    next_ranges.append((group_start, group_end))
+                group_start = group_end
+        ranges = next_ranges
+
+    heavy_prefixes.sort()
+    with open(os.path.join(index_dir, COMPLETION_PREFIXES), "w") as prefixes_file:
+        for prefix, _ in heavy_prefixes:
+            prefixes_file.write(f"{prefix}\n")
+    # The completions file is written last, an index without it has no completion index (see open_completion_index)
+    with open(os.path.join(index_dir, COMPLETIONS), "wb") as completions_file:
+        for _, positions in heavy_prefixes:
+            completions_file.write(COMPLETION_RECORD.pack(
+                *(positions + [NO_COMPLETION] * (STORED_COMPLETIONS - len(positions)))))
+    return words, word_dfs
+
+class CompletionIndex:
+    # The completion index of an index directory (a segment, or the whole collection for a sharded index)
+    # Read-only once loaded, so it can be shared by threads
+
+    def __init__(self, index_dir: str = ".") -> None:
+        with open(os.path.join(index_dir, COMPLETION_WORDS), "r") as words_file:
+            lines = words_file.read().split("\n")
+        # The file ends with a newline, so the last split element is empty
+        lines.pop()
+        self.words = []
+        self.terms = []
+        for line in lines:
+            word, _, term = line.partition(" ")
+            self.words.append(word)
+            self.terms.append(term)
+        self.dfs = array("I")
+        with open(os.path.join(index_dir, COMPLETION_DFS), "rb") as dfs_file:
+            self.dfs.frombytes(dfs_file.read())
+
+        with open(os.path.join(index_dir, COMPLETION_PREFIXES), "r") as prefixes_file:
+            self.prefixes = prefixes_file.read().split("\n")
+        self.prefixes.pop()
+        with open(os.path.join(index_dir, COMPLETIONS), "rb") as completions_file:
+            self.completions = completions_file.read()
+
+    def complete(self, prefix: str, count: int = SUGGESTIONS) -> list:
+        # Returns the (word, stem, df) of the count completions of the (lowercase) prefix, most frequent stem first
+        start = bisect_left(self.words, prefix)
+        end = bisect_left(self.words, prefix + PREFIX_END, start)
+        if end - start > SCAN_LIMIT and count <= STORED_COMPLETIONS:
+            stored = bisect_left(self.prefixes, prefix)
+            if stored < len(self.prefixes) and self.prefixes[stored] == prefix:
+                positions = COMPLETION_RECORD.unpack_from(self.completions, stored * COMPLETION_RECORD.size)[:count]
+                return [(self.words[position], self.terms[position], self.dfs[position])
+                        for position in positions if position != NO_COMPLETION]
+        return [(self.words[position], self.terms[position], self.dfs[position])
+                for position in rank_range(self.words, self.terms, self.dfs, start, end, count)]
+
+    def word_terms(self) -> dict:
+        # Returns the <word, stem> pairs of the index (EX: to carry them over to a compacted segment)
+        return dict(zip(self.words, self.terms))
+
+def open_completion_index(index_dir: str = "."):
+    # Returns the CompletionIndex of the index directory, or None if it has none
+    # (EX: an index built before completions existed)
+    if not os.path.exists(os.path.join(index_dir, COMPLETIONS)):
+        return None
+    return CompletionIndex(index_dir)
+
+def merge_completions(completion_lists: list, count: int = SUGGESTIONS) -> list:
+    # Merges the completions of the segments of an index into the count stems with the highest dfs
+    # The segments hold different docs, so the dfs of a stem add up (a stem outside the completions of a segment
+    # misses that segment's df, which only matters until the segments are compacted)
+    merged = dict()
+    for completions in completion_lists:
+        for word, term, df in completions:
+            if term in merged:
+                merged[term][2] += df
+            else:
+                merged[term] = [word, term, df]
+    return [tuple(completion) for completion in heapq.nsmallest(count, merged.values(),
+                                                                key=lambda completion: (-completion[2], completion[1]))]
+
+def is_wildcard(term: str) -> bool:
+    return term.endswith(WILDCARD)
@@ -0,0 +1,194 @@
+import os
+import json
+import mmap
+import zlib
+import struct
+import threading
+from collections import OrderedDict
+from index_format import DOCSTORE, DOCSTORE_OFFSETS, DOCSTORE_INFO, DOCSTORE_RECORD
+# zstandard is optional, without it the blocks are compressed with zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+# Document store: the url, title and extracted text of every doc of a segment, for the results page
+# Docs are stored in blocks of BLOCK_DOCS consecutive doc ids, each block compressed on its own
+# (a block holds enough text for the compressor to find repetitions, and reading one doc only decompresses its block)
+# The offsets file has one fixed-width <offset, length> record per block, so the block of a doc id is found by
+# arithmetic: block = (doc_id - first_doc_id) // BLOCK_DOCS, record at block * DOCSTORE_RECORD.size
+# Decompressed block layout:
+# <number of docs n> then n <url length, title length, text length> records, then the UTF-8 bytes of each doc
+# (url, title and text back to back, in doc id order)
+# Imported data structures/functions comments:
+# zlib.compress()/zlib.decompress() -> O(n), where n = # of bytes in the block
+# Lookup in/move_to_end() of OrderedDict -> O(1)
+# struct.unpack_from() -> O(1) for a fixed-width record
+
+# Compression of the blocks, recorded in the store's info file so the reader knows how to decompress them
+ZLIB_CODEC = "zlib"
+ZSTD_CODEC = "zstd"
+DEFAULT_CODEC = ZSTD_CODEC if zstandard is not None else ZLIB_CODEC
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+# Number of consecutive docs compressed together
+BLOCK_DOCS = 16
+# Only the start of each doc's text is stored, snippets are taken from it (see snippets.py)
+STORED_TEXT_LENGTH = 20000
+# Number of decompressed blocks kept by the reader (the top results of a query are often in nearby blocks,
+# and the next page of the same query reads the same blocks again)
+DOCSTORE_CACHE_BLOCKS = 64
+
+BLOCK_HEADER = struct.Struct("<I")
+DOCUMENT_RECORD = struct.Struct("<III")
+
+def compress_block(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD_CODEC:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+def decompress_block(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD_CODEC:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+class DocumentStoreWriter:
+    # Writes the document store of a segment, docs must be added in doc id order
+    # A doc id skipped between two added docs (EX: a removed doc in a compacted segment) gets an empty record,
+    # so the block of every doc id can still be computed
+
+    def __init__(self, index_dir: str = ".", first_doc_id: int = 1, codec: str = DEFAULT_CODEC) -> None:
+        self.index_dir = index_dir
+        self.first_doc_id = first_doc_id
+        self.next_doc_id = first_doc_id
+        self.codec = codec
+        self.store_file = open(os.path.join(index_dir, DOCSTORE), "wb")
+        self.offsets_file = open(os.path.join(index_dir, DOCSTORE_OFFSETS), "wb")
+        self.offset = 0
+        # Encoded (url, title, text) of the docs of the current block
+        self.block = []
+
+    def add(self, doc_id: int, url: str, title: str, text: str) -> None:
+        while self.next_doc_id < doc_id:
+            self.add_record((b"", b"", b""))
+        self.add_record((url.encode("utf-8"), title.encode("utf-8"), text.encode("utf-8")))
+
+    def add_record(self, record: tuple) -> None:
+        self.block.append(record)
+        self.next_doc_id += 1
+        if len(self.block) == BLOCK_DOCS:
+            self.write_block()
+
+    def write_block(self) -> None:
+        header = [BLOCK_HEADER.pack(len(self.block))]
+        header.extend(DOCUMENT_RECORD.pack(*(len(part) for part in record)) for record in self.block)
+        data = compress_block(b"".join(header + [part for record in self.block for part in record]), self.codec)
+        self.store_file.write(data)
+        self.offsets_file.write(DOCSTORE_RECORD.pack(self.offset, len(data)))
+        self.offset += len(data)
+        self.block = []
+
+    def close(self) -> None:
+        if len(self.block) != 0:
+            self.write_block()
+        self.store_file.close()
+        self.offsets_file.close()
+        # The info file is written last, a store without it is ignored by the reader
+        with open(os.path.join(self.index_dir, DOCSTORE_INFO), "w") as info_file:
+            json.dump({"codec": self.codec, "block_docs": BLOCK_DOCS, "first_doc_id": self.first_doc_id,
+                       "doc_count": self.next_doc_id - self.first_doc_id}, info_file)
+
+class DocumentStore:
+    # Random access to the docs of a document store: one offsets record lookup and one block decompression per doc
+    # (none if its block is cached)
+    # Both files are memory-mapped, and the decompressed blocks are kept in a small LRU cache
+    # The cache holds a lock, so the store can be shared by the threads of the Flask app
+
+    def __init__(self, index_dir: str = ".", cache_blocks: int = DOCSTORE_CACHE_BLOCKS) -> None:
+        with open(os.path.join(index_dir, DOCSTORE_INFO), "r") as info_file:
+            info = json.load(info_file)
+        self.codec = info["codec"]
+        if self.codec == ZSTD_CODEC and zstandard is None:
+            raise RuntimeError("The document store is compressed with zstd, install the zstandard package")
+        self.block_docs = info["block_docs"]
+        self.first_doc_id = info["first_doc_id"]
+        self.doc_count = info["doc_count"]
+
+        self.files = []
+        self.store_map = self.map_file(os.path.join(index_dir, DOCSTORE))
+        self.offsets_map = self.map_file(os.path.join(index_dir, DOCSTORE_OFFSETS))
+
+        self.cache_blocks = cache_blocks
+        # <block number, decompressed block> pairs, least recently used first
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def map_file(self, file_name: str):
+        # Memory-maps one of the store's files, an empty file (nothing to read) becomes b""
+        mapped_file = open(file_name, "rb")
+        self.files.append(mapped_file)
+        if os.fstat(mapped_file.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        for mapped in (self.store_map, self.offsets_map):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for mapped_file in self.files:
+            mapped_file.close()
+
+    def get(self, doc_id: int) -> tuple:
+        # Returns (url, title, text) of the doc, or None if the doc id isn't in the store (or was removed)
+        index = doc_id - self.first_doc_id
+        if not 0 <= index < self.doc_count:
+            return None
+        block_number, position = divmod(index, self.block_docs)
+        block = self.read_block(block_number)
+
+        # Skip the lengths of the docs before this one in the block
+        data_offset = BLOCK_HEADER.size + BLOCK_HEADER.unpack_from(block)[0] * DOCUMENT_RECORD.size
+        for record in range(position):
+            data_offset += sum(DOCUMENT_RECORD.unpack_from(block, BLOCK_HEADER.size + record * DOCUMENT_RECORD.size))
+        url_length, title_length, text_length = DOCUMENT_RECORD.unpack_from(
+            block, BLOCK_HEADER.size + position * DOCUMENT_RECORD.size)
+        if url_length == 0:
+            return None
+        url_end = data_offset + url_length
+        title_end = url_end + title_length
+        return (block[data_offset:url_end].decode("utf-8"), block[url_end:title_end].decode("utf-8"),
+                block[title_end:title_end + text_length].decode("utf-8"))
+
+    def read_block(self, block_number: int) -> bytes:
+        with self.lock:
+            block = self.blocks.get(block_number)
+            if block is not None:
+                self.blocks.move_to_end(block_number)
+                self.hits += 1
+                return block
+            self.misses += 1
+
+        # Decompressed without holding the lock (two threads may both decompress the same block, with the same result)
+        offset, length = DOCSTORE_RECORD.unpack_from(self.offsets_map, block_number * DOCSTORE_RECORD.size)
+        block = decompress_block(self.store_map[offset:offset + length], self.codec)
+        with self.lock:
+            self.blocks[block_number] = block
+            # Evict the least recently used blocks once the cache is full
+            while len(self.blocks) > self.cache_blocks:
+                self.blocks.popitem(last=False)
+        return block
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"blocks": len(self.blocks), "max_blocks": self.cache_blocks,
+                    "size_bytes": sum(len(block) for block in self.blocks.values()), "hits": self.hits,
+                    "misses": self.misses, "hit_rate": self.hits / lookups if lookups != 0 else 0.0}
+
+def open_document_store(index_dir: str = "."):
+    # Returns the DocumentStore of the index directory (or segment), or None if it has none
+    # (EX: an index built before the document store existed)
+    if not os.path.exists(os.path.join(index_dir, DOCSTORE_INFO)):
+        return None
+    return DocumentStore(index_dir)
@@ -0,0 +1,240 @@
+from html.parser import HTMLParser
+import warnings
+from bs4 import BeautifulSoup
+from bs4 import XMLParsedAsHTMLWarning
+from bs4 import MarkupResemblesLocatorWarning
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
+# Text extraction of the indexer: turns the HTML of a web page into (text, important texts, title)
+# text            -> every string of the page outside script/style/template, stripped and joined by spaces
+#                    (what BeautifulSoup's get_text(separator=" ", strip=True) returns)
+# important texts -> the strings inside the important tags (title, headings, bold), once per important tag
+#                    they're in, so <h1>a <b>b</b></h1> gives ["a", "b", "b"] like find_all() + get_text() of each tag
+# title           -> the strings of the first <title> tag joined by spaces ("" if there is none), which is only
+#                    stored for the results page (see docstore.py), its words are already in the important texts
+# Backends:
+# stream -> a single pass of html.parser events, no tree is built (the default)
+# lxml   -> a single pass of lxml's (libxml2) parser events, the fastest, only if lxml is installed
+#           libxml2 repairs broken markup its own way, so the text of malformed pages can differ slightly
+# soup   -> a full BeautifulSoup tree, walked once for the text and once for the important tags (the reference)
+# The stream backend gives exactly the text of the soup backend (it follows the same events with the same rules),
+# a page it can't follow raises MalformedPage and is extracted with BeautifulSoup instead
+# Imported data structures/functions comments:
+# HTMLParser.feed() -> O(n), where n = # of characters in the page
+# BeautifulSoup() with html.parser -> O(n) time, but O(n) memory for the tree as well
+# find_all() of BeautifulSoup -> O(t), where t = # of tags in the tree (once per call)
+
+STREAM_EXTRACTOR = "stream"
+LXML_EXTRACTOR = "lxml"
+SOUP_EXTRACTOR = "soup"
+EXTRACTORS = (STREAM_EXTRACTOR, LXML_EXTRACTOR, SOUP_EXTRACTOR)
+DEFAULT_EXTRACTOR = STREAM_EXTRACTOR
+
+# Tags whose text gets more weight in the index
+IMPORTANT_TAGS = frozenset(("h1", "h2", "h3", "b", "strong", "title"))
+# Tags whose content isn't text of the page (get_text() of BeautifulSoup skips them too)
+SKIPPED_TAGS = frozenset(("script", "style", "template"))
+# Tags that never have content, so they're never on the stack of open tags
+VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem",
+                       "meta", "param", "source", "spacer", "track", "wbr", "basefont", "bgsound", "command",
+                       "frame", "image", "isindex", "nextid"))
+
+class MalformedPage(Exception):
+    # Raised by a streaming backend when it can't extract a page the same way BeautifulSoup would
+    pass
+
+class TextCollector:
+    # The state shared by the streaming backends: the open tags and the strings collected so far
+    # open_tag()/close_tag() follow the same rules as the tree of BeautifulSoup: a closing tag closes the most
+    # recent open tag of that name (and every tag opened after it), a closing tag with no open tag is ignored
+    # Like in the tree, consecutive pieces of text (EX: split by a character reference) make up one string,
+    # which ends at the next tag, comment or declaration
+
+    def __init__(self) -> None:
+        self.texts = []
+        self.important_texts = []
+        self.open_tags = []
+        # Void tags opened with <tag> rather than <tag/>, a later </tag> of the same name is swallowed
+        # (without ending the current string), like in the html.parser tree builder of BeautifulSoup
+        self.closed_void_tags = []
+        # Pieces of the current string
+        self.data_parts = []
+        # Number of open important tags (and skipped tags) around the current string
+        self.important_depth = 0
+        self.skipped_depth = 0
+        # Strings of the first <title> tag (None until it's opened), and the number of open title tags inside it
+        self.title_parts = None
+        self.title_depth = 0
+
+    def open_tag(self, tag: str, self_closing: bool = False) -> None:
+        self.end_string()
+        if tag in VOID_TAGS:
+            if not self_closing:
+                self.closed_void_tags.append(tag)
+            return
+        self.open_tags.append(tag)
+        if tag == "title":
+            if self.title_parts is None:
+                self.title_parts = []
+                self.title_depth = 1
+            elif self.title_depth != 0:
+                self.title_depth += 1
+        if tag in IMPORTANT_TAGS:
+            self.important_depth += 1
+        elif tag in SKIPPED_TAGS:
+            self.skipped_depth += 1
+
+    def close_tag(self, tag: str) -> None:
+        if tag in self.closed_void_tags:
+            self.closed_void_tags.remove(tag)
+            return
+        self.end_string()
+        # Most of the time the tag closes the most recent open tag, and the stack isn't searched
+        if len(self.open_tags) == 0 or (self.open_tags[-1] != tag and tag not in self.open_tags):
+            return
+        while True:
+            open_tag = self.open_tags.pop()
+            if open_tag == "title" and self.title_depth != 0:
+                self.title_depth -= 1
+            if open_tag in IMPORTANT_TAGS:
+                self.important_depth -= 1
+            elif open_tag in SKIPPED_TAGS:
+                self.skipped_depth -= 1
+            if open_tag == tag:
+                return
+
+    def add_data(self, data: str) -> None:
+        self.data_parts.append(data)
+
+    def end_string(self) -> None:
+        if len(self.data_parts) != 0:
+            data = "".join(self.data_parts)
+            self.data_parts = []
+            if self.skipped_depth == 0:
+                self.add_string(data)
+
+    def add_string(self, data: str) -> None:
+        data = data.strip()
+        if data == "":
+            return
+        self.texts.append(data)
+        if self.title_depth != 0:
+            self.title_parts.append(data)
+        if self.important_depth != 0:
+            # Counted once per important tag, like the text of nested important tags in find_all()
+            self.important_texts.extend([data] * self.important_depth)
+
+    def result(self) -> tuple:
+        self.end_string()
+        return " ".join(self.texts), self.important_texts, " ".join(self.title_parts or ())
+
+class StreamingExtractor(HTMLParser):
+    # html.parser event handler, the same tokenizer BeautifulSoup uses with 'html.parser' but without the tree
+
+    def __init__(self) -> None:
+        # Character references are converted by the parser (the tree of BeautifulSoup converts them too)
+        super().__init__(convert_charrefs=True)
+        self.collector = TextCollector()
+
+    def handle_starttag(self, tag, attrs) -> None:
+        self.collector.open_tag(tag)
+
+    def handle_startendtag(self, tag, attrs) -> None:
+        # A self-closing tag (EX: <b/>) has no text
+        self.collector.open_tag(tag, self_closing=True)
+        self.collector.close_tag(tag)
+
+    def handle_endtag(self, tag) -> None:
+        self.collector.close_tag(tag)
+
+    def handle_data(self, data) -> None:
+        self.collector.add_data(data)
+
+    def handle_comment(self, data) -> None:
+        self.collector.end_string()
+
+    def handle_decl(self, decl) -> None:
+        self.collector.end_string()
+
+    def handle_pi(self, data) -> None:
+        self.collector.end_string()
+
+    def unknown_decl(self, data) -> None:
+        self.collector.end_string()
+        # BeautifulSoup keeps the content of <![CDATA[...]]> sections as text, even inside a skipped tag
+        if data.startswith("CDATA["):
+            self.collector.add_string(data[len("CDATA["):])
+
+class LxmlTarget:
+    # Parser target of lxml: receives the events of libxml2's HTML parser instead of building a tree
+
+    def __init__(self) -> None:
+        self.collector = TextCollector()
+
+    def start(self, tag, attrib) -> None:
+        # Comments and processing instructions are passed as functions, not names
+        if isinstance(tag, str):
+            self.collector.open_tag(tag)
+        else:
+            self.collector.end_string()
+
+    def end(self, tag) -> None:
+        if isinstance(tag, str):
+            self.collector.close_tag(tag)
+        else:
+            self.collector.end_string()
+
+    def data(self, data) -> None:
+        self.collector.add_data(data)
+
+    def comment(self, text) -> None:
+        self.collector.end_string()
+
+    def close(self) -> tuple:
+        return self.collector.result()
+
+def extract_with_soup(content: str) -> tuple:
+    soup = BeautifulSoup(content, 'html.parser')
+    text = soup.get_text(separator=" ", strip=True)
+    important_texts = [tag.get_text(separator=" ", strip=True) for tag in soup.find_all(list(IMPORTANT_TAGS))]
+    title = soup.title.get_text(separator=" ", strip=True) if soup.title is not None else ""
+    return text, important_texts, title
+
+def extract_with_stream(content: str) -> tuple:
+    extractor = StreamingExtractor()
+    try:
+        extractor.feed(content)
+    except Exception as e:
+        raise MalformedPage(str(e))
+    # The parser holds back a tag that isn't closed by the end of the page (EX: "a < b" in the last text),
+    # BeautifulSoup keeps it as raw text
+    if "<" in extractor.rawdata:
+        raise MalformedPage("unterminated tag at the end of the page")
+    extractor.close()
+    return extractor.collector.result()
+
+def extract_with_lxml(content: str) -> tuple:
+    try:
+        return etree.fromstring(content, etree.HTMLParser(target=LxmlTarget()))
+    except Exception as e:
+        # EX: an empty document, or text with an XML encoding declaration
+        raise MalformedPage(str(e))
+
+EXTRACTOR_FUNCTIONS = {STREAM_EXTRACTOR: extract_with_stream, LXML_EXTRACTOR: extract_with_lxml,
+                       SOUP_EXTRACTOR: extract_with_soup}
+
+def available_extractors() -> list:
+    # The lxml backend needs the optional lxml package
+    return [extractor for extractor in EXTRACTORS if extractor != LXML_EXTRACTOR or etree is not None]
+
+def extract_page(content: str, extractor: str = DEFAULT_EXTRACTOR) -> tuple:
+    # Returns (text, important texts, title) of the HTML content with the chosen backend,
+    # falling back to BeautifulSoup for pages the backend can't handle
+    try:
+        return EXTRACTOR_FUNCTIONS[extractor](content)
+    except MalformedPage:
+        return extract_with_soup(content)
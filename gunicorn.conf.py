@@ -0,0 +1,15 @@
+import multiprocessing
+# Production serving mode: gunicorn pre-forks several worker processes, each serving requests on a few threads
+# Run from the project root: gunicorn app:app (this file is picked up automatically)
+
+bind = "127.0.0.1:5000"
+# One worker per core, searching is CPU bound once the index pages are in memory
+workers = multiprocessing.cpu_count()
+# Threads let a worker keep serving while another request waits on a page fault into the index
+worker_class = "gthread"
+threads = 4
+# Import app.py (and so load the index) once in the master process before forking
+# The workers then share the loaded lexicon and the memory-mapped index pages copy-on-write
+# instead of each one loading its own copy
+preload_app = True
+timeout = 30
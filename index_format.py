@@ -0,0 +1,474 @@
+import os
+import math
+import json
+import time
+import zlib
+import struct
+from array import array
+from itertools import accumulate
+# NumPy is optional, without it postings are decoded into arrays from the array module
+try:
+    import numpy as np
+except ImportError:
+    np = None
+# Shared description of the on-disk index layout, used by both the indexer and the retrieval system
+# Imported data structures/functions comments:
+# struct.iter_unpack() -> O(n), where n = # of records in the buffer
+# Decoding n varints -> O(n), vectorized when NumPy is installed
+# zlib.crc32() -> O(n), where n = # of bytes in the buffer
+
+# Paths of the index files, relative to the index directory
+COMPLETE_INDEX = "txt/complete_index.txt"
+DOCUMENT_MAPPING = "txt/document_mapping.txt"
+LEXICON = "bin/lexicon.bin"
+LEXICON_TERMS = "txt/lexicon_terms.txt"
+BINARY_INDEX = "bin/complete_index.bin"
+# Token positions of every term in every doc, only written with inverted_index.py --positions (see encode_positions)
+POSITIONS = "bin/positions.bin"
+POSITIONS_LEXICON = "bin/positions_lexicon.bin"
+# Champion lists: the highest scoring postings of each long posting, tier 1 of top-k queries (binary format only)
+CHAMPIONS = "bin/champions.bin"
+CHAMPIONS_LEXICON = "bin/champions_lexicon.bin"
+# Document store: compressed blocks of <url, title, text> of the docs, located by the offsets file (see docstore.py)
+DOCSTORE = "bin/docstore.bin"
+DOCSTORE_OFFSETS = "bin/docstore_offsets.bin"
+DOCSTORE_INFO = "json/docstore.json"
+# Statistics of every doc (length, length of the important tags, # of distinct terms, norm), see DOC_STATS_RECORD
+DOC_STATS = "bin/doc_stats.bin"
+# Completion index: the words seen while indexing with their stems and dfs, and the ranked completions of the
+# prefixes covering many words (see completions.py)
+COMPLETION_WORDS = "txt/completion_words.txt"
+COMPLETION_DFS = "bin/completion_dfs.bin"
+COMPLETION_PREFIXES = "txt/completion_prefixes.txt"
+COMPLETIONS = "bin/completions.bin"
+# Spelling index: the hashes of the deletes of the completion words, sorted, and the position (in the completion words
+# file) of the word each hash came from (see spelling.py)
+SPELLING_HASHES = "bin/spelling_hashes.bin"
+SPELLING_WORDS = "bin/spelling_words.bin"
+INDEX_INFO = "json/index_info.json"
+STEM_TABLE = "json/stem_table.json"
+# Files describing the segments of the index (only in the top-level index directory)
+SEGMENT_MANIFEST = "json/segments.json"
+TOMBSTONES = "txt/tombstones.txt"
+FILE_STATE = "json/file_state.json"
+# Directory holding the delta (and compacted) segments
+SEGMENTS_DIRECTORY = "segments"
+# A sharded index lists its shards in the shard manifest, each shard is an index directory under the shards directory
+SHARD_MANIFEST = "json/shards.json"
+SHARDS_DIRECTORY = "shards"
+# Every segment (and shard) also has a build manifest: the sizes and checksums of its files (see write_build_manifest)
+BUILD_MANIFEST = "json/build.json"
+# A full build is written to a new directory under the builds directory, and then published by pointing the current
+# symlink at it (the retrieval system opens the build that current points to, or the project root without one)
+BUILDS_DIRECTORY = "builds"
+CURRENT_BUILD = "current"
+
+# Files of a segment that never change once it's published, and so are listed in its build manifest
+# (the segment manifest, tombstones and file state are replaced by every update)
+SEGMENT_FILES = (INDEX_INFO, DOCUMENT_MAPPING, LEXICON, LEXICON_TERMS, COMPLETE_INDEX, BINARY_INDEX, POSITIONS,
+                 POSITIONS_LEXICON, CHAMPIONS, CHAMPIONS_LEXICON, DOCSTORE, DOCSTORE_OFFSETS, DOCSTORE_INFO, DOC_STATS,
+                 COMPLETION_WORDS, COMPLETION_DFS, COMPLETION_PREFIXES, COMPLETIONS, SPELLING_HASHES, SPELLING_WORDS)
+# Version of the layout of the index files, a build manifest with a newer version can't be read by this code
+INDEX_FORMAT_VERSION = 1
+# Bytes read at a time when computing a checksum
+CHECKSUM_CHUNK_SIZE = 1 << 20
+
+# Postings are either stored as text (one "term|{doc_id: score}" JSON line per term) or in the compact binary format
+TEXT_FORMAT = "text"
+BINARY_FORMAT = "binary"
+
+# What the scores in the postings are
+# TF_WEIGHTS -> tf only, the idf is applied at query time (so adding documents doesn't change stored postings)
+# TFIDF_WEIGHTS -> tf-idf, written by indexers before segments existed
+TF_WEIGHTS = "tf"
+TFIDF_WEIGHTS = "tf-idf"
+
+# Extra count of a token for each important tag (title, headings, bold) it's in -> it counts 3 times in total
+IMPORTANT_WEIGHT = 2
+
+# Scores are rounded to 5 decimal places, so storing them as integers in units of 0.00001 loses nothing
+SCORE_SCALE = 100000
+
+# The lexicon is a sorted, fixed-width file with one record per term
+# Record i belongs to the term on line i of the lexicon terms file
+# Each record stores <posting offset, posting length, df, max score>
+# The offset and length locate exactly the bytes of the term's posting in the postings file
+# (the complete index for the text format, the binary index for the binary format)
+# The max score is the highest score in the term's posting, an upper bound used to prune top-k retrieval
+# (with TF_WEIGHTS it's the highest tf, which the retrieval system multiplies by the term's idf)
+LEXICON_RECORD = struct.Struct("<QIId")
+
+# The positions lexicon has one <offset, length> record per term, in the same order as the lexicon
+# Record i locates the positions of term i in the positions file
+POSITIONS_RECORD = struct.Struct("<QI")
+
+# The champions lexicon has one <offset, length> record per term, in the same order as the lexicon
+# Record i locates the champion list of term i in the champions file, a binary posting (without a skip table) of the
+# docs with the highest scores, in doc id order: 1 / CHAMPION_FRACTION of the docs of the posting
+# Only postings of more than CHAMPION_MIN_DF docs get one (so a champion list holds at least CHAMPION_LENGTH docs),
+# the record of any other term has a length of 0 (its posting is short enough to be read in full)
+CHAMPIONS_RECORD = struct.Struct("<QI")
+CHAMPION_LENGTH = 256
+CHAMPION_FRACTION = 4
+CHAMPION_MIN_DF = CHAMPION_FRACTION * CHAMPION_LENGTH
+
+# The document store offsets file has one <offset, length> record per block, in doc id order
+# Record i locates the compressed bytes of block i in the document store
+DOCSTORE_RECORD = struct.Struct("<QI")
+
+# The doc stats file has one fixed-width record per doc, record i belongs to doc first_doc_id + i of the segment
+# Each record stores <# of tokens, # of tokens in important tags (once per tag), # of distinct terms, norm>
+# The norm is the Euclidean length of the doc's vector of tf scores (as stored in the postings), for cosine scoring
+# A removed doc of a compacted segment has a record of zeros
+DOC_STATS_RECORD = struct.Struct("<IIIf")
+
+def tf_denominator(term_count: int) -> float:
+    # The tf of a term in a doc is (1 + log10(count)) / log10(# of distinct terms of the doc)
+    # A doc with a single distinct term would divide by log10(1) == 0, so its tf is just 1 + log10(count)
+    return math.log10(term_count) if term_count > 1 else 1.0
+
+# The completions file has one fixed-width record per line of the completion prefixes file
+# Record i stores the positions (in the completion words file) of the STORED_COMPLETIONS words completing prefix i,
+# most frequent stem first, padded with NO_COMPLETION
+STORED_COMPLETIONS = 32
+NO_COMPLETION = 0xFFFFFFFF
+COMPLETION_RECORD = struct.Struct(f"<{STORED_COMPLETIONS}I")
+
+# Binary postings longer than this many doc ids get a skip table (see encode_binary_posting)
+SKIP_INTERVAL = 128
+
+def write_lexicon_record(lexicon_file, offset: int, length: int, df: int, max_score: float) -> None:
+    lexicon_file.write(LEXICON_RECORD.pack(offset, length, df, max_score))
+
+def read_lexicon(index_dir: str = ".") -> tuple:
+    # Returns the sorted list of terms and four arrays parallel to it (offsets, lengths, dfs, max scores)
+    with open(os.path.join(index_dir, LEXICON_TERMS), "r") as terms_file:
+        terms = terms_file.read().split("\n")
+    # The terms file ends with a newline, so the last split element is empty
+    terms.pop()
+
+    offsets = array("Q")
+    lengths = array("I")
+    dfs = array("I")
+    max_scores = array("d")
+    with open(os.path.join(index_dir, LEXICON), "rb") as lexicon_file:
+        for offset, length, df, max_score in LEXICON_RECORD.iter_unpack(lexicon_file.read()):
+            offsets.append(offset)
+            lengths.append(length)
+            dfs.append(df)
+            max_scores.append(max_score)
+
+    return terms, offsets, lengths, dfs, max_scores
+
+def write_index_info(index_dir: str, info: dict) -> None:
+    with open(os.path.join(index_dir, INDEX_INFO), "w") as info_file:
+        json.dump(info, info_file)
+
+def read_index_info(index_dir: str = ".") -> dict:
+    # Indexes built before index_info.json existed are always in the text format
+    try:
+        with open(os.path.join(index_dir, INDEX_INFO), "r") as info_file:
+            return json.load(info_file)
+    except FileNotFoundError:
+        return {"format": TEXT_FORMAT}
+
+def read_doc_stats(index_dir: str = "."):
+    # Returns four arrays indexed by doc_id - first_doc_id (# of tokens, # of important tokens, # of distinct terms,
+    # norms), or None for a segment written without doc stats
+    try:
+        with open(os.path.join(index_dir, DOC_STATS), "rb") as stats_file:
+            buffer = stats_file.read()
+    except FileNotFoundError:
+        return None
+    if np is not None:
+        records = np.frombuffer(buffer, dtype=np.dtype([("length", "<u4"), ("important_length", "<u4"),
+                                                          ("term_count", "<u4"), ("norm", "<f4")]))
+        return records["length"], records["important_length"], records["term_count"], records["norm"]
+    columns = (array("I"), array("I"), array("I"), array("f"))
+    for record in DOC_STATS_RECORD.iter_unpack(buffer):
+        for column, value in zip(columns, record):
+            column.append(value)
+    return columns
+
+def read_manifest(index_dir: str = ".") -> dict:
+    # The manifest lists the segments of the index: the base segment first, then the delta segments in the order
+    # they were added (each segment holds a contiguous range of doc ids, higher than the previous segment's)
+    # Indexes built before segments existed are a single base segment in the index directory itself
+    try:
+        with open(os.path.join(index_dir, SEGMENT_MANIFEST), "r") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return {"base": ".", "deltas": [], "next_doc_id": None, "next_segment": 1}
+
+def write_manifest(index_dir: str, manifest: dict) -> None:
+    # Written to a temporary file first and then renamed over the old manifest, so that a reader sees either
+    # the old or the new list of segments, never a partially written one
+    temp_file_name = os.path.join(index_dir, SEGMENT_MANIFEST + ".tmp")
+    with open(temp_file_name, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(temp_file_name, os.path.join(index_dir, SEGMENT_MANIFEST))
+
+def read_shard_manifest(index_dir: str = ".") -> dict:
+    # Returns {"shards": [shard directories, in doc id order], "doc_count": number of documents in all shards}
+    # or None if the index isn't sharded
+    try:
+        with open(os.path.join(index_dir, SHARD_MANIFEST), "r") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+def read_tombstones(index_dir: str = ".") -> set:
+    # Doc ids of documents that were removed or replaced since their segment was written
+    try:
+        with open(os.path.join(index_dir, TOMBSTONES), "r") as tombstone_file:
+            return {int(line) for line in tombstone_file if line.strip() != ""}
+    except FileNotFoundError:
+        return set()
+
+def add_tombstones(index_dir: str, doc_ids: list) -> None:
+    with open(os.path.join(index_dir, TOMBSTONES), "a") as tombstone_file:
+        for doc_id in doc_ids:
+            tombstone_file.write(f"{doc_id}\n")
+
+def index_signature(index_dir: str = ".") -> tuple:
+    # Identifies the current version of the index files by their sizes and modification times
+    # If a rebuild (or an incremental update) touches any of them, the signature changes
+    signature = []
+    for file_name in (INDEX_INFO, LEXICON, LEXICON_TERMS, DOCUMENT_MAPPING, COMPLETE_INDEX, BINARY_INDEX,
+                      SEGMENT_MANIFEST, TOMBSTONES, SHARD_MANIFEST):
+        try:
+            file_stat = os.stat(os.path.join(index_dir, file_name))
+            signature.append((file_name, file_stat.st_size, file_stat.st_mtime_ns))
+        except FileNotFoundError:
+            continue
+    return tuple(signature)
+
+class IndexIntegrityError(Exception):
+    # Raised when the files of a segment don't match its build manifest (EX: a partially rebuilt or copied index)
+    pass
+
+def current_build_dir(index_dir: str = ".") -> str:
+    # Returns the directory of the published build (where the current symlink points), or index_dir itself if it
+    # has none (EX: an index built before builds were published, or by benchmarks.bench_index)
+    current_dir = os.path.join(index_dir, CURRENT_BUILD)
+    if os.path.isdir(current_dir):
+        return os.path.realpath(current_dir)
+    return index_dir
+
+def file_checksum(file_name: str) -> int:
+    # CRC-32 of the whole file, read a chunk at a time
+    checksum = 0
+    with open(file_name, "rb") as checked_file:
+        for chunk in iter(lambda: checked_file.read(CHECKSUM_CHUNK_SIZE), b""):
+            checksum = zlib.crc32(chunk, checksum)
+    return checksum
+
+def write_build_manifest(index_dir: str) -> None:
+    # Records the format version, document and term counts, and the size and checksum of every file of a finished
+    # segment (or shard, or the files that a sharded index keeps in its own directory)
+    # Written to a temporary file first and then renamed, like the segment manifest
+    info = read_index_info(index_dir)
+    files = dict()
+    for file_name in SEGMENT_FILES:
+        path = os.path.join(index_dir, file_name)
+        if os.path.exists(path):
+            files[file_name] = {"size": os.path.getsize(path), "crc32": file_checksum(path)}
+    manifest = {"format_version": INDEX_FORMAT_VERSION, "created": time.time(), "doc_count": info.get("doc_count"),
+                "term_count": info.get("term_count"), "files": files}
+    temp_file_name = os.path.join(index_dir, BUILD_MANIFEST + ".tmp")
+    with open(temp_file_name, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(temp_file_name, os.path.join(index_dir, BUILD_MANIFEST))
+
+def read_build_manifest(index_dir: str = "."):
+    # Returns the build manifest of a segment, or None if it has none (EX: a segment written before they existed)
+    try:
+        with open(os.path.join(index_dir, BUILD_MANIFEST), "r") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+def check_build_manifest(index_dir: str, manifest: dict, checksums: bool = False) -> None:
+    # Raises IndexIntegrityError if the files of the segment don't match its build manifest
+    # Without checksums only the file sizes are compared (a stat per file, cheap enough for every startup),
+    # which catches files from different builds since the offsets of one point past the end (or the middle) of another
+    if manifest["format_version"] > INDEX_FORMAT_VERSION:
+        raise IndexIntegrityError(f"{index_dir} has index format version {manifest['format_version']}, "
+                                  f"this code reads up to version {INDEX_FORMAT_VERSION}")
+    for file_name, expected in manifest["files"].items():
+        path = os.path.join(index_dir, file_name)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            raise IndexIntegrityError(f"{path} is listed in the build manifest but missing")
+        if size != expected["size"]:
+            raise IndexIntegrityError(f"{path} has {size} bytes, the build manifest expects {expected['size']}")
+        if checksums and file_checksum(path) != expected["crc32"]:
+            raise IndexIntegrityError(f"{path} doesn't match the checksum in the build manifest")
+
+def verify_index(index_dir: str = ".") -> list:
+    # Checks every segment (or every shard) of an index against its build manifest, raising IndexIntegrityError
+    # at the first mismatch
+    # Returns the directories that were checked, those without a build manifest can't be verified
+    shard_manifest = read_shard_manifest(index_dir)
+    if shard_manifest is not None:
+        segment_dirs = ["."] + shard_manifest["shards"]
+    else:
+        manifest = read_manifest(index_dir)
+        segment_dirs = [manifest["base"]] + manifest["deltas"]
+    verified_dirs = []
+    for segment_dir in segment_dirs:
+        segment_dir = os.path.normpath(os.path.join(index_dir, segment_dir))
+        build_manifest = read_build_manifest(segment_dir)
+        if build_manifest is not None:
+            check_build_manifest(segment_dir, build_manifest, checksums=True)
+            verified_dirs.append(segment_dir)
+    return verified_dirs
+
+def postings_file(index_format: str) -> str:
+    # Returns the file that the lexicon offsets point into
+    return BINARY_INDEX if index_format == BINARY_FORMAT else COMPLETE_INDEX
+
+def encode_varints(values) -> bytes:
+    # Each integer is split into 7-bit groups, lowest group first
+    # The high bit of a byte is set when more groups of the same integer follow
+    # EX: 300 = 0b10_0101100 -> [0b1_0101100, 0b0_0000010] -> b"\xac\x02"
+    encoded = bytearray()
+    for value in values:
+        while value >= 0x80:
+            encoded.append((value & 0x7F) | 0x80)
+            value >>= 7
+        encoded.append(value)
+    return bytes(encoded)
+
+def decode_varints(buffer):
+    # Decodes every varint in the buffer, returns a NumPy uint64 array (or an array of unsigned longs)
+    if np is not None:
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        if len(data) == 0:
+            return np.zeros(0, dtype=np.uint64)
+        # A byte without the high bit set is the last byte of its integer
+        ends = np.flatnonzero(data < 0x80)
+        starts = np.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+        # Shift every 7-bit group into place, then add up the groups of each integer
+        # (the groups never overlap, so adding them is the same as OR-ing them)
+        group = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+        shifted = (data & 0x7F).astype(np.uint64) << (group * 7).astype(np.uint64)
+        return np.add.reduceat(shifted, starts)
+
+    values = array("Q")
+    value = 0
+    shift = 0
+    for byte in buffer:
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            values.append(value)
+            value = 0
+            shift = 0
+        else:
+            shift += 7
+    return values
+
+def read_varint(buffer, pos: int) -> tuple:
+    # Decodes the single varint starting at buffer[pos], returns it and the position right after it
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def skip_block_count(count: int, skip_interval: int) -> int:
+    # Number of blocks in the skip table of a posting with count doc ids (0 = the posting has no skip table)
+    if skip_interval == 0 or count <= skip_interval:
+        return 0
+    return math.ceil(count / skip_interval)
+
+def encode_binary_posting(doc_ids: list, scores: list, skip_interval: int = 0) -> bytes:
+    # Layout: <number of postings> <doc id gaps...> <quantized scores...>, every number is a varint
+    # Doc ids are sorted, so storing the gap to the previous doc id keeps the numbers (and varints) small
+    # EX: doc_ids = [3, 7, 8, 20] -> gaps = [3, 4, 1, 12]
+    gaps = [doc_id - prev for prev, doc_id in zip([0] + doc_ids, doc_ids)]
+    quantized = [round(score * SCORE_SCALE) for score in scores]
+    if skip_interval == 0:
+        return encode_varints([len(doc_ids)]) + encode_varints(gaps) + encode_varints(quantized)
+
+    # With a skip interval: <number of postings> <skip table length in bytes> <skip table> <gaps...> <scores...>
+    # Postings longer than the interval are split into blocks of skip_interval doc ids, and the skip table stores
+    # <last doc id - last doc id of the previous block, bytes of the block's gaps, bytes of the block's scores>
+    # for every block -> a reader can jump straight to the block that may hold a doc id and decode only that block
+    # (the gaps and scores are still written one after the other, so the whole posting decodes in one pass too)
+    block_count = skip_block_count(len(doc_ids), skip_interval)
+    if block_count == 0:
+        return encode_varints([len(doc_ids), 0]) + encode_varints(gaps) + encode_varints(quantized)
+    entries = []
+    gap_blocks = []
+    score_blocks = []
+    previous_last_doc_id = 0
+    for start in range(0, len(doc_ids), skip_interval):
+        end = min(start + skip_interval, len(doc_ids))
+        gap_blocks.append(encode_varints(gaps[start:end]))
+        score_blocks.append(encode_varints(quantized[start:end]))
+        entries.extend((doc_ids[end - 1] - previous_last_doc_id, len(gap_blocks[-1]), len(score_blocks[-1])))
+        previous_last_doc_id = doc_ids[end - 1]
+    skip_table = encode_varints(entries)
+    return (encode_varints([len(doc_ids), len(skip_table)]) + skip_table + b"".join(gap_blocks) +
+            b"".join(score_blocks))
+
+def decode_binary_posting(buffer, skip_interval: int = 0) -> tuple:
+    # Returns the posting as two parallel arrays (doc ids sorted ascending, scores)
+    # skip_interval is the one the posting was written with (0 for indexes written before skip tables existed)
+    values = decode_varints(buffer)
+    count = int(values[0])
+    start = 1
+    if skip_interval != 0:
+        # Jump over the skip table length and the 3 numbers per block of the skip table
+        start = 2 + 3 * skip_block_count(count, skip_interval)
+    if np is not None:
+        doc_ids = np.cumsum(values[start:start + count]).astype(np.int64)
+        scores = values[start + count:].astype(np.float64) / SCORE_SCALE
+        return doc_ids, scores
+    doc_ids = array("q", accumulate(values[start:start + count]))
+    scores = array("d", [value / SCORE_SCALE for value in values[start + count:]])
+    return doc_ids, scores
+
+def encode_positions(positions: list) -> bytes:
+    # Encodes the token positions of one term, positions[i] being the sorted positions in the i-th doc of its posting
+    # Layout: <number of docs> <length table size in bytes> <length table> <position gaps of each doc...>, all varints
+    # The gaps restart at every doc, and the length table holds the byte length of each doc's gaps, so a phrase query
+    # only decodes the positions of the docs it checks, EX: [[4, 9], [0]] -> gaps [4, 5] [0] -> length table [2, 1]
+    doc_gaps = [encode_varints(position - prev for prev, position in zip([0] + doc_positions, doc_positions))
+                for doc_positions in positions]
+    length_table = encode_varints(len(gaps) for gaps in doc_gaps)
+    return encode_varints([len(positions), len(length_table)]) + length_table + b"".join(doc_gaps)
+
+def decode_positions(buffer, doc_indexes=None) -> list:
+    # Returns the positions in the docs at the given indexes of the term's posting (a list of lists)
+    # or in every doc of the posting if doc_indexes is None
+    doc_count, pos = read_varint(buffer, 0)
+    table_length, pos = read_varint(buffer, pos)
+    # ends[i] = byte position right after the gaps of the i-th doc
+    ends = list(accumulate(decode_varints(buffer[pos:pos + table_length]).tolist(), initial=pos + table_length))
+    if doc_indexes is None:
+        doc_indexes = range(doc_count)
+    return [list(accumulate(decode_varints(buffer[ends[i]:ends[i + 1]]).tolist())) for i in doc_indexes]
+
+def encode_text_posting(doc_ids: list, scores: list, df: int) -> bytes:
+    # The document frequency is stored w/h doc id 0 (there's no document w/h id 0)
+    posting = {0: df}
+    posting.update(zip(doc_ids, scores))
+    return json.dumps(posting).encode("utf-8")
+
+def decode_text_posting(posting: dict) -> tuple:
+    # Converts a parsed {"doc_id": score} JSON posting into the same parallel arrays as the binary format
+    # The writer stores doc ids in ascending order, so the keys come out sorted
+    doc_ids = array("q", [int(doc_id) for doc_id in posting if doc_id != "0"])
+    scores = array("d", [score for doc_id, score in posting.items() if doc_id != "0"])
+    if np is not None:
+        return np.frombuffer(doc_ids, dtype=np.int64), np.frombuffer(scores, dtype=np.float64)
+    return doc_ids, scores
@@ -1,193 +1,469 @@
 from pathlib import Path
 import os
+import sys
+import time
+import argparse
 import math
 import json
+import shutil
 import hashlib
-from nltk.stem import PorterStemmer
-from nltk.tokenize import RegexpTokenizer
+import itertools
+import functools
+import multiprocessing
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
-from sortedcontainers import SortedDict
 import heapq
-from bs4 import BeautifulSoup
-import warnings
-from bs4 import XMLParsedAsHTMLWarning
-from bs4 import MarkupResemblesLocatorWarning
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
-warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
+from index_format import (COMPLETE_INDEX, DOCUMENT_MAPPING, LEXICON, LEXICON_TERMS, POSITIONS, POSITIONS_LEXICON,
+                          POSITIONS_RECORD, CHAMPIONS, CHAMPIONS_LEXICON, CHAMPIONS_RECORD, CHAMPION_FRACTION,
+                          CHAMPION_MIN_DF, DOC_STATS, DOC_STATS_RECORD, IMPORTANT_WEIGHT, TEXT_FORMAT, BINARY_FORMAT,
+                          TF_WEIGHTS, TFIDF_WEIGHTS, SKIP_INTERVAL,
+                          TOMBSTONES, FILE_STATE, SEGMENTS_DIRECTORY, SHARD_MANIFEST, SHARDS_DIRECTORY, STEM_TABLE,
+                          BUILDS_DIRECTORY, CURRENT_BUILD, IndexIntegrityError, current_build_dir,
+                          write_build_manifest, verify_index,
+                          write_lexicon_record, write_index_info, read_index_info, read_manifest, write_manifest,
+                          read_shard_manifest, read_tombstones, add_tombstones, read_lexicon, postings_file,
+                          encode_text_posting, tf_denominator,
+                          encode_binary_posting, encode_positions)
+from segments import open_segments, concatenate_postings, removed_doc_id_lookup, remove_doc_ids
+from extraction import DEFAULT_EXTRACTOR, EXTRACTORS, LXML_EXTRACTOR, available_extractors, extract_page
+from near_duplicates import MAX_THRESHOLD, NearDuplicateIndex, simhash
+from docstore import STORED_TEXT_LENGTH, DocumentStoreWriter
+from completions import seen_words, record_words, indexed_words, open_completion_index, write_completion_index
+from spelling import write_spelling_index
+from text_processing import (tokenize, stem_tokens, compute_word_frequencies, stem_cache, save_stem_table,
+                             load_stem_table)
 # Imported data structures/functions comments:
-# stem() method of PorterStemmer -> O(m * n), m = # of words, n = # avg length of words
-# tokenize() method from RegexpTokenizer -> O(n), where n = # of characters in input string
+# extract_page() from extraction -> O(n), where n = # of characters in the page
+# simhash() from near_duplicates -> O(t), where t = # of distinct terms in the page
+# NearDuplicateIndex.find() -> O(b + c), where b = # of bands and c = # of fingerprints sharing a band with the page
+# DocumentStoreWriter.add() -> O(n), where n = # of characters stored for the page (compressed once per block)
+# stem_tokens() from text_processing -> O(m * n), m = # of words, n = # avg length of words (O(m) on cache hits)
+# tokenize() from text_processing -> O(n), where n = # of characters in input string
 # defaultdict has the same time complexity as the built in dict() from Python
-# Insertion into SortedDict -> O(log n), where n = # of key-value pairs
 # Insertion into/popping from heapq -> O(log n), where n = # of elements in the min-heap
+# heapq.merge() of k sorted iterables -> O(n log k), where n = # of elements in all iterables
+# Appending to array -> O(1) amortized, sys.getsizeof() of an array -> O(1)
+
+# Directory holding one folder per domain, each with one JSON file per web page
+CORPUS_DIRECTORY = "developer/DEV"
+
+# The thresholds and the counters below are module-level, so the benchmarks can import and drive the indexer
+# Memory (in MB) the in-memory partial index may take before it's written to a partial index file
+MEMORY_BUDGET_MB = 256
+NUMBER_OF_DOCS_THRESHOLD = 10000
+# Number of web pages sent to a worker process at a time
+PAGES_PER_TASK = 16
+# An incremental update compacts the segments once there are more delta segments than this
+MAX_DELTA_SEGMENTS = 8
+
+# The partial index stores each tf (rounded to 5 decimals) as an integer number of 1/TF_SCALE
+TF_SCALE = 100000
+
+# Initialize a tracker for the number of partial index files
+partial_index_count = 0
+# Initialize a tracker of the number of indexed documents
+indexed_doc_count = 0
+# Initialize a tracker for the number of unique terms
+unique_term_count = 0
+# Initialize trackers for the <term, doc> pairs of the indexed documents, the documents dropped as
+# near-duplicates and the <term, doc> pairs they would have added
+indexed_posting_count = 0
+near_duplicate_count = 0
+near_duplicate_posting_count = 0
 
 def set_up_files():
     json_directory = Path("json")
     txt_directory = Path("txt")
+    bin_directory = Path("bin")
     
-    # Creates the json and txt directory if not already created
+    # Creates the json, txt and bin directory if not already created
     json_directory.mkdir(parents=True, exist_ok=True)
     txt_directory.mkdir(parents=True, exist_ok=True)
+    bin_directory.mkdir(parents=True, exist_ok=True)
 
     # Creates/resets txt files (removes previous writes)
+    # The complete index and lexicon files are reset by the IndexWriter when merging starts
     with open("txt/log.txt", "w") as log_file:
         log_file.write("")
-    
-    with open("txt/complete_index.txt", "w") as index_file:
-       index_file.write("")
 
-    with open("txt/term_offsets.txt", "w") as offset_file:
-       offset_file.write("")
+    # A full build replaces every segment, so the delta segments and tombstones of earlier updates are removed
+    # (as well as the shards of an earlier sharded build)
+    shutil.rmtree(SEGMENTS_DIRECTORY, ignore_errors=True)
+    shutil.rmtree(SHARDS_DIRECTORY, ignore_errors=True)
+    if os.path.exists(SHARD_MANIFEST):
+        os.remove(SHARD_MANIFEST)
+    with open(TOMBSTONES, "w") as tombstone_file:
+        tombstone_file.write("")
+
+def set_up_segment(segment_dir: str) -> None:
+    # A segment has the same json, txt and bin directories as the index directory
+    for directory in ("json", "txt", "bin"):
+        Path(segment_dir, directory).mkdir(parents=True, exist_ok=True)
 
-def creating_partial_indexes() -> None:
+def creating_partial_indexes(web_pages: dict, workers: int = 1, index_dir: str = ".", seen_hashes: set = None,
+                             positions: bool = False, extractor: str = DEFAULT_EXTRACTOR,
+                             near_duplicates: NearDuplicateIndex = None,
+                             memory_budget: float = MEMORY_BUDGET_MB) -> dict:
     # Inverted index consists of <term, posting> pairs
-    # In partial indexes, posting will consist of <docId, tf> pairs
-    # In complete index, posting will consist of <docId, tf-idf> pairs
+    # Posting will consist of <docId, tf> pairs (the idf is applied by the retrieval system)
     # Example structure of inverted index:
     # {
-    # "anteater": {1: 4.34393, 45: 1.32323},
-    # "bear": {32: 2.23423, 2: 1.32322}
+    # "anteater": {1: 0.54393, 45: 0.32323},
+    # "bear": {32: 0.23423, 2: 0.32322}
     # }
-    # EX: In above index, anteater is given score 4.34393 in doc 1 and score 1.32323 time in doc 45.
-    partial_index = defaultdict(dict)
+    # EX: In above index, anteater is given tf 0.54393 in doc 1 and tf 0.32323 in doc 45.
+    # web_pages maps the path of each page to its modification time, the state of each page is returned
+    # With positions, the token positions of every term are recorded as well (for phrase queries)
+    # extractor is the backend that gets the text out of the HTML (see extraction.py)
+    # With a near-duplicate index, pages too similar to an indexed page are dropped (see near_duplicates.py)
+    # The url, title and text of the indexed pages are written to the document store of index_dir (see docstore.py)
+    # and their lengths and norms to its doc stats (see DOC_STATS_RECORD)
+    # A partial index file is written every time the partial index in memory reaches memory_budget MB
+    # Warm up the stem cache with the stem table of a previous build (if there is one)
+    load_stem_table()
+
+    # Parsing, tokenizing and stemming (process_web_page) is the expensive part of indexing
+    # With more than 1 worker, it's spread over a process pool
+    # imap hands the results back in the same order as web_pages, so this process still assigns the doc ids
+    # and checks for duplicates in a fixed order -> the index is identical no matter how many workers are used
+    process = functools.partial(process_web_page, record_positions=positions, extractor=extractor,
+                                fingerprint=near_duplicates is not None)
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=load_stem_table) as pool:
+            return index_web_pages(web_pages, pool.imap(process, web_pages, chunksize=PAGES_PER_TASK),
+                                   index_dir, seen_hashes, positions, near_duplicates, memory_budget)
+    else:
+        return index_web_pages(web_pages, map(process, web_pages), index_dir, seen_hashes, positions,
+                               near_duplicates, memory_budget)
+
+def list_web_pages(corpus_dir: str = CORPUS_DIRECTORY) -> list:
+    # Returns the paths of the JSON files of every web page in the corpus folder (developer/DEV by default)
+    # The domain folders and the pages inside them are sorted, so doc ids are the same on every run
+    dir_path = Path(corpus_dir)
+    web_pages = []
+    for dir in sorted(dir_path.iterdir()):
+        for file in sorted(dir.iterdir()):
+            web_pages.append(str(file))
+    return web_pages
+
+def stat_web_pages(web_pages: list) -> dict:
+    # Maps the path of each web page to its modification time (in ns), in the same order as web_pages
+    # The time is taken before the page is parsed, so a page modified while indexing is picked up by the next update
+    return {web_page: os.stat(web_page).st_mtime_ns for web_page in web_pages}
+
+def process_web_page(web_page_file_path: str, record_positions: bool = False,
+                     extractor: str = DEFAULT_EXTRACTOR, fingerprint: bool = False):
+    # Parses one web page, returns (url, title, start of the page text, hash of the page text, SimHash fingerprint,
+    # token dictionary, number of tokens, token positions, stems newly cached by this process, <word, stem> pairs of
+    # the words this process sees for the first time)
+    # Only the part of the text kept by the document store is returned, the rest isn't sent back by the workers
+    # The token positions are <term, positions of the term in the page text> pairs, or None if not record_positions
+    # The fingerprint is None if not fingerprint, or if the page has too few terms to be fingerprinted
+    # Returns None if the page can't be read or has no text content
+    # This runs inside the worker processes, so it must not touch any global state (besides the caches of the
+    # process, whose new entries are sent back to the main process)
+    # If encoding error is encountered, the error is caught and program moves onto next file
+    try:
+        # Open the JSON file representing the web page
+        with open(web_page_file_path, 'r', encoding='utf-8') as webfile:
+            # Parse the JSON file into a dictionary called file_content
+            file_content = json.load(webfile)
+        # Access the content part of the dictionary and extract its text in a single pass over the HTML,
+        # along with the text of the important tags (title, headings, bold) and the title
+        text_content, important_texts, title = extract_page(file_content['content'], extractor)
+
+        # Check for no content
+        if text_content == "":
+            return None
+
+        # Get a list of all tokens from the text (token = alphanumeric sequence), stemmed with Porter Stemmer
+        # (memoized by the stem cache)
+        tokens = tokenize(text_content)
+        stemmed_tokens = stem_tokens(tokens)
+        # The words of the page for the completion index (only those this process hasn't seen yet are sent back)
+        new_words = dict()
+        record_words(tokens, new_words)
+        # Get a dictionary of <term, freq> pairs for that web page
+        token_dict = compute_word_frequencies(stemmed_tokens)
+        if len(token_dict) != 0:
+            # Add weight to the text inside the important tags in the token dictionary
+            token_dict = add_weights(important_texts, token_dict, new_words)
+        term_positions = get_term_positions(stemmed_tokens) if record_positions else None
+        # The fingerprint is computed here rather than in the main process, so it's spread over the workers
+        page_fingerprint = simhash(token_dict) if fingerprint else None
+
+        return (file_content['url'], title, text_content[:STORED_TEXT_LENGTH], hash_content(text_content),
+                page_fingerprint, token_dict, len(stemmed_tokens), term_positions, stem_cache.take_new_stems(),
+                new_words)
+    except Exception as e:
+        return None
+
+def index_web_pages(web_pages: dict, processed_pages, index_dir: str = ".", seen_hashes: set = None,
+                    positions: bool = False, near_duplicates: NearDuplicateIndex = None,
+                    memory_budget: float = MEMORY_BUDGET_MB) -> dict:
+    # Adds the processed pages (in order) to the partial indexes and the doc map
+    # Returns the state of each page: <path, {"mtime": modification time, "doc_id": doc id, "hash": content hash,
+    # "simhash": SimHash fingerprint}>
+    # (doc id is None for pages that weren't indexed, hash is None for pages without text content,
+    # simhash is None for pages that weren't fingerprinted)
+    # The partial index (and the token positions) of the documents since the last partial index file
+    partial_index = PartialIndex(positions)
+    memory_budget_bytes = memory_budget * 2**20
     # Initialize a mapping of doc IDs to urls
     doc_map = dict()
+    file_state = dict()
     # Initialize a set to store hashes of page content for duplicate detection
-    seen_hashes = set()
+    # This set lives in the main process only, so duplicates are detected across all workers
+    # An incremental update starts with the hashes of the pages that are already indexed
+    if seen_hashes is None:
+        seen_hashes = set()
     # Declare these as global, since they will be modified in this function
     global indexed_doc_count
     global partial_index_count
+    global indexed_posting_count
+    global near_duplicate_count
+    global near_duplicate_posting_count
+    # The docs of this run continue the doc ids of the earlier segments
+    docstore_writer = DocumentStoreWriter(index_dir, indexed_doc_count + 1)
+    doc_stats_file = open(os.path.join(index_dir, DOC_STATS), "wb")
 
-    # Get the DEV folder
-    dir_path = Path('developer/DEV')
-    # Iterate through the domain folders in DEV
-    for dir in dir_path.iterdir():
-        # Iterate through the individual web pages inside each domain
-        for file in dir.iterdir():
-            # Open the JSON file representing the web page
-            # If encoding error is encountered, the error is caught and program moves onto next file
-            try:
-                web_page_file_path = 'developer/DEV/'+ dir.name + "/" + file.name
-                with open(web_page_file_path, 'r', encoding='utf-8') as webfile:
-                    # Parse the JSON file into a dictionary called file_content
-                    file_content = json.load(webfile)
-                    # Access the content part of the dictionary and parse it using BeautifulSoup
-                    soup = BeautifulSoup(file_content['content'], 'html.parser')
-                    # Extract only the text content from the web page
-                    text_content = soup.get_text(separator=" ", strip=True)
-
-                    # Check for no content and duplicate pages
-                    if text_content != "" and not is_duplicate(text_content, seen_hashes):
-                        # Get a dictionary of <term, freq> pairs for that web page
-                        token_dict = get_token_dict(text_content)
-
-                        # Check if the page has valid tokens (if token dictionary length > 0)
-                        # If not, do not add document to doc map or partial index 
-                        if len(token_dict) != 0:
-                            # Get important tags
-                            # Add weight to the text inside those tags in the token dictionary
-                            important_tags = soup.find_all(['h1', 'h2', 'h3', 'b', 'strong', 'title'])
-                            token_dict = add_weights(important_tags, token_dict)
-
-                            # Increment the count for the number of indexed documents
-                            indexed_doc_count += 1
-
-                            # Add a <docId, url> pair to the doc_map
-                            doc_map[indexed_doc_count] = file_content['url']
-
-                            # Add to the partial index stored in memory
-                            add_to_index(indexed_doc_count, token_dict, partial_index)
-                        
-                    # Periodically save the partial index to a file if threshold met 
-                    if (len(partial_index) >= NUMBER_OF_TERMS_THRESHOLD):
-                        write_partial_index(partial_index)
-                        # Empty the partial index in memory
-                        partial_index.clear()    
-            except Exception as e:
-                continue
+    for web_page, processed_page in zip(web_pages, processed_pages):
+        # Save the partial index to a file once the memory budget is met
+        # (checked before each page, so that every page reaches it, even the ones that are skipped below)
+        if partial_index.byte_size() >= memory_budget_bytes:
+            write_partial_index(partial_index, index_dir, memory_budget)
+            # Empty the partial index in memory
+            partial_index.clear()
+
+        file_state[web_page] = {"mtime": web_pages[web_page], "doc_id": None, "hash": None, "simhash": None}
+        try:
+            if processed_page is not None:
+                (url, title, text, page_hash, fingerprint, token_dict, token_count, term_positions,
+                 new_stems, new_words) = processed_page
+                file_state[web_page]["hash"] = page_hash
+                file_state[web_page]["simhash"] = fingerprint
+                # Collect the stems cached by the worker processes, so the stem table covers the whole corpus
+                stem_cache.update(new_stems)
+                # Same for the words of the completion index, which must cover every word of the corpus
+                seen_words.update(new_words)
+
+                # Check for duplicate pages
+                # Check if the page has valid tokens (if token dictionary length > 0)
+                # If not, do not add document to doc map or partial index
+                if not is_duplicate(page_hash, seen_hashes) and len(token_dict) != 0:
+                    # Check for near-duplicates of the pages indexed so far
+                    # A near-duplicate is dropped like a duplicate, and the <term, doc> pairs it would have added
+                    # are counted for the log
+                    original = find_near_duplicate(fingerprint, near_duplicates)
+                    if original is not None:
+                        near_duplicate_count += 1
+                        near_duplicate_posting_count += len(token_dict)
+                        write_log_file(f"Near-duplicate dropped: {url} ({original[1]} bits from document "
+                                       f"{original[0]})")
+                        continue
+
+                    # Score the terms of the doc before it gets a doc id, so that the doc map, the document store,
+                    # the partial index and the doc stats get the doc together (or not at all)
+                    tf_scores, norm = score_document(token_dict)
+
+                    # Increment the count for the number of indexed documents
+                    indexed_doc_count += 1
+                    indexed_posting_count += len(token_dict)
+
+                    # Add a <docId, url> pair to the doc_map, and the doc to the document store
+                    doc_map[indexed_doc_count] = url
+                    docstore_writer.add(indexed_doc_count, url, title, text)
+
+                    # Add to the partial index stored in memory
+                    partial_index.add_document(indexed_doc_count, tf_scores, term_positions)
+                    # Every important token was counted IMPORTANT_WEIGHT more times per important tag
+                    important_token_count = (sum(token_dict.values()) - token_count) // IMPORTANT_WEIGHT
+                    doc_stats_file.write(DOC_STATS_RECORD.pack(token_count, important_token_count, len(token_dict),
+                                                               norm))
+                    file_state[web_page]["doc_id"] = indexed_doc_count
+                    if near_duplicates is not None and fingerprint is not None:
+                        near_duplicates.add(fingerprint, indexed_doc_count)
+        except Exception as e:
+            continue
     
     # If partial index isn't empty, save it and the doc_map to a file
     # This is for the case where let's say we are creating a new partial index every 10 webpages
     # If we hit 5 web pages and there's no more files to parse, partial index is never saved to a file b/c...
     # The threshold of 10 web pages wasn't hit. This takes care of that case
     if len(partial_index) != 0:
-        write_partial_index(partial_index)
+        write_partial_index(partial_index, index_dir, memory_budget)
         partial_index.clear()
     
     # Write the doc map to a file
-    write_document_mapping(doc_map)
+    write_document_mapping(doc_map, index_dir)
     doc_map.clear()
+    docstore_writer.close()
+    doc_stats_file.close()
+    return file_state
 
-def is_duplicate(content: str, seen_hashes: set):
+def hash_content(content: str) -> str:
     # Assigns a hash to a content string
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+def is_duplicate(hashed_page: str, seen_hashes: set):
     # If hash has been seen before --> duplicate detected --> Returns True
-    hashed_page = hashlib.md5(content.encode('utf-8')).hexdigest()
     if hashed_page in seen_hashes:
         return True
     else:
         seen_hashes.add(hashed_page)
         return False
 
-def get_token_dict(content: str) -> defaultdict:
-    # Get a list of all tokens from a content string (token = alphanumeric sequence)
-    tokens = tokenizer.tokenize(content)
-    # Use Porter Stemmer for stemming
-    stemmed_tokens = [porter_stemmer.stem(token) for token in tokens]
-    # Call compute_word_frequencies to get dictionary of <token, frequency> pairs
-    return compute_word_frequencies(stemmed_tokens)
-
-def compute_word_frequencies(tokens: list) -> defaultdict:
-    # Returns a dictionary that maps the tokens in the list to the number of their occurrences
-    word_count = defaultdict(int)
-    for t in tokens:
-        word_count[t] += 1
-    return word_count
-
-def add_weights(important_tags, token_dict: defaultdict) -> defaultdict:
+def find_near_duplicate(fingerprint, near_duplicates: NearDuplicateIndex):
+    # Returns (doc id, distance in bits) of an indexed page the page is a near-duplicate of, or None
+    # Without a near-duplicate index (or a fingerprint, for pages with too few terms) nothing is a near-duplicate
+    if near_duplicates is None or fingerprint is None:
+        return None
+    return near_duplicates.find(fingerprint)
+
+def log_near_duplicates(index_size_kb: float) -> None:
+    # The postings of the dropped pages were never written, so the space they would have taken is estimated
+    # from the average size of a <term, doc> pair in the index
+    saved_kb = index_size_kb * near_duplicate_posting_count / indexed_posting_count if indexed_posting_count else 0
+    write_log_file(f"Near-duplicate documents dropped: {near_duplicate_count} "
+                   f"({near_duplicate_posting_count} <term, doc> pairs, about {saved_kb:.0f} KB of postings saved)")
+
+def get_term_positions(stemmed_tokens: list) -> defaultdict:
+    # Returns <term, positions> pairs, the positions being the indexes of the term in the page's list of tokens
+    # EX: ["to", "be", "or", "not", "to", "be"] -> {"to": [0, 4], "be": [1, 5], "or": [2], "not": [3]}
+    term_positions = defaultdict(list)
+    for position, token in enumerate(stemmed_tokens):
+        term_positions[token].append(position)
+    return term_positions
+
+def add_weights(important_texts: list, token_dict: defaultdict, new_words: dict = None) -> defaultdict:
+    # The words of the important tags not seen yet are also recorded in new_words (see record_words)
     # Initialize a list of important tokens
     important_tokens = []
-    for tag in important_tags:
-        # Get content inside those tags
-        content = tag.get_text(separator=" ", strip=True)
+    # Text inside the important tags, once per important tag it's in
+    for content in important_texts:
         # Tokenize and stem the content, adding the tokens to the list of important tokens 
-        tokens = tokenizer.tokenize(content)
-        important_tokens.extend([porter_stemmer.stem(token) for token in tokens])
+        tokens = tokenize(content)
+        important_tokens.extend(stem_tokens(tokens))
+        if new_words is not None:
+            record_words(tokens, new_words)
 
     # The important token has already been counted once
-    # Iterate through the important tokens, and add 2 to the token dictionary
+    # Iterate through the important tokens, and add 2 (IMPORTANT_WEIGHT) to the token dictionary
     # This essentially places 3 times more importance on the tokens between the important tags
     for token in important_tokens:
-        token_dict[token] += 2
+        token_dict[token] += IMPORTANT_WEIGHT
     return token_dict
 
-def add_to_index(docId: int, token_dict: dict, partial_index: defaultdict) -> None:
-    # token identifies the key in the outer dictionary
-    # docId identifies the key in the inner dictionary
-    # Add a <docId, tf> pair to the inner dictionary of each token
-
+def score_document(token_dict: dict) -> tuple:
+    # Returns the <token, tf> pairs of a doc, each tf as an integer number of 1/TF_SCALE, and the norm of the doc
+    # (the Euclidean length of its vector of rounded tf scores)
+    denominator = tf_denominator(len(token_dict))
+    tf_scores = dict()
+    squares = 0
     for token, freq in token_dict.items():
-        number_of_terms_in_doc = len(token_dict)
-        tf = (1 + math.log10(freq)) / math.log10(number_of_terms_in_doc)
+        tf = (1 + math.log10(freq)) / denominator
         # Round the tf to 5 decimal places
-        partial_index[token][docId] = round(tf, 5)    
+        scaled_tf = round(round(tf, 5) * TF_SCALE)
+        tf_scores[token] = scaled_tf
+        squares += scaled_tf * scaled_tf
+    return tf_scores, math.sqrt(squares) / TF_SCALE
 
-def write_partial_index(partial_index: dict) -> None:
+class PartialIndex:
+    # The in-memory partial index, kept compact so that its memory can be bounded
+    # Instead of a dict of <docId, tf> pairs per term (an int and a float object per posting), each term has
+    # one array('I') of interleaved docId, tf pairs: 8 bytes per posting
+    # The tf is rounded to 5 decimals anyway, so it's stored exactly as an integer number of 1/TF_SCALE
+    # With token positions, each term also has one array('I') of <docId, # of positions, positions...> runs
+    # array_bytes accounts for every array (sys.getsizeof includes the space an array over-allocates) and every
+    # term string as they're added, byte_size() adds the dicts that hold them
+    # (without worker processes the term strings are shared with the stem cache, so it errs on the high side)
+
+    def __init__(self, positions: bool = False) -> None:
+        self.postings = dict()
+        self.positions = dict() if positions else None
+        self.array_bytes = 0
+        self.posting_count = 0
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+    def add_document(self, docId: int, tf_scores: dict, term_positions: dict = None) -> None:
+        # Add a <docId, tf> pair to the posting of each token (tf_scores as returned by score_document)
+        for token, scaled_tf in tf_scores.items():
+            self.append(self.postings, token, (docId, scaled_tf))
+        self.posting_count += len(tf_scores)
+        if self.positions is not None:
+            # Add a <docId, positions> run to the positions of each term
+            for term, positions in term_positions.items():
+                self.append(self.positions, term, [docId, len(positions)] + positions)
+
+    def append(self, arrays: dict, term: str, values) -> None:
+        values_array = arrays.get(term)
+        if values_array is None:
+            values_array = arrays[term] = array('I')
+            # The term string is only counted once, for the postings
+            if arrays is self.postings:
+                self.array_bytes += sys.getsizeof(term)
+        else:
+            self.array_bytes -= sys.getsizeof(values_array)
+        values_array.extend(values)
+        self.array_bytes += sys.getsizeof(values_array)
+
+    def byte_size(self) -> int:
+        size = self.array_bytes + sys.getsizeof(self.postings)
+        if self.positions is not None:
+            size += sys.getsizeof(self.positions)
+        return size
+
+    def items(self):
+        # Yields (term, posting, positions) in sorted term order, the posting as <docId, tf> pairs and the positions
+        # as <docId, positions> pairs (or None without positions)
+        for term in sorted(self.postings):
+            pairs = self.postings[term]
+            posting = {pairs[i]: pairs[i + 1] / TF_SCALE for i in range(0, len(pairs), 2)}
+            if self.positions is None:
+                yield term, posting, None
+                continue
+            doc_positions = dict()
+            runs = self.positions.get(term, ())
+            i = 0
+            while i < len(runs):
+                count = runs[i + 1]
+                doc_positions[runs[i]] = runs[i + 2:i + 2 + count].tolist()
+                i += 2 + count
+            yield term, posting, doc_positions
+
+    def clear(self) -> None:
+        self.postings.clear()
+        if self.positions is not None:
+            self.positions.clear()
+        self.array_bytes = 0
+        self.posting_count = 0
+
+def write_partial_index(partial_index: PartialIndex, index_dir: str = ".",
+                        memory_budget: float = MEMORY_BUDGET_MB) -> None:
     # Declare variable as global b/c it's modified in this function
     global partial_index_count
     # Increment the count of the number of partial index files
     partial_index_count += 1
-    # Convert partial_index into a SortedDict to ensure keys are sorted
-    sorted_index = SortedDict(partial_index)
-
-    # json.dumps() converts the dictionary into a JSON string
-    json_string = json.dumps(sorted_index)
-    partial_index_file_name = "json/partial_index" + str(partial_index_count) + ".json"
-    # Write the partial inverted index JSON string to a file
-    with open(partial_index_file_name, 'w') as index_file:
-        index_file.write(json_string)
+
+    # Write the partial inverted index one "term|posting" line per term, in sorted term order
+    # json.dumps() converts each posting dictionary into a JSON string
+    # One line per term lets the merge stream through the file instead of loading all of it
+    # With token positions, each line also holds the term's positions: "term|posting|positions"
+    with open(get_partial_index_file_name(partial_index_count, index_dir), 'w') as index_file:
+        for term, posting, positions in partial_index.items():
+            if positions is None:
+                index_file.write(f'{term}|{json.dumps(posting)}\n')
+            else:
+                index_file.write(f'{term}|{json.dumps(posting)}|{json.dumps(positions)}\n')
     
     # Update log file
     write_log_file(f"{indexed_doc_count} docs indexed")
+    write_log_file(f"Partial index {partial_index_count}: {len(partial_index)} terms, "
+                   f"{partial_index.posting_count} postings, {partial_index.byte_size() / 2**20:.1f} MB in memory "
+                   f"(budget {memory_budget} MB)")
     write_log_file("Finished a write")
 
 def write_log_file(log_text):
@@ -195,89 +471,274 @@ def write_log_file(log_text):
      with open("txt/log.txt", "a") as log_file:
          log_file.write(f"{log_text}\n")
 
-def write_document_mapping(doc_map: dict) -> None:
-    with open("txt/document_mapping.txt", 'w') as map_file:
+def write_document_mapping(doc_map: dict, index_dir: str = ".") -> None:
+    with open(os.path.join(index_dir, DOCUMENT_MAPPING), 'w') as map_file:
         for url in doc_map.values():
             map_file.write(f"{url}\n")
 
-def load_chunk(partial_index_id: int, positions: list, chunk_size: int):
-    # DISCLAIMER : This method loads only 1 partial index into memory at once
-    # It then returns only a chunk of that partial index
-    
-    # Open the partial index file
-    file_name = f"json/partial_index{partial_index_id + 1}.json"
-    with open(file_name, 'r') as file:
-        # Load the entire partial index into memory
-        partial_index = json.load(file)
-        # Get a list of terms in that partial index file
-        terms = list(partial_index.keys())
-        # Get the number of terms in the partial index file
-        size_of_partial_index = len(terms)
-
-        # Get the position of where we left off last time in the partial index file
-        current_pos = positions[partial_index_id]
-        # If the position where we left off = size of the partial index file, file has been exhausted
-        # In that case, return empty dictionary
-        if current_pos == size_of_partial_index:
-            return {}
-        
-        # Get the position where we want to read up to based on the chunk size
-        # If adding the chunk size to the current position exceeds size of file --> cause index out of range
-        # In that case, we are on the last chunk of the file --> use the size as the ending position
-        end_pos = min(current_pos + chunk_size, size_of_partial_index)
+def get_partial_index_file_name(partial_index_number: int, index_dir: str = ".") -> str:
+    # Partial indexes are numbered starting at 1
+    return os.path.join(index_dir, "txt/partial_index" + str(partial_index_number) + ".txt")
+
+def read_partial_index(partial_index_id: int, index_dir: str = "."):
+    # Generator over the (term, posting, positions) triples of a partial index file, in sorted term order
+    # (positions is None if the partial index was written without token positions)
+    # Only one line is held in memory at a time, and each byte of the file is read exactly once
+    with open(get_partial_index_file_name(partial_index_id + 1, index_dir), 'r') as index_file:
+        for line in index_file:
+            term, _, posting = line.rstrip("\n").partition("|")
+            posting, _, positions = posting.partition("|")
+            yield term, json.loads(posting), json.loads(positions) if positions != "" else None
+
+class IndexWriter:
+    # Writes the merged posting of each term to the postings file
+    # Text format -> one "term|posting" line per term in the complete index
+    # Binary format -> one varint-encoded block per term in the binary index, with a skip table for long postings
+    # (see index_format.py)
+    # For every term, a fixed-width record <posting offset, posting length, df, max score> is also written to the lexicon
+    # With positions, the token positions of the term are written to the positions file and located by a record
+    # <offset, length> in the positions lexicon (a separate file, so that only phrase queries ever read it)
+    # In the binary format, the highest scoring 1 / CHAMPION_FRACTION of the docs of every posting longer than
+    # CHAMPION_MIN_DF are also written to the champions file (tier 1 of top-k queries, see SearchEngine.rank_champions),
+    # and located by a record <offset, length> in the champions lexicon
+    # Terms must be added in sorted order, so that the lexicon can be binary searched by the retrieval system
+    # index_dir is the directory of the segment being written, whose doc ids start at first_doc_id
+    # Once every term is written, the completion index of the segment is built from the lexicon (see completions.py),
+    # with the <word, stem> pairs in words (by default, those of the tokens stemmed by this process),
+    # and the spelling index of its words (see spelling.py)
+
+    # A shard is written with the document count of the whole collection (see ShardedIndexWriter)
+
+    def __init__(self, doc_count: int, index_dir: str = ".", index_format: str = TEXT_FORMAT,
+                 first_doc_id: int = 1, weights: str = TF_WEIGHTS, collection_doc_count: int = None,
+                 positions: bool = False, collection_avg_length: float = None, words: dict = None) -> None:
+        self.doc_count = doc_count
+        self.index_dir = index_dir
+        self.index_format = index_format
+        self.first_doc_id = first_doc_id
+        self.weights = weights
+        self.collection_doc_count = collection_doc_count
+        self.collection_avg_length = collection_avg_length
+        self.positions = positions
+        self.words = words
+        if positions:
+            self.positions_file = open(os.path.join(index_dir, POSITIONS), "wb")
+            self.positions_lexicon_file = open(os.path.join(index_dir, POSITIONS_LEXICON), "wb")
+            self.positions_offset = 0
+        if index_format == BINARY_FORMAT:
+            self.champions_file = open(os.path.join(index_dir, CHAMPIONS), "wb")
+            self.champions_lexicon_file = open(os.path.join(index_dir, CHAMPIONS_LEXICON), "wb")
+            self.champions_offset = 0
+        self.index_file = open(os.path.join(index_dir, postings_file(index_format)), "wb")
+        self.lexicon_file = open(os.path.join(index_dir, LEXICON), "wb")
+        self.terms_file = open(os.path.join(index_dir, LEXICON_TERMS), "w")
+        # Byte position of the end of the postings file (where the next posting will be written)
+        self.offset = 0
+        self.term_count = 0
+
+    def add_term(self, term: str, doc_ids: list, scores: list, df: int = None, positions: list = None) -> None:
+        # df defaults to the number of postings (a shard passes the df of the whole collection instead)
+        # positions holds the token positions in each doc of the posting (only used if the writer has positions)
+        if df is None:
+            df = len(doc_ids)
+        if self.index_format == BINARY_FORMAT:
+            prefix = b""
+            posting_bytes = encode_binary_posting(doc_ids, scores, SKIP_INTERVAL)
+            suffix = b""
+        else:
+            prefix = f"{term}|".encode("utf-8")
+            posting_bytes = encode_text_posting(doc_ids, scores, df)
+            suffix = b"\n"
+        self.index_file.write(prefix + posting_bytes + suffix)
+
+        # The lexicon points past the "term|" prefix, straight at the posting bytes
+        # The term's highest score is its upper bound during top-k retrieval
+        write_lexicon_record(self.lexicon_file, self.offset + len(prefix), len(posting_bytes), df, max(scores))
+        self.terms_file.write(f"{term}\n")
+        self.offset += len(prefix) + len(posting_bytes) + len(suffix)
+        self.term_count += 1
+
+        if self.positions:
+            position_bytes = encode_positions(positions)
+            self.positions_file.write(position_bytes)
+            self.positions_lexicon_file.write(POSITIONS_RECORD.pack(self.positions_offset, len(position_bytes)))
+            self.positions_offset += len(position_bytes)
+
+        if self.index_format == BINARY_FORMAT:
+            champion_bytes = b""
+            if len(doc_ids) > CHAMPION_MIN_DF:
+                # Highest scores first, ties broken by doc id like the rankings
+                champions = sorted(heapq.nsmallest(len(doc_ids) // CHAMPION_FRACTION, range(len(doc_ids)),
+                                                   key=lambda i: (-scores[i], doc_ids[i])))
+                champion_bytes = encode_binary_posting([doc_ids[i] for i in champions], [scores[i] for i in champions])
+            self.champions_file.write(champion_bytes)
+            self.champions_lexicon_file.write(CHAMPIONS_RECORD.pack(self.champions_offset, len(champion_bytes)))
+            self.champions_offset += len(champion_bytes)
+
+    def close(self) -> None:
+        self.index_file.close()
+        self.lexicon_file.close()
+        self.terms_file.close()
+        if self.positions:
+            self.positions_file.close()
+            self.positions_lexicon_file.close()
+        if self.index_format == BINARY_FORMAT:
+            self.champions_file.close()
+            self.champions_lexicon_file.close()
+        # Record how the postings are stored, so the retrieval system knows how to decode them
+        info = {"format": self.index_format, "doc_count": self.doc_count, "term_count": self.term_count,
+                "weights": self.weights, "first_doc_id": self.first_doc_id, "positions": self.positions}
+        if self.index_format == BINARY_FORMAT:
+            info["skip_interval"] = SKIP_INTERVAL
+            info["champion_fraction"] = CHAMPION_FRACTION
+        if self.collection_doc_count is not None:
+            info["collection_doc_count"] = self.collection_doc_count
+        if self.collection_avg_length is not None:
+            info["collection_avg_length"] = self.collection_avg_length
+        write_index_info(self.index_dir, info)
+
+        terms, _, _, dfs, _ = read_lexicon(self.index_dir)
+        words, word_dfs = write_completion_index(self.index_dir, terms, dfs,
+                                                 self.words if self.words is not None else indexed_words())
+        write_spelling_index(self.index_dir, words, word_dfs)
+        # The segment is complete, its build manifest records the sizes and checksums of its files
+        write_build_manifest(self.index_dir)
+
+class ShardedIndexWriter:
+    # Same interface as IndexWriter, but partitions the collection by doc id into shards
+    # Shard i holds the docs in one contiguous range of doc ids, with its own lexicon, postings and urls
+    # Every shard stores the df of the whole collection in its lexicon (and the collection's document count),
+    # so the tf-idf scores computed by a shard are the same as in an index that isn't sharded
+    # (likewise, every shard stores the average doc length of the collection, for BM25)
+    # -> the rankings of the shards can be merged by score (see shards.py)
+    # The completion and spelling indexes of the whole collection (with its dfs) are written to the index directory,
+    # so the query coordinator can complete and correct words without asking the shards
+
+    def __init__(self, doc_count: int, shard_count: int, index_format: str = TEXT_FORMAT,
+                 positions: bool = False) -> None:
+        self.doc_count = doc_count
+        # Shards get (almost) the same number of docs
+        shard_size = max(1, math.ceil(doc_count / shard_count))
+        self.first_doc_ids = [1 + shard * shard_size for shard in range(shard_count)]
+        self.shard_dirs = [os.path.join(SHARDS_DIRECTORY, f"shard{shard + 1}") for shard in range(shard_count)]
+
+        # Split the doc stats: each shard gets the (fixed-width) records of its own docs
+        with open(DOC_STATS, "rb") as stats_file:
+            doc_stats = stats_file.read()
+        record_size = DOC_STATS_RECORD.size
+        for shard_dir, first_doc_id in zip(self.shard_dirs, self.first_doc_ids):
+            set_up_segment(shard_dir)
+            with open(os.path.join(shard_dir, DOC_STATS), "wb") as shard_stats_file:
+                shard_stats_file.write(doc_stats[(first_doc_id - 1) * record_size:
+                                                 (first_doc_id - 1 + shard_size) * record_size])
+        weighted_length = sum(length + IMPORTANT_WEIGHT * important_length
+                              for length, important_length, _, _ in DOC_STATS_RECORD.iter_unpack(doc_stats))
+        avg_length = weighted_length / doc_count if doc_count != 0 else 0.0
 
-        # Construct the partial index chunk using the terms
-        terms = terms[current_pos: end_pos]
-        chunk = {term: partial_index[term] for term in terms}
-        # Update the current position of the partial index file
-        positions[partial_index_id] = end_pos
+        # Terms and dfs of the whole collection, for its completion index
+        self.terms = []
+        self.dfs = array("I")
+        self.words = indexed_words()
+        self.writers = []
+        for shard_dir, first_doc_id in zip(self.shard_dirs, self.first_doc_ids):
+            shard_doc_count = max(0, min(shard_size, doc_count - first_doc_id + 1))
+            self.writers.append(IndexWriter(shard_doc_count, shard_dir, index_format, first_doc_id,
+                                            collection_doc_count=doc_count, positions=positions,
+                                            collection_avg_length=avg_length, words=self.words))
 
-        # Return the chunk of the partial index
-        return chunk
+        # Split the doc map: each shard gets the urls of its own docs
+        with open(DOCUMENT_MAPPING, "r") as map_file:
+            urls = map_file.read().split("\n")[:doc_count]
+        for shard_dir, first_doc_id in zip(self.shard_dirs, self.first_doc_ids):
+            with open(os.path.join(shard_dir, DOCUMENT_MAPPING), "w") as shard_map_file:
+                for url in urls[first_doc_id - 1:first_doc_id - 1 + shard_size]:
+                    shard_map_file.write(f"{url}\n")
 
-def merging_indexes(partial_index_count: int) -> None:
+    def add_term(self, term: str, doc_ids: list, scores: list, positions: list = None) -> None:
+        # The doc ids are sorted, so the postings (and positions) of each shard are one slice of the posting
+        df = len(doc_ids)
+        self.terms.append(term)
+        self.dfs.append(df)
+        start = 0
+        for shard, writer in enumerate(self.writers):
+            if shard + 1 < len(self.writers):
+                end = bisect_left(doc_ids, self.first_doc_ids[shard + 1], start)
+            else:
+                end = len(doc_ids)
+            # A shard only gets the term if one of its docs has it
+            if end > start:
+                writer.add_term(term, doc_ids[start:end], scores[start:end], df,
+                                positions[start:end] if positions is not None else None)
+            start = end
+
+    def close(self) -> None:
+        for writer in self.writers:
+            writer.close()
+        words, word_dfs = write_completion_index(".", self.terms, self.dfs, self.words)
+        write_spelling_index(".", words, word_dfs)
+        # List the shards, which tells the retrieval system that the index is sharded
+        with open(SHARD_MANIFEST, "w") as manifest_file:
+            json.dump({"shards": self.shard_dirs, "doc_count": self.doc_count}, manifest_file)
+        # Each shard has its own build manifest, this one covers the files kept in the index directory
+        write_build_manifest(".")
+
+def write_term(index_writer: IndexWriter, term: str, merged_postings: dict, merged_positions: dict = None) -> None:
     # Declare variable as global b/c it's modified in this function
     global unique_term_count
-    # Initialize a complete index that will be the result of merging the partial indexes
-    complete_index = dict()
-    # Initialize a list of all the partial indexes
-    partial_indexes = []
-    # Initialize a list of iterators for each partial index file
-    partial_index_pos_trackers = []
-    # Initialize a list of position trackers for each partial index file (used for tracking batches)
-    positions = [0] * partial_index_count
-
-    # Iterate through the partial index files
-    for partial_index_id in range(0, partial_index_count):
-        # For each file, get the first chunk of terms
-        partial_index_chunk = load_chunk(partial_index_id, positions, PARTIAL_INDEX_CHUNK_SIZE)
-        
-        # Add the partial index and iterator object for the keys of that partial index to their respective lists
-        partial_indexes.append(partial_index_chunk)
-        partial_index_pos_trackers.append(iter(partial_index_chunk))
-    
+    # Update the count of unique terms
+    unique_term_count += 1
+
+    # The postings store the tf associated with each doc id (sorted by doc id)
+    # The idf part of tf-idf depends on every segment of the index, so the retrieval system applies it at query time
+    # -> adding a delta segment never requires rewriting the postings of the other segments
+    # (doc ids are strings after a round trip through a JSON partial index)
+    sorted_doc_ids = sorted(merged_postings, key=int)
+    doc_ids = [int(doc_id) for doc_id in sorted_doc_ids]
+    scores = [merged_postings[doc_id] for doc_id in sorted_doc_ids]
+    # The token positions (if any) are kept in the same doc id order as the posting
+    positions = None
+    if merged_positions is not None:
+        positions = [merged_positions[doc_id] for doc_id in sorted_doc_ids]
+    # Store the completed merged postings for the term in the postings file
+    index_writer.add_term(term, doc_ids, scores, positions=positions)
+
+def merging_indexes(partial_index_count: int, index_format: str = TEXT_FORMAT, index_dir: str = ".",
+                    first_doc_id: int = 1, shard_count: int = 1, positions: bool = False) -> None:
+    # Merges the partial indexes of a segment (the docs first_doc_id..indexed_doc_count) into its complete index
+    # With more than 1 shard, the merged postings are split into the shards of a sharded index instead
+    # With positions, the token positions stored in the partial indexes are merged into the positions file
+    # Initialize a list of streaming readers, one for each partial index file
+    partial_index_readers = [read_partial_index(partial_index_id, index_dir)
+                             for partial_index_id in range(0, partial_index_count)]
+    # Initialize a list holding the posting (and positions) of the term each reader is currently at
+    current_postings = [None] * partial_index_count
+    current_positions = [None] * partial_index_count
+
     # Initialize a min_heap that will store (term, partial_index_id) pairs
     # partial_index_id = the particular partial index
     min_heap = []
-    for partial_index_id, tracker in enumerate(partial_index_pos_trackers):
+    for partial_index_id, reader in enumerate(partial_index_readers):
         # Populate the heap with the first terms from all the partial indexes
-        term = next(tracker, "")
+        term, posting, term_positions = next(reader, ("", None, None))
         if term != "":
+            current_postings[partial_index_id] = posting
+            current_positions[partial_index_id] = term_positions
             heapq.heappush(min_heap, (term, partial_index_id))
     
     # Initialize an inner dictionary for the postings associated w/h each term
     merged_postings = dict()
+    merged_positions = dict() if positions else None
     # Store the last term that is popped from the heap
     last_term = ""
-    # Store the current first character of the terms (begin with "0")
-    current_char = "0"
-    
-    # char_offsets and term_offset dictionaries will be written to files, and used for efficient searching
-    # To understand their roles, look at comments inside search.py
-    # Initialize a character offset dictionary
-    char_offsets = dict()
-    # Initialize a term offset dictionary
-    term_offsets = {"0": 0}
+
+    # Terms come out of the heap in sorted order, so each finished term is written straight to the complete index
+    # and the lexicon (no need to hold the complete index in memory)
+    write_log_file("Writing complete index to file")
+    if shard_count > 1:
+        index_writer = ShardedIndexWriter(indexed_doc_count, shard_count, index_format, positions)
+    else:
+        index_writer = IndexWriter(indexed_doc_count - first_doc_id + 1, index_dir, index_format, first_doc_id,
+                                   positions=positions)
 
     # While min heap is not empty (all partial index files haven't been exhausted)
     while len(min_heap) != 0:
@@ -297,137 +758,298 @@ def merging_indexes(partial_index_count: int) -> None:
         # In partial index 1: "baby": {6: 3, 7: 8}
         # 1st iteration | Pop ("baby", 1), Update last_term = "baby", posting = {1: 4, 2: 1}
         # 2nd iteration | Pop ("baby", 3), last_term = current_term, Update posting = {1: 4, 2: 1, 6: 3, 7: 8}
-        # 3rd iteration | Pop ("cold", 2), last term != current term, Store posting for "baby" in complete index...
+        # 3rd iteration | Pop ("cold", 2), last term != current term, Write posting for "baby" to complete index...
         #               last_term = "cold", posting = {1: 10}
 
         if last_term != current_term:
             # This check is put in place for the first iteration where there's no last term (empty string)
             # The check stops from putting an empty string into the complete index as a key
             if last_term != "":
-                
-                # Periodically save the complete index to a file if threshold met
-                if len(complete_index) == NUMBER_OF_TERMS_THRESHOLD:
-                    write_log_file("Writing complete index to file")
-
-                    with open("txt/complete_index.txt", "a") as index_file:
-                        save_prev_term = ""
-                        save_prev_pos = 0
-                        for term, posting in complete_index.items():
-                            # Update the count of unique terms
-                            unique_term_count += 1
-                            
-                            # Every 1000 terms, store the term in a term dictionary
-                            # If a new first character is encountered...
-                            # Store this character in the term dictionary AND...
-                            # Write the term dictionary to a file 
-                            if unique_term_count % 1000 == 0 or current_char != term[0]:
-                                if current_char != term[0]:
-                                    with open("txt/term_offsets.txt", "a") as offset_file:
-                                        char_offsets[current_char] = [offset_file.tell()]
-                                        # Stores the last term in the char ranges to the term dictionary
-                                        # EX: "azotic", "azul", "b", "baby" --> Stores "azul"
-                                        term_offsets[save_prev_term] = save_prev_pos
-                                        for key, value in term_offsets.items():
-                                            offset_file.write(f'{key}:{value}\n')
-                                        # Clear term offset dictionary
-                                        term_offsets = dict()
-                                        char_offsets[current_char].append(offset_file.tell())
-                                    
-                                    # Reset the current char
-                                    current_char = term[0]
-                                
-                                term_offsets[term] = index_file.tell()
-                            
-                            save_prev_term = term
-                            save_prev_pos = index_file.tell()
-                            # Write to complete index
-                            index_file.write(f'{term}|{json.dumps(posting)}\n')
-                    
-                    # Clear complete index dictionary
-                    complete_index = dict()
-
-                df = len(merged_postings)
-                # Calculate the idf part of tf-idf
-                idf = math.log10(indexed_doc_count / df)
-                # Update the postings to store tf-idf associated with each doc id
-                merged_postings = {int(doc_id): round(tf * idf, 5) for doc_id, tf in merged_postings.items()}
-                # Store the document frequency w/h doc id 0 (there's no document w/h id 0)
-                merged_postings[0] = df
-                sorted_merged_postings = SortedDict(merged_postings)
-                # Store the completed merged postings for the last term in the complete index
-                complete_index[last_term] = sorted_merged_postings
+                write_term(index_writer, last_term, merged_postings, merged_positions)
                 # Reset the postings for the current term
                 merged_postings = dict()
+                merged_positions = dict() if positions else None
 
             # Update the last term (no need to do this if last_term == current_term)
             last_term = current_term
         
         # Update the posting dictionary for the current term (performs merges)
-        merged_postings.update(partial_indexes[partial_index_id][current_term])
+        merged_postings.update(current_postings[partial_index_id])
+        if positions:
+            merged_positions.update(current_positions[partial_index_id])
 
         # Get the next term in the partial index
-        next_term = next(partial_index_pos_trackers[partial_index_id], "")
-        # If chunk of partial index file hasn't been exhausted, push the next term in the file to the heap
+        # If the partial index file hasn't been exhausted, push the next term in the file to the heap
+        next_term, next_posting, next_positions = next(partial_index_readers[partial_index_id], ("", None, None))
+        current_postings[partial_index_id] = next_posting
+        current_positions[partial_index_id] = next_positions
         if next_term != "":
             heapq.heappush(min_heap, (next_term, partial_index_id))
-        # Else chunk has been exhausted
-        else:
-            # Get a new chunk
-            partial_index_chunk = load_chunk(partial_index_id, positions, PARTIAL_INDEX_CHUNK_SIZE)
-            # If new chunk is empty dictionary --> reached end of partial index file
-            # Otherwise, there's still more terms
-            if partial_index_chunk != {}:
-                # Re-assign partial_index and pos_tracker lists based off of the new chunk
-                partial_indexes[partial_index_id] = partial_index_chunk
-                partial_index_pos_trackers[partial_index_id] = iter(partial_index_chunk)
-                # Get the first term of the new chunk and add it to the min heap
-                term = next(partial_index_pos_trackers[partial_index_id], "")
-                if term != "":
-                    heapq.heappush(min_heap, (term, partial_index_id))
         
     # Store the posting for the last term
     # Takes care of when heap is exhausted (there's no more current terms, so the current merge_postings are never stored inside the loop)
-    sorted_merged_postings = SortedDict(merged_postings)
-    complete_index[last_term] = sorted_merged_postings
+    if last_term != "":
+        write_term(index_writer, last_term, merged_postings, merged_positions)
+    index_writer.close()
 
-    # Write the remaining terms in the complete index to a file (just as before)
-    write_log_file("Writing complete index to file")
-    with open("txt/complete_index.txt", "a") as index_file:
-        save_prev_term = ""
-        save_prev_pos = 0
-        for term, posting in complete_index.items():
-            # Update the count of unique terms
-            unique_term_count += 1
-            if unique_term_count % 1000 == 0 or current_char != term[0]:
-                if current_char != term[0]:
-                    with open("txt/term_offsets.txt", "a") as offset_file:
-                        char_offsets[current_char] = [offset_file.tell()]
-                        term_offsets[save_prev_term] = save_prev_pos
-                        for key, value in term_offsets.items():
-                            offset_file.write(f'{key}:{value}\n')
-                        term_offsets = dict()
-                        char_offsets[current_char].append(offset_file.tell())
-                    
-                    current_char = term[0]
-                
-                term_offsets[term] = index_file.tell()
-            
-            save_prev_term = term
-            save_prev_pos = index_file.tell()
-            index_file.write(f'{term}|{json.dumps(posting)}\n')
-
-        # Write the remaining term offsets to a file
-        with open("txt/term_offsets.txt", "a") as offset_file:
-            char_offsets[current_char] = [offset_file.tell()]
-            term_offsets[save_prev_term] = save_prev_pos
-            for key, value in term_offsets.items():
-                offset_file.write(f'{key}:{value}\n')
-            char_offsets[current_char].append(offset_file.tell())
-
-    # Write the char offsets to a file
-    with open("json/char_offsets.json", "w") as offset_file:
-        json_string = json.dumps(char_offsets)
-        offset_file.write(json_string)
+def convert_text_index(index_dir: str = ".") -> None:
+    # Converts an existing text index (segment) into the binary format without re-indexing the corpus
+    # The complete index is read line by line (term order is already sorted), so memory use stays constant
+    info = read_index_info(index_dir)
+    if "doc_count" in info:
+        doc_count = info["doc_count"]
+    else:
+        with open(os.path.join(index_dir, DOCUMENT_MAPPING), "r") as map_file:
+            doc_count = sum(1 for _ in map_file)
+
+    # Indexes written before segments existed store tf-idf scores, the conversion keeps them as they are
+    # The words of the completion index are kept too (the stem cache of this process hasn't seen them)
+    completion_index = open_completion_index(index_dir)
+    # A shard keeps the document count and average length of the whole collection
+    index_writer = IndexWriter(doc_count, index_dir, BINARY_FORMAT, info.get("first_doc_id", 1),
+                               info.get("weights", TFIDF_WEIGHTS), info.get("collection_doc_count"),
+                               collection_avg_length=info.get("collection_avg_length"),
+                               words=completion_index.word_terms() if completion_index is not None else None)
+    with open(os.path.join(index_dir, COMPLETE_INDEX), "r") as index_file:
+        for line in index_file:
+            term, _, posting = line.rstrip("\n").partition("|")
+            posting = json.loads(posting)
+            # Doc id "0" only stores the document frequency, which the binary format keeps in the lexicon
+            # (the df of the whole collection for a shard, so it's kept as it is rather than counted)
+            doc_ids = [int(doc_id) for doc_id in posting if doc_id != "0"]
+            scores = [score for doc_id, score in posting.items() if doc_id != "0"]
+            index_writer.add_term(term, doc_ids, scores, int(posting["0"]) if "0" in posting else None)
+    index_writer.close()
+    # The positions files don't depend on the postings format, so they're kept as they are
+    # (the index info changed after close() wrote the build manifest, so it's written again)
+    if info.get("positions", False):
+        write_index_info(index_dir, dict(read_index_info(index_dir), positions=True))
+        write_build_manifest(index_dir)
+
+def read_file_state() -> dict:
+    # Returns the state of every web page at the last build/update (empty if there was none)
+    try:
+        with open(FILE_STATE, "r") as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return dict()
+
+def write_file_state(file_state: dict) -> None:
+    with open(FILE_STATE, "w") as state_file:
+        json.dump(file_state, state_file)
+
+def create_segment_dir(manifest: dict, kind: str) -> str:
+    # Returns the directory for a new segment (EX: segments/delta3), numbered by a counter kept in the manifest
+    # Numbers are never reused, so a new segment never overwrites one that a running search engine still reads
+    segment_dir = os.path.join(SEGMENTS_DIRECTORY, f"{kind}{manifest['next_segment']}")
+    manifest["next_segment"] += 1
+    shutil.rmtree(segment_dir, ignore_errors=True)
+    set_up_segment(segment_dir)
+    return segment_dir
+
+def create_build_dir() -> str:
+    # Returns the directory for a new full build (EX: builds/20250101-120000), named after the time it started
+    build_id = time.strftime("%Y%m%d-%H%M%S")
+    build_dir = os.path.join(BUILDS_DIRECTORY, build_id)
+    suffix = 1
+    while os.path.exists(build_dir):
+        suffix += 1
+        build_dir = os.path.join(BUILDS_DIRECTORY, f"{build_id}-{suffix}")
+    os.makedirs(build_dir)
+    return build_dir
+
+def publish_build(build_dir: str) -> None:
+    # Points the current symlink at a finished build
+    # The new symlink is created under a temporary name and renamed over the old one, so the retrieval system sees
+    # either the old or the new build, never a missing or partially written one
+    previous_build_dir = current_build_dir(".")
+    temp_link = CURRENT_BUILD + ".tmp"
+    if os.path.lexists(temp_link):
+        os.remove(temp_link)
+    os.symlink(build_dir, temp_link)
+    os.replace(temp_link, CURRENT_BUILD)
+    # Only the new build and the previous one are kept (a server that hasn't switched yet still reads the previous
+    # one), older builds and builds that never finished are removed
+    kept_dirs = {os.path.realpath(build_dir), os.path.realpath(previous_build_dir)}
+    for old_build in os.listdir(BUILDS_DIRECTORY):
+        old_build_dir = os.path.join(BUILDS_DIRECTORY, old_build)
+        if os.path.realpath(old_build_dir) not in kept_dirs:
+            shutil.rmtree(old_build_dir, ignore_errors=True)
+
+def updating_index(workers: int = 1, corpus_dir: str = CORPUS_DIRECTORY, extractor: str = DEFAULT_EXTRACTOR,
+                   near_dup_threshold: int = None, memory_budget: float = MEMORY_BUDGET_MB) -> None:
+    # Indexes only the web pages that were added or changed since the last build/update into a new delta segment
+    # The documents of changed and deleted pages are tombstoned (hidden from search until compaction removes them)
+    # Declare these as global, since they will be modified in this function
+    global indexed_doc_count
+    global partial_index_count
+    manifest = read_manifest()
+    file_state = read_file_state()
+    web_pages = stat_web_pages(list_web_pages(corpus_dir))
+
+    # Near-duplicates are detected with the threshold of the last build, unless another one is given
+    if near_dup_threshold is None:
+        near_dup_threshold = manifest.get("near_duplicate_threshold")
+    manifest["near_duplicate_threshold"] = near_dup_threshold
+    near_duplicates = NearDuplicateIndex(near_dup_threshold) if near_dup_threshold is not None else None
+
+    # Pages whose modification time changed (or that are gone) are re-indexed (or only removed)
+    # The fingerprints of the other indexed pages go into the near-duplicate index, new pages are checked against them
+    removed_doc_ids = []
+    live_hashes = set()
+    for web_page, state in file_state.items():
+        if state["doc_id"] is None:
+            continue
+        if web_pages.get(web_page) != state["mtime"]:
+            removed_doc_ids.append(state["doc_id"])
+        else:
+            live_hashes.add(state["hash"])
+            if near_duplicates is not None and state.get("simhash") is not None:
+                near_duplicates.add(state["simhash"], state["doc_id"])
+
+    # New and changed pages are processed, as well as pages that were skipped as duplicates (or near-duplicates)
+    # of a page that changed or was removed since (they may now be the only copy of their content)
+    changed_pages = dict()
+    for web_page, mtime in web_pages.items():
+        state = file_state.get(web_page)
+        if (state is None or state["mtime"] != mtime or
+                (state["doc_id"] is None and state["hash"] is not None and state["hash"] not in live_hashes and
+                 find_near_duplicate(state.get("simhash"), near_duplicates) is None)):
+            changed_pages[web_page] = mtime
+
+    write_log_file(f"Incremental update: {len(changed_pages)} new or changed pages, "
+                   f"{len(removed_doc_ids)} documents removed")
+    if len(changed_pages) == 0 and len(removed_doc_ids) == 0:
+        write_log_file("Index is up to date")
+        return
+
+    # The new documents continue the doc ids of the existing segments
+    base_info = read_index_info(manifest["base"])
+    first_doc_id = manifest["next_doc_id"]
+    indexed_doc_count = first_doc_id - 1
+    partial_index_count = 0
+    delta_dir = create_segment_dir(manifest, "delta")
+    # A delta segment records token positions only if the base segment does (phrase queries need every segment)
+    positions = base_info.get("positions", False)
+    new_state = creating_partial_indexes(changed_pages, workers, delta_dir, live_hashes, positions, extractor,
+                                         near_duplicates, memory_budget)
+
+    delta_size = 0
+    if indexed_doc_count >= first_doc_id:
+        merging_indexes(partial_index_count, base_info["format"], delta_dir, first_doc_id, positions=positions)
+        manifest["deltas"].append(delta_dir)
+        manifest["next_doc_id"] = indexed_doc_count + 1
+        delta_size = get_file_size_in_kb(os.path.join(delta_dir, postings_file(base_info["format"])))
+    else:
+        # Every changed page was empty or a duplicate, there's nothing to put in the delta segment
+        shutil.rmtree(delta_dir)
+    write_log_file(f"{indexed_doc_count - first_doc_id + 1} documents added to {delta_dir}")
+    if near_duplicates is not None:
+        log_near_duplicates(delta_size)
+
+    # Publish the update: the tombstones first, then the manifest that adds the delta segment
+    add_tombstones(".", removed_doc_ids)
+    write_manifest(".", manifest)
+    for web_page in file_state.keys() - web_pages.keys():
+        del file_state[web_page]
+    file_state.update(new_state)
+    write_file_state(file_state)
+
+    # Every delta segment makes queries read one more lexicon and posting per term
+    if len(manifest["deltas"]) > MAX_DELTA_SEGMENTS:
+        compacting_segments()
+
+def compacting_segments() -> None:
+    # Merges the base segment and all delta segments into a new base segment, leaving out the tombstoned documents
+    # Doc ids are kept as they are (the urls of removed documents become empty lines), so the file state stays valid
+    # The new segment is written next to the old ones and then published by replacing the manifest,
+    # so compaction can run in the background while the search engine is serving queries
+    manifest = read_manifest()
+    tombstones = read_tombstones()
+    removed_lookup = removed_doc_id_lookup(tombstones)
+    segments = open_segments(".", manifest)
+    old_segment_dirs = [manifest["base"]] + manifest["deltas"]
+    compacted_dir = create_segment_dir(manifest, "base")
+    write_log_file(f"Compacting {len(segments)} segments into {compacted_dir}")
+
+    # Write the urls of every doc id, in order
+    doc_count = 0
+    with open(os.path.join(compacted_dir, DOCUMENT_MAPPING), "w") as map_file:
+        for segment in segments:
+            for doc_id, url in enumerate(segment.urls, start=segment.first_doc_id):
+                if url == "" or doc_id in tombstones:
+                    map_file.write("\n")
+                else:
+                    map_file.write(f"{url}\n")
+                    doc_count += 1
+
+    # Same for the doc stats, if every segment has them (a removed document gets a record of zeros)
+    if all(segment.doc_stats is not None for segment in segments):
+        with open(os.path.join(compacted_dir, DOC_STATS), "wb") as stats_file:
+            for segment in segments:
+                for index, url in enumerate(segment.urls):
+                    if url == "" or segment.first_doc_id + index in tombstones:
+                        stats_file.write(DOC_STATS_RECORD.pack(0, 0, 0, 0.0))
+                    else:
+                        stats_file.write(DOC_STATS_RECORD.pack(*(column[index] for column in segment.doc_stats)))
+
+    # The document store is copied the same way (removed documents are left out), if every segment has one
+    if all(segment.docstore is not None for segment in segments):
+        docstore_writer = DocumentStoreWriter(compacted_dir)
+        for segment in segments:
+            for doc_id, url in enumerate(segment.urls, start=segment.first_doc_id):
+                if url != "" and doc_id not in tombstones:
+                    document = segment.docstore.get(doc_id)
+                    if document is not None:
+                        docstore_writer.add(doc_id, *document)
+        docstore_writer.close()
+
+    # The terms of each segment are sorted, so merging the sorted term lists visits every term once, in sorted order
+    # For a term found in several segments, heapq.merge yields the segments in manifest order (= doc id order)
+    # The token positions are kept if every segment has them
+    positions = all(segment.has_positions for segment in segments)
+    # The words of the compacted segment are those of the segments' completion indexes
+    words = indexed_words()
+    for segment in segments:
+        if segment.completions is not None:
+            words.update(segment.completions.word_terms())
+    index_writer = IndexWriter(doc_count, compacted_dir, segments[0].index_format, 1, segments[0].weights,
+                               positions=positions, words=words)
+    # Each segment contributes (term, segment number, term id) triples
+    segment_terms = [zip(segment.terms, itertools.repeat(segment_number), itertools.count())
+                     for segment_number, segment in enumerate(segments)]
+    for term, entries in itertools.groupby(heapq.merge(*segment_terms), key=lambda entry: entry[0]):
+        entries = list(entries)
+        posting = concatenate_postings([segments[segment_number].read_posting(term_id)
+                                        for _, segment_number, term_id in entries])
+        term_positions = None
+        if positions:
+            term_positions = []
+            for _, segment_number, term_id in entries:
+                term_positions.extend(segments[segment_number].read_positions(term_id))
+        if len(tombstones) != 0:
+            if positions:
+                term_positions = [doc_positions for doc_id, doc_positions in zip(posting[0].tolist(), term_positions)
+                                  if doc_id not in tombstones]
+            posting = remove_doc_ids(posting, removed_lookup)
+        # Terms that only appeared in removed documents are dropped
+        if len(posting[0]) != 0:
+            index_writer.add_term(term, posting[0].tolist(), posting[1].tolist(), positions=term_positions)
+    index_writer.close()
+    for segment in segments:
+        segment.close()
+
+    # Publish the compacted segment, then clear the tombstones (the documents they hide no longer exist)
+    manifest["base"] = compacted_dir
+    manifest["deltas"] = []
+    write_manifest(".", manifest)
+    with open(TOMBSTONES, "w") as tombstone_file:
+        tombstone_file.write("")
+    # The old segments under segments/ aren't needed anymore (the files of a full build stay where they are)
+    for segment_dir in old_segment_dirs:
+        if segment_dir != ".":
+            shutil.rmtree(segment_dir, ignore_errors=True)
+    write_log_file(f"Compacted index: {doc_count} documents, {index_writer.term_count} terms")
 
 def get_file_size_in_kb(file_name):
     # Get the size of the file in bytes
@@ -437,27 +1059,129 @@ def get_file_size_in_kb(file_name):
     return int(file_size_kb)
 
 if __name__ == '__main__':
-    porter_stemmer = PorterStemmer()
-    tokenizer = RegexpTokenizer(r'[a-zA-Z0-9]+')
-    # Initialize a tracker for the number of partial index files
-    partial_index_count = 0
-    # Initialize a tracker of the number of indexed documents
-    indexed_doc_count = 0
-    # Initialize a tracker for the number of unique terms
-    unique_term_count = 0
+    parser = argparse.ArgumentParser(description="Builds the inverted index from the developer/DEV corpus")
+    parser.add_argument("--corpus", default=CORPUS_DIRECTORY,
+                        help="folder of the corpus to index (EX: a synthetic corpus from benchmarks.corpus)")
+    parser.add_argument("--binary", action="store_true",
+                        help="store postings in the compact binary format instead of JSON text")
+    parser.add_argument("--convert", action="store_true",
+                        help="convert the existing text index to the binary format and exit")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes that parse, tokenize and stem web pages in parallel")
+    parser.add_argument("--stem-table", action="store_true",
+                        help="save the stems computed while indexing, so later runs and the search engine start warm")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only index the pages added or changed since the last run, into a delta segment")
+    parser.add_argument("--compact", action="store_true",
+                        help="merge the base and delta segments into a single segment and exit")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="partition the index by doc id into this many shards, searched in parallel")
+    parser.add_argument("--positions", action="store_true",
+                        help="also store the token positions of every term, which phrase queries need")
+    parser.add_argument("--extractor", choices=EXTRACTORS, default=DEFAULT_EXTRACTOR,
+                        help="backend that extracts the text of the web pages (lxml needs the lxml package)")
+    parser.add_argument("--near-dup-threshold", type=int,
+                        help="drop pages whose SimHash fingerprint is at most this many bits (out of 64) from "
+                             "an indexed page (EX: 5), incremental updates keep the threshold of the last build")
+    parser.add_argument("--memory-budget", type=float, default=MEMORY_BUDGET_MB, metavar="MB",
+                        help="memory the partial index may take before it's written to a partial index file")
+    parser.add_argument("--verify", action="store_true",
+                        help="check the sizes and checksums of the files of the published index and exit")
+    args = parser.parse_args()
+
+    if args.memory_budget <= 0:
+        sys.exit("--memory-budget must be positive")
+    if args.near_dup_threshold is not None and not 0 <= args.near_dup_threshold <= MAX_THRESHOLD:
+        sys.exit(f"--near-dup-threshold must be between 0 and {MAX_THRESHOLD}")
+
+    if args.extractor not in available_extractors():
+        sys.exit(f"The {LXML_EXTRACTOR} extractor needs the lxml package (pip install lxml)")
 
-    NUMBER_OF_TERMS_THRESHOLD = 300000
-    NUMBER_OF_DOCS_THRESHOLD = 10000
-    PARTIAL_INDEX_CHUNK_SIZE = 100000
+    # The corpus path stays valid once the indexer moves into a build directory
+    corpus_dir = os.path.abspath(args.corpus)
+    root_dir = os.getcwd()
+    published_dir = current_build_dir(".")
+    if args.verify or args.convert or args.compact or args.incremental:
+        # These work on the published build in place (an update publishes itself by replacing the segment manifest)
+        os.chdir(published_dir)
+
+    if args.verify:
+        try:
+            verified_dirs = verify_index(".")
+        except IndexIntegrityError as e:
+            sys.exit(str(e))
+        print(f"{len(verified_dirs)} segments match their build manifests: {', '.join(verified_dirs)}")
+        sys.exit(0)
+
+    shard_manifest = read_shard_manifest()
+    if args.convert:
+        # Every segment (or every shard) is converted in place
+        if shard_manifest is not None:
+            segment_dirs = shard_manifest["shards"]
+        else:
+            manifest = read_manifest()
+            segment_dirs = [manifest["base"]] + manifest["deltas"]
+        for segment_dir in segment_dirs:
+            convert_text_index(segment_dir)
+        sys.exit(0)
+
+    if (args.compact or args.incremental) and shard_manifest is not None:
+        sys.exit("A sharded index can't be updated incrementally, rebuild it instead")
+
+    if args.compact:
+        compacting_segments()
+        sys.exit(0)
+
+    if args.incremental:
+        # The state of the pages at the last build is needed to tell which pages changed
+        if not os.path.exists(FILE_STATE):
+            sys.exit(f"{FILE_STATE} not found, build the index without --incremental first")
+        updating_index(args.workers, corpus_dir, args.extractor, args.near_dup_threshold, args.memory_budget)
+        if args.stem_table:
+            save_stem_table()
+        sys.exit(0)
+
+    # A full build is written to a new build directory, and published only once it's complete
+    # (until then, the search engine keeps serving the previous build)
+    build_dir = create_build_dir()
+    # The stem table of the previous build (if it saved one) warms up the stem cache
+    if os.path.exists(os.path.join(published_dir, STEM_TABLE)):
+        Path(build_dir, "json").mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(os.path.join(published_dir, STEM_TABLE), os.path.join(build_dir, STEM_TABLE))
+    os.chdir(build_dir)
 
     # Create/reset some necessary directories/files
     set_up_files()
 
-    creating_partial_indexes()
-    merging_indexes(partial_index_count)
+    index_format = BINARY_FORMAT if args.binary else TEXT_FORMAT
+    near_duplicates = NearDuplicateIndex(args.near_dup_threshold) if args.near_dup_threshold is not None else None
+    file_state = creating_partial_indexes(stat_web_pages(list_web_pages(corpus_dir)), args.workers,
+                                          positions=args.positions, extractor=args.extractor,
+                                          near_duplicates=near_duplicates, memory_budget=args.memory_budget)
+    if args.stem_table:
+        save_stem_table()
+    merging_indexes(partial_index_count, index_format, shard_count=args.shards, positions=args.positions)
+    if args.shards > 1:
+        file_size = sum(get_file_size_in_kb(os.path.join(SHARDS_DIRECTORY, f"shard{shard + 1}",
+                                                         postings_file(index_format)))
+                        for shard in range(args.shards))
+    else:
+        # Record the state of every page and a manifest with the base segment only, for later incremental updates
+        write_file_state(file_state)
+        write_manifest(".", {"base": ".", "deltas": [], "next_doc_id": indexed_doc_count + 1, "next_segment": 1,
+                             "near_duplicate_threshold": args.near_dup_threshold})
+        file_size = get_file_size_in_kb(postings_file(index_format))
 
     # Store analytics in log file
-    file_size = get_file_size_in_kb("txt/complete_index.txt")
     write_log_file(f"Total number of documents indexed: {indexed_doc_count}")
     write_log_file(f"Total number of unique terms: {unique_term_count}")
     write_log_file(f"Size of full index: {file_size} KB")
+    if near_duplicates is not None:
+        log_near_duplicates(file_size)
+    # With --workers, the stemming (and so the hits/misses) happens in the worker processes
+    write_log_file(f"Stem cache of the main process: {stem_cache.stats()}")
+
+    # Publish the build by pointing the current symlink at it
+    write_log_file(f"Publishing {build_dir}")
+    os.chdir(root_dir)
+    publish_build(build_dir)
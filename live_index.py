@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from index_format import current_build_dir, index_signature
+from query_cache import INDEX_CHECK_INTERVAL
+from shards import open_engine
+from query_log import read_query_log
+# Serving queries from the published build of the index, switching to a new build (or to an updated one) while
+# queries are running
+# Each query acquires the engine that is current when it starts and keeps using it until it's done, so a swap never
+# changes the index under a running query: the old engine is only closed once its last query releases it
+# The new engine is opened and verified by a background thread, queries are served by the old one in the meantime
+# Imported data structures/functions comments:
+# Lookup in/insertion into dict -> O(1) on average
+# index_signature() -> O(1), a few os.stat() calls
+
+class LiveIndex:
+    # Holds the engine of the current build of an index directory, shared by the threads of the Flask app
+    # Every check_interval seconds, a query checks whether the build changed: the current symlink points to
+    # another build (a full rebuild was published) or the files of the build changed (an incremental update or
+    # a compaction was published)
+    # A changed build is opened and all of its checksums are verified (see SearchEngine.verify) before any query is
+    # sent to it, a build that fails is reported by stats() and skipped until it changes again
+    # Shard servers (port) serve the build they were started with, so an engine that uses them is never swapped
+    # Every new engine warms its posting cache with the terms of the recent queries of query_log (if any)
+    # champions -> every engine answers top-k OR queries from the champion lists first (see SearchEngine.rank_champions)
+
+    def __init__(self, index_dir: str = ".", port: int = None, check_interval: float = INDEX_CHECK_INTERVAL,
+                 query_log: str = None, champions: bool = False) -> None:
+        self.index_dir = index_dir
+        self.port = port
+        self.champions = champions
+        self.query_log = query_log
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        # Opening the first engine only compares the file sizes with the build manifests, for a fast start
+        self.signature = self.build_signature()
+        self.engine = open_engine(index_dir, port, champions)
+        self.warm(self.engine)
+        # <engine, number of running queries> pairs of the engines in use
+        self.in_flight = dict()
+        self.next_check = time.monotonic() + check_interval
+        self.reloading = False
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.failed_signature = None
+        self.last_error = None
+
+    def warm(self, engine) -> None:
+        # Decodes the postings of the most frequent terms of the query log before the engine serves queries
+        if self.query_log is not None:
+            engine.warm_posting_cache(read_query_log(self.query_log))
+
+    def build_signature(self) -> tuple:
+        # Identifies the published build and the version of its files
+        build_dir = current_build_dir(self.index_dir)
+        return build_dir, index_signature(build_dir)
+
+    @contextmanager
+    def acquire(self):
+        # Yields the current engine for one query (EX: with live_index.acquire() as engine: ...)
+        with self.lock:
+            self.check_build(time.monotonic())
+            engine = self.engine
+            self.in_flight[engine] = self.in_flight.get(engine, 0) + 1
+        try:
+            yield engine
+        finally:
+            with self.lock:
+                self.in_flight[engine] -= 1
+                retired = engine is not self.engine and self.in_flight[engine] == 0
+                if self.in_flight[engine] == 0:
+                    del self.in_flight[engine]
+            # The last query of a swapped out engine closes it
+            if retired:
+                engine.close()
+
+    def check_build(self, now: float) -> None:
+        # Starts reloading the index in the background if the build changed (called with the lock held)
+        if self.port is not None or self.reloading or now < self.next_check:
+            return
+        self.next_check = now + self.check_interval
+        signature = self.build_signature()
+        if signature != self.signature and signature != self.failed_signature:
+            self.reloading = True
+            threading.Thread(target=self.reload, args=(signature,), daemon=True).start()
+
+    def reload(self, signature: tuple) -> None:
+        # Opens and verifies the engine of the changed build, then swaps it in
+        engine = None
+        try:
+            engine = open_engine(self.index_dir, self.port, self.champions)
+            engine.verify()
+            self.warm(engine)
+        except Exception as e:
+            # EX: a build that is still being written, or whose files don't match its build manifests
+            if engine is not None:
+                engine.close()
+            with self.lock:
+                self.failed_reloads += 1
+                self.failed_signature = signature
+                self.last_error = str(e)
+                self.reloading = False
+            return
+
+        with self.lock:
+            old_engine = self.engine
+            self.engine = engine
+            self.signature = signature
+            self.reloads += 1
+            self.last_error = None
+            self.reloading = False
+            idle = old_engine not in self.in_flight
+        # An engine with running queries is closed by the last of them (see acquire)
+        if idle:
+            old_engine.close()
+
+    def close(self) -> None:
+        with self.lock:
+            self.engine.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"build": os.path.basename(os.path.abspath(self.signature[0])), "reloads": self.reloads,
+                    "failed_reloads": self.failed_reloads, "last_error": self.last_error,
+                    "engines_in_use": len(self.in_flight)}
@@ -0,0 +1,134 @@
+import time
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+# Per-stage query latency and work counters, aggregated in memory and exported in the Prometheus text format
+# Imported data structures/functions comments:
+# bisect_left() on a sorted list -> O(log n), where n = # of elements in the list
+# Lookup in/insertion into dict -> O(1) on average
+
+# Stages of a query, in the order they run
+# spelling   -> correcting the misspelled words of the query (web server only)
+# tokenize   -> tokenizing and stemming the query
+# cache      -> looking the query up in the query cache
+# lexicon    -> binary searching the lexicon of each segment
+# posting_io -> reading the posting bytes from the memory-mapped postings file (page faults happen here)
+# decode     -> decoding the posting bytes into arrays
+# intersect  -> looking up the candidate docs in the postings of the other terms (AND and phrase queries only)
+# positions  -> reading the token positions and checking the phrase (phrase queries only)
+# segments   -> joining the postings of the segments, dropping tombstoned docs and applying the idf
+# union      -> collecting the matched doc ids (without NumPy, the NumPy ranking does it as part of rank)
+# rank       -> scoring and sorting the matched docs
+# shards     -> sending the query to the shards and merging their rankings (sharded index only)
+# urls       -> looking up the urls (or the stored url, title and text) of the requested results
+# snippets   -> making the highlighted snippets of the requested results (results page only)
+STAGES = ("spelling", "tokenize", "cache", "lexicon", "posting_io", "decode", "intersect", "positions", "segments",
+          "union", "rank", "shards", "urls", "snippets")
+
+# Upper bounds (in seconds) of the histogram buckets, the last bucket holds everything above
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5)
+
+class QueryTrace:
+    # Timings and counters of a single query
+    # Stages are timed with time.perf_counter(): record() adds the time since start_time to a stage and returns
+    # the current time, so consecutive stages can be chained without reading the clock twice
+    # A trace is only used by the thread running its query, so it needs no lock
+
+    def __init__(self) -> None:
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        # <stage, seconds> pairs
+        self.stages = defaultdict(float)
+        # <counter name, value> pairs (EX: bytes_read, postings_decoded)
+        self.counters = defaultdict(int)
+
+    def record(self, stage: str, start_time: float) -> float:
+        now = time.perf_counter()
+        self.stages[stage] += now - start_time
+        return now
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        self.counters[counter] += amount
+
+    def finish(self) -> None:
+        self.end_time = time.perf_counter()
+
+    def total(self) -> float:
+        # Seconds from the start of the query until finish() (or until now)
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        return end_time - self.start_time
+
+    def to_dict(self) -> dict:
+        # Milliseconds per stage (in stage order), for the per-query trace of the API
+        return {"total_ms": round(self.total() * 1000, 3),
+                "stages_ms": {stage: round(self.stages[stage] * 1000, 3) for stage in STAGES if stage in self.stages},
+                "counters": dict(self.counters)}
+
+class Histogram:
+    # Fixed-bucket histogram: observing a value is a binary search and two additions
+    # counts[i] = # of values <= buckets[i] (and > buckets[i - 1]), counts[-1] = # of values above every bucket
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class QueryMetrics:
+    # Aggregates the traces of all queries answered by this process
+    # A finished trace is added under one lock acquisition, so the cost per query is a few dozen additions
+    # With several worker processes (EX: gunicorn), each worker reports its own metrics
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.query_latency = Histogram()
+        self.stage_latency = {stage: Histogram() for stage in STAGES}
+        self.counters = defaultdict(int)
+
+    def observe(self, trace: QueryTrace) -> None:
+        with self.lock:
+            self.query_latency.observe(trace.total())
+            for stage, seconds in trace.stages.items():
+                self.stage_latency[stage].observe(seconds)
+            for counter, amount in trace.counters.items():
+                self.counters[counter] += amount
+            self.counters["queries"] += 1
+
+    def render_prometheus(self) -> str:
+        # Prometheus text exposition format (histogram buckets are cumulative)
+        with self.lock:
+            lines = ["# HELP zotsearch_query_seconds Time to answer a query",
+                     "# TYPE zotsearch_query_seconds histogram"]
+            lines.extend(render_histogram("zotsearch_query_seconds", "", self.query_latency))
+            lines.append("# HELP zotsearch_query_stage_seconds Time spent in each stage of a query")
+            lines.append("# TYPE zotsearch_query_stage_seconds histogram")
+            for stage in STAGES:
+                if self.stage_latency[stage].count != 0:
+                    lines.extend(render_histogram("zotsearch_query_stage_seconds", f'stage="{stage}",',
+                                                  self.stage_latency[stage]))
+            for counter in sorted(self.counters):
+                lines.append(f"# TYPE zotsearch_{counter}_total counter")
+                lines.append(f"zotsearch_{counter}_total {self.counters[counter]}")
+        return "\n".join(lines) + "\n"
+
+def render_histogram(name: str, labels: str, histogram: Histogram) -> list:
+    # labels is either empty or ends with a comma (EX: 'stage="rank",')
+    lines = []
+    cumulative = 0
+    for bucket, bucket_count in zip(histogram.buckets, histogram.counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{{{labels}le="{bucket}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {histogram.count}')
+    label_set = "{" + labels.rstrip(",") + "}" if labels else ""
+    lines.append(f"{name}_sum{label_set} {histogram.sum}")
+    lines.append(f"{name}_count{label_set} {histogram.count}")
+    return lines
+
+# Metrics of every query answered by this process
+query_metrics = QueryMetrics()
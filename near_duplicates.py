@@ -0,0 +1,91 @@
+import hashlib
+import functools
+# Near-duplicate detection of the indexer: pages that are almost the same (EX: calendar views, paginated listings,
+# the same page under different session parameters) are dropped like exact duplicates
+# Every page gets a 64-bit SimHash fingerprint of its set of distinct terms: each bit is set if more of the terms
+# have that bit set in their hash than not, so pages sharing most of their terms get fingerprints that differ
+# in only a few bits
+# The terms aren't weighted by their tf: the most frequent words are in every page and would dominate every
+# fingerprint (on a Zipfian corpus, unrelated pages came within 3 bits of each other with tf weights, and no
+# closer than 9 bits with distinct terms)
+# Two pages are near-duplicates if their fingerprints differ in at most threshold bits (Hamming distance)
+# Imported data structures/functions comments:
+# hashlib.blake2b() -> O(n), where n = # of characters of the term
+# functools.lru_cache() -> O(1) lookup/insertion of <term, spread hash> pairs
+# int.bit_count() -> O(1) for 64-bit integers
+
+FINGERPRINT_BITS = 64
+# Each bit of a term's hash is spread to its own lane of LANE_BITS bits, so the set bits of all the terms of a page
+# are counted for the 64 bits at once with big integer additions (a page must have fewer than 2^LANE_BITS terms)
+LANE_BITS = 32
+LANE_MASK = (1 << LANE_BITS) - 1
+# <byte, the 8 bits of the byte spread to 8 lanes> pairs
+SPREAD_BYTES = [sum(((byte >> bit) & 1) << (bit * LANE_BITS) for bit in range(8)) for byte in range(256)]
+# Pages with fewer distinct terms than this aren't fingerprinted: a few changed words would be a large part of them
+MIN_FINGERPRINT_TERMS = 10
+# Number of <term, spread hash> pairs kept (terms are Zipfian, the frequent ones are hashed once)
+TERM_HASH_CACHE_SIZE = 200000
+# Highest threshold accepted, the bands of the LSH index get too narrow to be selective above it
+MAX_THRESHOLD = 15
+
+@functools.lru_cache(maxsize=TERM_HASH_CACHE_SIZE)
+def spread_term_hash(term: str) -> int:
+    # The 64-bit hash of the term, with bit i moved to bit i * LANE_BITS
+    term_hash = int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), "little")
+    spread = 0
+    for byte_number in range(8):
+        byte = (term_hash >> (8 * byte_number)) & 0xFF
+        spread |= SPREAD_BYTES[byte] << (8 * byte_number * LANE_BITS)
+    return spread
+
+def simhash(terms):
+    # Returns the 64-bit SimHash fingerprint of the distinct terms (EX: the keys of a token dictionary),
+    # or None if there are too few terms
+    if len(terms) < MIN_FINGERPRINT_TERMS:
+        return None
+    # Lane i of set_counts = # of terms whose hash has bit i set
+    set_counts = 0
+    for term in terms:
+        set_counts += spread_term_hash(term)
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        # The bit is set if it's set in more than half of the term hashes
+        if 2 * ((set_counts >> (bit * LANE_BITS)) & LANE_MASK) > len(terms):
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def hamming_distance(fingerprint: int, other_fingerprint: int) -> int:
+    return (fingerprint ^ other_fingerprint).bit_count()
+
+class NearDuplicateIndex:
+    # Banded LSH index of the fingerprints of the indexed pages
+    # The 64 bits are split into threshold + 1 bands: two fingerprints that differ in at most threshold bits are
+    # identical in at least one band (pigeonhole principle), so only the fingerprints that share a band with the
+    # page are compared with it, instead of every indexed page
+    # EX: threshold 3 -> 4 bands of 16 bits, the candidates of a page are the pages in its 4 buckets
+
+    def __init__(self, threshold: int) -> None:
+        self.threshold = threshold
+        band_count = threshold + 1
+        # (shift, mask) of each band, the first FINGERPRINT_BITS % band_count bands are one bit wider
+        self.bands = []
+        shift = 0
+        for band in range(band_count):
+            width = FINGERPRINT_BITS // band_count + (1 if band < FINGERPRINT_BITS % band_count else 0)
+            self.bands.append((shift, (1 << width) - 1))
+            shift += width
+        # One dictionary of <band value, list of (fingerprint, doc id)> pairs per band
+        self.buckets = [dict() for _ in self.bands]
+
+    def find(self, fingerprint: int):
+        # Returns (doc id, distance) of an indexed page within threshold bits of the fingerprint, or None
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            for other_fingerprint, doc_id in buckets.get((fingerprint >> shift) & mask, ()):
+                distance = hamming_distance(fingerprint, other_fingerprint)
+                if distance <= self.threshold:
+                    return doc_id, distance
+        return None
+
+    def add(self, fingerprint: int, doc_id: int) -> None:
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            buckets.setdefault((fingerprint >> shift) & mask, []).append((fingerprint, doc_id))
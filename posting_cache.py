@@ -0,0 +1,192 @@
+import threading
+from collections import OrderedDict
+# Cache of the decoded (and weighted) postings of the query terms, bounded by bytes, with W-TinyLFU eviction
+# Query traffic is skewed: a few terms are in most queries, and their postings are also the longest ones to decode
+# A plain LRU cache lets a burst of rare terms push them out, so this cache only admits a posting into its main part
+# if its term is requested more often than the posting it would evict
+# - A count-min sketch estimates how often each key was requested recently (every lookup counts, hit or miss)
+# - New postings go into a small LRU window, so a term that suddenly becomes popular gets a chance to prove it
+# - Postings leaving the window compete for the main part (a segmented LRU: probation, then protected once hit
+#   again) with its least recently used posting, and the one requested less often is evicted
+# Imported data structures/functions comments:
+# Lookup in/insertion into/move_to_end() of OrderedDict -> O(1)
+# popitem(last=False) of OrderedDict -> O(1)
+# bytearray.translate() -> O(n), where n = # of bytes in the array
+
+# Default size of the posting cache of an engine (each process serving queries has its own)
+POSTING_CACHE_BYTES = 64 * 2**20
+# Share of the cache taken by the window, and share of the main part taken by the protected segment
+WINDOW_FRACTION = 0.01
+PROTECTED_FRACTION = 0.8
+# Counters per row of the frequency sketch (a power of 2), each counter takes 1 byte and saturates at 15
+SKETCH_WIDTH = 1 << 16
+SKETCH_DEPTH = 4
+MAX_COUNT = 15
+# The counters are halved every SKETCH_SAMPLE_FACTOR * SKETCH_WIDTH requests, so old popularity fades out
+SKETCH_SAMPLE_FACTOR = 10
+# Estimated memory of a cache entry besides its arrays (the key, the tuples and the array objects)
+ENTRY_OVERHEAD = 256
+
+# Maps each counter value to its half, for halving the whole sketch at once
+HALVE_TABLE = bytes(value >> 1 for value in range(256))
+
+class FrequencySketch:
+    # Count-min sketch of how often each key was requested: SKETCH_DEPTH rows of counters, a key increments one
+    # counter per row and its estimated frequency is the smallest of them (collisions can only overestimate)
+
+    def __init__(self, width: int = SKETCH_WIDTH) -> None:
+        self.width = width
+        self.counters = bytearray(SKETCH_DEPTH * width)
+        self.additions = 0
+        self.sample_size = SKETCH_SAMPLE_FACTOR * width
+
+    def positions(self, key) -> list:
+        # The counter of the key in each row (a different hash per row)
+        return [row * self.width + (hash((row, key)) & (self.width - 1)) for row in range(SKETCH_DEPTH)]
+
+    def increment(self, key) -> None:
+        for position in self.positions(key):
+            if self.counters[position] < MAX_COUNT:
+                self.counters[position] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.counters = self.counters.translate(HALVE_TABLE)
+            self.additions //= 2
+
+    def frequency(self, key) -> int:
+        return min(self.counters[position] for position in self.positions(key))
+
+class PostingCache:
+    # Bounded W-TinyLFU cache of <key, (posting, upper bound)> pairs, sized by the bytes of the posting arrays
+    # Every segment is an OrderedDict of <key, (value, size in bytes)> pairs, least recently used first
+    # The cached postings are never modified, so they're shared by every query that reads them
+    # All operations hold a lock, so the cache can be shared by the threads of the Flask app
+
+    def __init__(self, max_bytes: int = POSTING_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.window_max_bytes = int(max_bytes * WINDOW_FRACTION)
+        self.main_max_bytes = max_bytes - self.window_max_bytes
+        self.protected_max_bytes = int(self.main_max_bytes * PROTECTED_FRACTION)
+        self.sketch = FrequencySketch()
+        self.window = OrderedDict()
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.window_bytes = 0
+        self.main_bytes = 0
+        self.protected_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def get(self, key):
+        # Returns the cached value, or None if the key isn't cached
+        with self.lock:
+            self.sketch.increment(key)
+            if key in self.window:
+                self.window.move_to_end(key)
+                entry = self.window[key]
+            elif key in self.protected:
+                self.protected.move_to_end(key)
+                entry = self.protected[key]
+            elif key in self.probation:
+                # A second hit in the main part protects the posting
+                entry = self.probation.pop(key)
+                self.protected[key] = entry
+                self.protected_bytes += entry[1]
+                self.demote_protected()
+            else:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: int) -> None:
+        # Caches a value that get() just missed (size = its memory in bytes, see posting_size)
+        with self.lock:
+            if key in self.window or key in self.probation or key in self.protected:
+                return
+            # A posting that can't fit in the main part would evict everything else
+            if size > self.main_max_bytes:
+                self.rejections += 1
+                return
+            self.window[key] = (value, size)
+            self.window_bytes += size
+            while self.window_bytes > self.window_max_bytes and len(self.window) != 0:
+                candidate, entry = self.window.popitem(last=False)
+                self.window_bytes -= entry[1]
+                self.admit(candidate, entry)
+
+    def admit(self, candidate, entry: tuple) -> None:
+        # Moves a posting out of the window into probation, then evicts until the main part fits:
+        # each time, the candidate or the least recently used posting of the main part, whichever is requested less
+        self.probation[candidate] = entry
+        self.main_bytes += entry[1]
+        candidate_frequency = self.sketch.frequency(candidate)
+        while self.main_bytes > self.main_max_bytes:
+            victim = next(iter(self.probation))
+            victim_segment = self.probation
+            # The candidate is the most recently used posting of probation, so it's only first if it's alone there
+            # (then the main part is over its size because of the protected postings)
+            if victim == candidate:
+                victim = next(iter(self.protected))
+                victim_segment = self.protected
+            if self.sketch.frequency(victim) < candidate_frequency:
+                self.remove(victim, victim_segment)
+                self.evictions += 1
+            else:
+                # The candidate isn't requested more often than what it would evict, it's dropped instead
+                self.remove(candidate, self.probation)
+                self.rejections += 1
+                return
+
+    def remove(self, key, segment: OrderedDict) -> None:
+        # Removes a posting from the main part
+        _, size = segment.pop(key)
+        self.main_bytes -= size
+        if segment is self.protected:
+            self.protected_bytes -= size
+
+    def demote_protected(self) -> None:
+        # Moves the least recently used protected postings back to probation once the protected segment is full
+        while self.protected_bytes > self.protected_max_bytes and len(self.protected) > 1:
+            key, entry = self.protected.popitem(last=False)
+            self.protected_bytes -= entry[1]
+            self.probation[key] = entry
+
+    def record(self, key, count: int) -> None:
+        # Counts count past requests of the key (EX: from a query log), without reading anything
+        with self.lock:
+            for _ in range(min(count, MAX_COUNT)):
+                self.sketch.increment(key)
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.rejections = 0
+
+    def clear(self) -> None:
+        with self.lock:
+            self.window.clear()
+            self.probation.clear()
+            self.protected.clear()
+            self.window_bytes = 0
+            self.main_bytes = 0
+            self.protected_bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.window) + len(self.probation) + len(self.protected),
+                    "size_bytes": self.window_bytes + self.main_bytes, "max_bytes": self.max_bytes,
+                    "protected_bytes": self.protected_bytes, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups != 0 else 0.0,
+                    "evictions": self.evictions, "rejections": self.rejections}
+
+def posting_size(value) -> int:
+    # Memory of a (posting, upper bound) pair: the bytes of its doc id and score arrays (NumPy or array module)
+    (doc_ids, scores), _ = value
+    return memoryview(doc_ids).nbytes + memoryview(scores).nbytes + ENTRY_OVERHEAD
@@ -0,0 +1,110 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+# Imported data structures/functions comments:
+# Lookup in/insertion into/move_to_end() of OrderedDict -> O(1)
+# popitem(last=False) of OrderedDict -> O(1)
+
+# Default limits of the query cache
+QUERY_CACHE_SIZE = 1000
+QUERY_CACHE_TTL = 600.0
+# How often (in seconds) the index files are checked for changes
+INDEX_CHECK_INTERVAL = 1.0
+
+class QueryCache:
+    # Bounded LRU cache of query results with a time-to-live
+    # Keys are normalized queries, values are (number of matched docs, ranked doc ids)
+    # The whole cache is dropped when the index changes: signature_function returns something that identifies
+    # the current index files (EX: their sizes and modification times) and is re-checked every few seconds
+    # All operations hold a lock, so the cache can be shared by the threads of the Flask app
+
+    def __init__(self, signature_function, max_entries: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL,
+                 check_interval: float = INDEX_CHECK_INTERVAL) -> None:
+        self.signature_function = signature_function
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_interval = check_interval
+        # <key, (expiry time, value, estimated size in bytes)> pairs, least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.signature = signature_function()
+        self.next_check = time.monotonic() + check_interval
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        # Returns the cached value, or None if the key isn't cached (or its entry expired)
+        now = time.monotonic()
+        with self.lock:
+            self.check_index(now)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value, size = entry
+            if expires_at < now:
+                self.remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        size = estimate_size(key, value)
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, value, size)
+            self.size_bytes += size
+
+            # Evict the least recently used entries once the cache is full
+            while len(self.entries) > self.max_entries:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key) -> None:
+        # Caller must hold the lock
+        _, _, size = self.entries.pop(key)
+        self.size_bytes -= size
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def check_index(self, now: float) -> None:
+        # Caller must hold the lock
+        # Drops every entry if the index files changed since the last check
+        if now < self.next_check:
+            return
+        self.next_check = now + self.check_interval
+        signature = self.signature_function()
+        if signature != self.signature:
+            self.signature = signature
+            self.entries.clear()
+            self.size_bytes = 0
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "max_entries": self.max_entries, "size_bytes": self.size_bytes,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups != 0 else 0.0,
+                    "evictions": self.evictions, "expirations": self.expirations,
+                    "invalidations": self.invalidations}
+
+def estimate_size(key, value) -> int:
+    # Rough memory footprint of an entry: the key's strings plus the ranked doc id list and its ints
+    num_matched, ranked_docs = value
+    key_size = sys.getsizeof(key) + sum(sys.getsizeof(term) for term in key)
+    return key_size + sys.getsizeof(ranked_docs) + len(ranked_docs) * sys.getsizeof(num_matched)
@@ -0,0 +1,40 @@
+import threading
+from collections import deque
+# Log of the queries served by the web server, one query per line (the format of benchmarks/load_test.py)
+# It's replayed at startup to warm the posting cache (see SearchEngine.warm_posting_cache), so a restarted
+# server or a newly published build starts with the postings of the most frequent terms already decoded
+# Imported data structures/functions comments:
+# Appending to a deque with a maxlen -> O(1)
+
+# Number of most recent queries of the log that warm the posting cache
+WARM_QUERIES = 10000
+
+def read_query_log(file_name: str, count: int = WARM_QUERIES) -> list:
+    # Returns the last count queries of the log (none if it doesn't exist yet)
+    try:
+        with open(file_name, "r") as log_file:
+            return [query for query in deque((line.strip() for line in log_file), maxlen=count) if query != ""]
+    except FileNotFoundError:
+        return []
+
+class QueryLog:
+    # Appends the served queries to the log file, shared by the threads of the Flask app
+    # The file is opened in append mode, so several processes (EX: gunicorn workers) can write to the same log
+    # (each query is written with a single write)
+
+    def __init__(self, file_name: str) -> None:
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.log_file = open(file_name, "a", buffering=1)
+
+    def append(self, query: str) -> None:
+        # Queries are logged on a single line
+        query = " ".join(query.split())
+        if query == "":
+            return
+        with self.lock:
+            self.log_file.write(f"{query}\n")
+
+    def close(self) -> None:
+        with self.lock:
+            self.log_file.close()
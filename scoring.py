@@ -0,0 +1,105 @@
+import math
+from array import array
+from index_format import IMPORTANT_WEIGHT, tf_denominator
+# NumPy is optional, without it the postings are rescored in pure Python
+try:
+    import numpy as np
+except ImportError:
+    np = None
+# Scorers of the retrieval system: how the tf scores stored in the postings are turned into the scores that are
+# added up per doc (see rank_docs in search.py)
+# tfidf  -> tf * idf (the default)
+# cosine -> tf * idf / norm of the doc, the cosine between the doc's tf vector and the query's idf vector
+#           (the query's own norm is the same for every doc, so it's left out)
+# bm25   -> Okapi BM25, from the count of the term in the doc and the length of the doc
+# cosine and bm25 need the doc stats written by the indexer (see DOC_STATS_RECORD in index_format.py), which are
+# loaded once into arrays indexed by doc id, so rescoring a posting is a few array operations and reads no file
+# Imported data structures/functions comments:
+# Fancy indexing of a NumPy array with n doc ids -> O(n)
+# math.log()/math.log10() -> O(1)
+
+TFIDF_SCORER = "tfidf"
+COSINE_SCORER = "cosine"
+BM25_SCORER = "bm25"
+SCORERS = (TFIDF_SCORER, COSINE_SCORER, BM25_SCORER)
+DEFAULT_SCORER = TFIDF_SCORER
+
+# BM25 parameters: k1 -> how fast repeated occurrences of a term stop adding to the score
+# b -> how much the score is normalized by the length of the doc (0 = not at all, 1 = fully)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+class DocStats:
+    # The doc stats of every segment, one array per statistic, indexed by doc id
+    # With NumPy, the doc ids of a posting index all of its docs at once
+
+    def __init__(self, segments: list, removed_doc_ids: set, doc_count: int, avg_length: float = None) -> None:
+        size = max(segment.first_doc_id + len(segment.doc_stats[0]) for segment in segments)
+        if np is not None:
+            lengths = np.zeros(size, dtype=np.uint32)
+            important_lengths = np.zeros(size, dtype=np.uint32)
+            term_counts = np.zeros(size, dtype=np.uint32)
+            self.norms = np.zeros(size, dtype=np.float32)
+        else:
+            lengths = array("I", [0]) * size
+            important_lengths = array("I", [0]) * size
+            term_counts = array("I", [0]) * size
+            self.norms = array("f", [0.0]) * size
+        for segment in segments:
+            start = segment.first_doc_id
+            end = start + len(segment.doc_stats[0])
+            for column, segment_column in zip((lengths, important_lengths, term_counts, self.norms), segment.doc_stats):
+                column[start:end] = segment_column
+
+        # The length of a doc counted like the tf of its terms: a token in an important tag counts
+        # 1 + IMPORTANT_WEIGHT times per tag
+        # log10(# of distinct terms) is the denominator of every tf of the doc, 1 for a doc with a single distinct
+        # term (see tf_denominator in index_format.py)
+        if np is not None:
+            self.weighted_lengths = lengths.astype(np.float64) + IMPORTANT_WEIGHT * important_lengths
+            self.log_term_counts = np.where(term_counts > 1, np.log10(np.maximum(term_counts, 1)), 1.0)
+        else:
+            self.weighted_lengths = array("d", [length + IMPORTANT_WEIGHT * important_length
+                                                for length, important_length in zip(lengths, important_lengths)])
+            self.log_term_counts = array("d", [tf_denominator(term_count) for term_count in term_counts])
+
+        # The average length of the docs that can be returned, unless it's given (a shard is given the average of
+        # the whole collection, so that every shard computes the same scores)
+        if avg_length is None:
+            total_length = float(sum(self.weighted_lengths))
+            total_length -= sum(self.weighted_lengths[doc_id] for doc_id in removed_doc_ids if doc_id < size)
+            avg_length = total_length / doc_count if doc_count > 0 else 0.0
+        self.avg_length = avg_length if avg_length > 0 else 1.0
+
+    def cosine(self, posting: tuple, idf: float) -> tuple:
+        doc_ids, scores = posting
+        if np is not None:
+            return doc_ids, np.asarray(scores) * idf / self.norms[np.asarray(doc_ids)]
+        return doc_ids, array("d", [score * idf / self.norms[doc_id] for doc_id, score in zip(doc_ids, scores)])
+
+    def bm25(self, posting: tuple, idf: float) -> tuple:
+        # The postings store tf = (1 + log10(count)) / tf_denominator(# of distinct terms), so the count of the term
+        # in the doc is 10 ** (tf * tf_denominator(# of distinct terms) - 1) (important tokens included, like the
+        # doc length)
+        doc_ids, scores = posting
+        if np is not None:
+            doc_ids_array = np.asarray(doc_ids)
+            counts = np.power(10.0, np.asarray(scores) * self.log_term_counts[doc_ids_array] - 1)
+            length_norms = BM25_K1 * (1 - BM25_B + BM25_B * self.weighted_lengths[doc_ids_array] / self.avg_length)
+            return doc_ids, idf * counts * (BM25_K1 + 1) / (counts + length_norms)
+        bm25_scores = array("d")
+        for doc_id, score in zip(doc_ids, scores):
+            count = 10.0 ** (score * self.log_term_counts[doc_id] - 1)
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.weighted_lengths[doc_id] / self.avg_length)
+            bm25_scores.append(idf * count * (BM25_K1 + 1) / (count + length_norm))
+        return doc_ids, bm25_scores
+
+def bm25_idf(doc_count: int, df: int) -> float:
+    # The idf of BM25, which stays positive for terms in more than half of the docs
+    return math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+def highest_score(scores) -> float:
+    # Upper bound of a rescored posting, used like the max score of the lexicon by top-k retrieval
+    if np is not None:
+        return float(np.max(scores))
+    return max(scores)
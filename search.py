@@ -1,173 +1,798 @@
-from nltk.stem import PorterStemmer
-from nltk.tokenize import RegexpTokenizer
+import os
 import time
+import math
 import heapq
-import ujson
-from collections import defaultdict
-import sys
+import argparse
+from bisect import bisect_left, bisect_right
+from index_format import TF_WEIGHTS, read_manifest, read_tombstones, index_signature
+from segments import (open_segments, concatenate_postings, removed_doc_id_lookup, remove_doc_ids, scale_posting,
+                      intersect_postings, match_phrase, select, union_doc_ids, intersect_doc_ids, keep_doc_ids)
+from query_cache import QueryCache
+from posting_cache import POSTING_CACHE_BYTES, PostingCache, posting_size
+from metrics import QueryTrace, query_metrics
+from text_processing import tokenize, stem_tokens, compute_word_frequencies, load_stem_table
+from snippets import make_snippet
+from scoring import BM25_SCORER, COSINE_SCORER, DEFAULT_SCORER, SCORERS, DocStats, bm25_idf, highest_score
+from completions import SUGGESTIONS, WILDCARD, MAX_WILDCARD_TERMS, merge_completions, is_wildcard
+from spelling import SPELLING_BUDGET, SpellingTimeout, is_correctable, term_df, best_correction
+from collections import defaultdict, Counter
+from itertools import accumulate
+# NumPy is optional, without it documents are scored in pure Python
+try:
+    import numpy as np
+except ImportError:
+    np = None
 # Imported data structures/functions comments:
-# stem() method of PorterStemmer -> O(m * n), m = # of words, n = # avg length of words
-# tokenize() method from RegexpTokenizer -> O(n), where n = # of characters in input string
+# stem_tokens() from text_processing -> O(m * n), m = # of words, n = # avg length of words (O(m) on cache hits)
+# tokenize() from text_processing -> O(n), where n = # of characters in input string
 # defaultdict has the same time complexity as the built in dict() from Python
 # Insertion into/popping from heapq -> O(log n), where n = # of elements in the min-heap
+# bisect_left() on a sorted list -> O(log n), where n = # of elements in the list
+# np.bincount() -> O(n + m), where n = # of postings and m = largest doc id
+# np.argpartition() -> O(n), where n = # of elements in the array
 
-def perform_search(query: list) -> list:
-    # Start timer
-    start_time = time.perf_counter() * 1000
-    
-    # Tokenize the query, get the associated posting list for each term, intersect those lists
-    term_dict = get_token_dict(query)
-    postings = get_postings(term_dict)
-    
-    doc_ids = union(postings)
-    # If there's no doc that has all the terms in the query -> no matched results -> return []
-    if len(doc_ids) == 0:
-        return []
-    
-    # At this point, the response has been retrieved -> record end time
-    # Ranking time IS NOT included in the total time
-    end_time = time.perf_counter() * 1000
-    elapsed_time1 = end_time - start_time
-    
-    # Rank the documents based on the tf-idf score
-    ranked_docs = rank_docs(postings, doc_ids)
+# Number of top results ranked (and cached) per query, even if fewer are requested -> 10 pages of 10 results
+CACHED_RESULTS = 100
 
-    start_time = time.perf_counter() * 1000
-    # Get the associated urls for the ranked documents (include in total time)
-    result_urls = get_urls(ranked_docs)
-    end_time = time.perf_counter() * 1000
-    elapsed_time2 = end_time - start_time
+# Which docs a query matches
+# OR_MODE     -> docs with any of the query terms (the default)
+# AND_MODE    -> docs with every query term
+# PHRASE_MODE -> docs with the query terms next to each other, in query order (needs an index built with
+#                --positions, otherwise it's answered like AND_MODE)
+# A query word ending with * (EX: "comput*") matches any of the most frequent stems with a word starting with it
+# (see completions.py), in every mode (a phrase with a wildcard is answered like AND_MODE)
+OR_MODE = "or"
+AND_MODE = "and"
+PHRASE_MODE = "phrase"
+QUERY_MODES = (OR_MODE, AND_MODE, PHRASE_MODE)
+
+class SearchEngine:
+    # A long-lived query engine, meant to be created once per process (EX: when the Flask app starts)
+    # All of the index metadata is loaded into memory up front and the postings of every segment are memory-mapped,
+    # so answering a query never opens a file
+    # Every attribute is read-only after __init__ and mmap slicing doesn't move a shared file position,
+    # so a single engine can serve concurrent queries from multiple threads without locking
+    # The segments are loaded once, an incremental update or a compaction is picked up by creating a new engine
+
+    def __init__(self, index_dir: str = ".", posting_cache_bytes: int = POSTING_CACHE_BYTES,
+                 champions: bool = False) -> None:
+        self.index_dir = index_dir
+        # Start with the stems saved by the indexer (if it saved them), so common query words are never re-stemmed
+        load_stem_table(index_dir)
+
+        # Doc ids of removed/replaced documents, they're dropped from every posting that is read
+        # (read before the manifest: a compaction publishes its segment first and clears the tombstones after)
+        self.tombstones = read_tombstones(index_dir)
+        self.removed_lookup = removed_doc_id_lookup(self.tombstones)
+
+        # The base segment and the delta segments added by incremental updates, in doc id order
+        # Each segment loads its lexicon (a sorted list of terms, binary searched) and urls, and maps its postings
+        # (and its document store, for the titles and snippets of the results page)
+        self.segments = open_segments(index_dir, read_manifest(index_dir))
+        self.first_doc_ids = [segment.first_doc_id for segment in self.segments]
+        # Postings of indexes built before segments existed already hold tf-idf scores
+        self.weights = self.segments[0].weights
+        # Phrase queries need the token positions of every segment
+        self.has_positions = all(segment.has_positions for segment in self.segments)
+        # With champions, top-k OR queries are answered from the champion lists first, if a segment has them
+        # (see rank_champions)
+        # It's opt-in: tier 1 rankings are approximate and only estimate the number of matched docs, and a page past
+        # the depth of tier 1 is ranked by tier 2, so the pages of a query can disagree on the total and on the order
+        self.use_champions = champions and any(segment.has_champions for segment in self.segments)
+        # Number of documents that can be returned, used for the idf of every term
+        self.doc_count = sum(segment.doc_count for segment in self.segments) - len(self.tombstones)
+        # The lexicon of a shard already holds the document frequencies of the whole collection
+        # -> the idf is computed from the collection's document count, and scores are the same on every shard
+        if self.segments[0].collection_doc_count is not None:
+            self.doc_count = self.segments[0].collection_doc_count
+        # Lengths and norms of every doc, for the cosine and BM25 scorers (None if a segment has no doc stats,
+        # then every query is scored with tf-idf)
+        self.doc_stats = None
+        if all(segment.doc_stats is not None for segment in self.segments):
+            self.doc_stats = DocStats(self.segments, self.tombstones, self.doc_count,
+                                      self.segments[0].collection_avg_length)
+        # Words and stems of every segment, for completions and wildcards
+        self.completion_indexes = [segment.completions for segment in self.segments if segment.completions is not None]
+        # Deletes of the words of every segment, for spelling correction (none if a segment has no spelling index,
+        # then no word is corrected, since a word of that segment would look misspelled)
+        self.spelling_indexes = []
+        if all(segment.spelling is not None for segment in self.segments):
+            self.spelling_indexes = [segment.spelling for segment in self.segments]
+
+        # Ranked results of recent queries, dropped automatically when the index files change
+        self.query_cache = QueryCache(lambda: index_signature(index_dir))
+        # Decoded and weighted postings of the most requested terms (None if posting_cache_bytes is 0)
+        # The engine never changes once loaded, so the cached postings stay valid for as long as it's used
+        self.posting_cache = PostingCache(posting_cache_bytes) if posting_cache_bytes > 0 else None
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+
+    def verify(self) -> None:
+        # Compares the checksums of the files of every segment with their build manifests (reads the whole index)
+        # Opening the engine only compares the file sizes, see Segment.__init__
+        for segment in self.segments:
+            segment.verify()
+
+    def search(self, query: list, start: int = 0, count: int = None, trace: QueryTrace = None,
+               mode: str = OR_MODE, scorer: str = DEFAULT_SCORER) -> tuple:
+        # Returns the total number of matched documents and the urls of the documents ranked [start, start + count)
+        # If count is None, the urls of all matched documents are returned
+        # mode is one of QUERY_MODES, scorer is one of SCORERS (see scoring.py)
+        # The time spent in each stage is recorded in trace (pass one in to see the timings of this query),
+        # and added to the metrics of this process
+        if trace is None:
+            trace = QueryTrace()
+        num_matched, doc_ids, _ = self.search_doc_ids(query, start, count, trace, mode, scorer)
+
+        # Only the urls of the requested slice are looked up
+        start_time = time.perf_counter()
+        urls = self.get_urls(doc_ids)
+        trace.record("urls", start_time)
+
+        trace.finish()
+        query_metrics.observe(trace)
+        return num_matched, urls
+
+    def search_results(self, query: list, start: int = 0, count: int = None, trace: QueryTrace = None,
+                       mode: str = OR_MODE, scorer: str = DEFAULT_SCORER) -> tuple:
+        # Same as search(), but each result is a dictionary with the url, the title and the snippet of the document
+        # (see make_snippet), for the results page
+        # Only the documents of the requested slice are read from the document store and get a snippet
+        if trace is None:
+            trace = QueryTrace()
+        num_matched, doc_ids, tokens = self.search_doc_ids(query, start, count, trace, mode, scorer)
+
+        start_time = time.perf_counter()
+        documents = self.get_documents(doc_ids)
+        start_time = trace.record("urls", start_time)
+        stems = set(tokens)
+        results = [{"url": url, "title": title, "snippet": make_snippet(text, stems)}
+                   for url, title, text in documents]
+        trace.record("snippets", start_time)
+
+        trace.finish()
+        query_metrics.observe(trace)
+        return num_matched, results
+
+    def search_doc_ids(self, query: list, start: int, count: int, trace: QueryTrace, mode: str,
+                       scorer: str = DEFAULT_SCORER) -> tuple:
+        # Returns the total number of matched documents, the doc ids ranked [start, start + count)
+        # and the stemmed query tokens (with the stems that each wildcard stands for)
+        # Tokenize the query, then get the ranked doc ids (from the query cache if possible)
+        # A phrase needs the tokens in query order, the other modes only need the unique terms
+        start_time = time.perf_counter()
+        tokens = get_query_tokens(query)
+        term_dict = compute_word_frequencies(tokens)
+        trace.record("tokenize", start_time)
+        # Wildcards are expanded here, so a sharded index sends the same stems to every shard
+        start_time = time.perf_counter()
+        expansions = self.expand_wildcards(term_dict)
+        if len(expansions) != 0:
+            trace.record("lexicon", start_time)
+            tokens = [stem for token in tokens for stem in expansions.get(token, [token])]
+        end = None if count is None else start + count
+        num_matched, ranked_docs = self.get_ranked_docs(term_dict, end, trace, mode, tokens, scorer, expansions)
+        return num_matched, ranked_docs[start:end], tokens
+
+    def get_ranked_docs(self, term_dict: defaultdict, k: int = None, trace: QueryTrace = None,
+                        mode: str = OR_MODE, tokens: list = None, scorer: str = DEFAULT_SCORER,
+                        expansions: dict = None) -> tuple:
+        # Returns the number of matched docs and (at least) the top k ranked doc ids (all of them if k is None)
+        # The ranking only depends on the mode, the scorer and on which stemmed terms are in the query, so those are
+        # the cache key, EX: "Career fairs" and "fair career" both become ("or", "tfidf", "career", "fair")
+        # (except for a phrase, where the order of the words matters)
+        # A wildcard is part of the key as it was typed (EX: "comput*"), its stems only change with the index
+        if trace is None:
+            trace = QueryTrace()
+        start_time = time.perf_counter()
+        if mode == PHRASE_MODE and not expansions:
+            key = (mode, scorer) + tuple(tokens)
+        else:
+            key = (mode, scorer) + tuple(sorted(term_dict.keys()))
+        cached = self.query_cache.get(key)
+        trace.record("cache", start_time)
+        if cached is not None:
+            num_matched, ranked_docs = cached
+            # The cached ranking is usable if it's long enough for this request (or holds every matched doc)
+            if len(ranked_docs) == num_matched or (k is not None and k <= len(ranked_docs)):
+                trace.count("cache_hits")
+                return cached
+
+        # Rank at least the first CACHED_RESULTS docs, so that the next pages are served from the cache
+        # If a cached ranking was too short, rank twice as many docs, so paging deeper re-ranks only a few times
+        if k is not None:
+            k = max(k, CACHED_RESULTS)
+            if cached is not None:
+                k = max(k, 2 * len(cached[1]))
+        result = self.rank(term_dict, k, trace, mode, tokens, scorer, expansions)
+        self.query_cache.put(key, result)
+        return result
+
+    def rank(self, term_dict: defaultdict, k: int = None, trace: QueryTrace = None, mode: str = OR_MODE,
+             tokens: list = None, scorer: str = DEFAULT_SCORER, expansions: dict = None) -> tuple:
+        # Get the associated posting list (and score upper bound) for each term, then rank the union of those lists
+        # (in AND and phrase mode, the postings only hold the docs that match the whole query)
+        if trace is None:
+            trace = QueryTrace()
+        champions = self.rank_champions(term_dict, k, trace, mode, scorer, expansions)
+        if champions is not None:
+            num_matched, ranked_docs, _ = champions
+            return num_matched, ranked_docs
+        return rank_term_postings(self.get_query_postings(term_dict, trace, mode, tokens, scorer, expansions), k,
+                                  trace)
+
+    def rank_with_scores(self, term_dict: defaultdict, k: int = None, trace: QueryTrace = None,
+                         mode: str = OR_MODE, tokens: list = None, scorer: str = DEFAULT_SCORER,
+                         expansions: dict = None) -> tuple:
+        # Same as rank(), plus the (rounded) score of each ranked doc
+        # Used by the shards of a sharded index, whose rankings are merged by score (see shards.py)
+        if trace is None:
+            trace = QueryTrace()
+        champions = self.rank_champions(term_dict, k, trace, mode, scorer, expansions)
+        if champions is not None:
+            num_matched, ranked_docs, term_postings = champions
+        else:
+            term_postings = self.get_query_postings(term_dict, trace, mode, tokens, scorer, expansions)
+            num_matched, ranked_docs = rank_term_postings(term_postings, k, trace)
+        start_time = time.perf_counter()
+        scores = score_docs([posting for posting, _ in term_postings], ranked_docs)
+        trace.record("rank", start_time)
+        return num_matched, ranked_docs, scores
+
+    def rank_champions(self, term_dict: defaultdict, k: int, trace: QueryTrace, mode: str = OR_MODE,
+                       scorer: str = DEFAULT_SCORER, expansions: dict = None):
+        # Tier 1 of a top-k OR query: ranks the champion lists of the query terms (and the postings of the terms without
+        # one, which are short) instead of their full postings
+        # The score of a doc only adds up the champion lists it's in, so the top k is approximate: a doc with a high
+        # total score but no top score for any frequent term is missed (see benchmarks/bench_champions.py for the
+        # recall), in exchange for decoding 1 / CHAMPION_FRACTION of the posting of each frequent term
+        # Returns the estimated number of matched docs, the ranked doc ids and the term postings, or None if the query
+        # isn't answered from tier 1: it isn't a top-k OR query, none of its terms has a champion list, or tier 1 holds
+        # fewer than k docs (then tier 2, the full postings, is ranked instead)
+        if not self.use_champions or k is None or mode != OR_MODE or expansions:
+            return None
+        start_time = time.perf_counter()
+        dfs = []
+        has_champions = False
+        for term in term_dict.keys():
+            df = 0
+            for segment in self.segments:
+                term_id = segment.find_term(term)
+                if term_id != -1:
+                    df += segment.dfs[term_id]
+                    has_champions = has_champions or segment.has_champion_list(term_id)
+            dfs.append(min(df, self.doc_count))
+        trace.record("lexicon", start_time)
+        if not has_champions:
+            return None
+
+        term_postings = self.get_term_postings(term_dict, trace, scorer, champions=True)
+        num_matched, ranked_docs = rank_term_postings(term_postings, k, trace)
+        if num_matched < k:
+            trace.count("tier2_fallbacks")
+            return None
+        trace.count("tier1_queries")
+        # Without the full postings, the number of docs with any of the terms is estimated as if the terms were
+        # independent: N * (1 - product of (1 - df / N))
+        missing = 1.0
+        for df in dfs:
+            missing *= 1 - df / self.doc_count
+        return max(num_matched, round(self.doc_count * (1 - missing))), ranked_docs, term_postings
+
+    def get_postings(self, term_dict: defaultdict) -> list:
+        postings = [posting for posting, _ in self.get_term_postings(term_dict, QueryTrace())]
+
+        # Each posting list in postings corresponds to a term, as it appears in the query
+        # A posting list is a pair of parallel arrays (doc ids sorted ascending, tf-idf scores)
+        # EX: If query is "Antartica global warming", the postings will look like this:
+        # [posting list for "Antartica", posting list for "global", posting list for "warming"]
+        return postings
+
+    def get_query_postings(self, term_dict: defaultdict, trace: QueryTrace, mode: str = OR_MODE,
+                           tokens: list = None, scorer: str = DEFAULT_SCORER, expansions: dict = None) -> list:
+        # Returns a (posting, upper bound of its scores) pair for each query term, holding the docs that the mode matches
+        if expansions:
+            return self.get_wildcard_postings(term_dict, trace, mode, scorer, expansions)
+        phrase = None
+        if mode == PHRASE_MODE and self.has_positions and len(tokens) > 1:
+            # The index (in term_dict) of each word of the phrase
+            term_indexes = {term: i for i, term in enumerate(term_dict.keys())}
+            phrase = [term_indexes[token] for token in tokens]
+        if phrase is None and (mode == OR_MODE or len(term_dict) <= 1):
+            return self.get_term_postings(term_dict, trace, scorer)
+        return self.get_conjunctive_postings(term_dict, trace, phrase, scorer)
+
+    def get_conjunctive_postings(self, term_dict: defaultdict, trace: QueryTrace, phrase: list = None,
+                                 scorer: str = DEFAULT_SCORER) -> list:
+        # Same as get_term_postings, but each posting only keeps the docs that have every term (and the phrase)
+        # Every posting ends up with the same doc ids, so ranking their union ranks the docs matching the whole query
+        terms = list(term_dict.keys())
+        start_time = time.perf_counter()
+        # term_ids[s][i] = position of the i-th term in the lexicon of segment s (-1 if the segment doesn't have it)
+        term_ids = [[segment.find_term(term) for term in terms] for segment in self.segments]
+        trace.record("lexicon", start_time)
+        dfs = [sum(segment.dfs[segment_term_ids[i]] for segment, segment_term_ids in zip(self.segments, term_ids)
+                   if segment_term_ids[i] != -1) for i in range(len(terms))]
+        # A term that isn't in the index -> no doc has every term
+        if 0 in dfs:
+            return []
+
+        # The segments hold different docs, so each segment is intersected on its own
+        removed_lookup = self.removed_lookup if len(self.tombstones) != 0 else None
+        segment_matches = []
+        for segment, segment_term_ids in zip(self.segments, term_ids):
+            if -1 in segment_term_ids:
+                continue
+            doc_ids, matches = intersect_postings(segment, segment_term_ids, removed_lookup, trace)
+            if len(doc_ids) != 0 and phrase is not None:
+                found = match_phrase(segment, segment_term_ids, matches, phrase, trace)
+                doc_ids = select(doc_ids, found)
+                matches = [(positions, select(scores, found)) for positions, scores in matches]
+            if len(doc_ids) != 0:
+                segment_matches.append((doc_ids, matches))
+        if len(segment_matches) == 0:
+            return []
+
+        start_time = time.perf_counter()
+        term_postings = []
+        for i in range(len(terms)):
+            posting = concatenate_postings([(doc_ids, matches[i][1]) for doc_ids, matches in segment_matches])
+            max_score = max(segment.max_scores[segment_term_ids[i]]
+                            for segment, segment_term_ids in zip(self.segments, term_ids) if segment_term_ids[i] != -1)
+            term_postings.append(self.apply_idf(posting, dfs[i], max_score, scorer))
+        trace.record("segments", start_time)
+        return term_postings
+
+    def get_wildcard_postings(self, term_dict: defaultdict, trace: QueryTrace, mode: str, scorer: str,
+                              expansions: dict) -> list:
+        # Same as get_query_postings, for a query with wildcards: each query term stands for a group of stems
+        # (the stems of a wildcard, or the term itself), and a doc matches a group if it has any of its stems
+        # In OR mode, the stems of every group are simply added to the query
+        groups = [expansions.get(term, [term]) for term in term_dict.keys()]
+        if mode == OR_MODE:
+            return self.get_term_postings(dict.fromkeys(stem for group in groups for stem in group), trace, scorer)
+
+        # In AND (and phrase) mode, only the docs that match every group are kept, in the postings of every stem
+        # (the postings of the stems are read in full, there are at most MAX_WILDCARD_TERMS of them per wildcard)
+        group_postings = [self.get_term_postings(dict.fromkeys(group), trace, scorer) for group in groups]
+        if any(len(term_postings) == 0 for term_postings in group_postings):
+            return []
+        start_time = time.perf_counter()
+        matched = None
+        for term_postings in group_postings:
+            doc_ids = union_doc_ids([posting for posting, _ in term_postings])
+            matched = doc_ids if matched is None else intersect_doc_ids(matched, doc_ids)
+        term_postings = []
+        for group_term_postings in group_postings:
+            for posting, upper_bound in group_term_postings:
+                posting = keep_doc_ids(posting, matched)
+                if len(posting[0]) != 0:
+                    term_postings.append((posting, upper_bound))
+        trace.record("intersect", start_time)
+        return term_postings
+
+    def get_term_postings(self, term_dict: defaultdict, trace: QueryTrace, scorer: str = DEFAULT_SCORER,
+                          champions: bool = False) -> list:
+        # Returns a (posting, upper bound of its scores) pair for each unique query term
+        # Terms that aren't in any segment (or only in removed documents) don't have a posting, so they're left out
+        term_postings = [self.get_term_posting(term, trace, scorer, champions) for term in term_dict.keys()]
+        return [term_posting for term_posting in term_postings if term_posting is not None]
+
+    def get_term_posting(self, term: str, trace: QueryTrace, scorer: str = DEFAULT_SCORER, champions: bool = False):
+        # Gathers the term's posting from every segment, returns (posting with the scorer's scores, highest score)
+        # or None
+        # With champions, the champion list of the term is read instead of its posting in the segments that have one
+        # The weighted posting is cached (see posting_cache.py), the segments are only read on a cache miss
+        start_time = time.perf_counter()
+        term_ids = [segment.find_term(term) for segment in self.segments]
+        trace.record("lexicon", start_time)
+        if all(term_id == -1 for term_id in term_ids):
+            return None
+        key = self.posting_key(term, term_ids, scorer, champions)
+        champions = key[2]
+        if self.posting_cache is not None:
+            posting = self.posting_cache.get(key)
+            if posting is not None:
+                trace.count("posting_cache_hits")
+                return posting
+            trace.count("posting_cache_misses")
+
+        segment_postings = []
+        df = 0
+        max_score = 0.0
+        for segment, term_id in zip(self.segments, term_ids):
+            if term_id != -1:
+                posting = segment.read_champions(term_id, trace) if champions else None
+                if posting is None:
+                    posting = segment.read_posting(term_id, trace)
+                segment_postings.append(posting)
+                df += segment.dfs[term_id]
+                max_score = max(max_score, segment.max_scores[term_id])
+
+        start_time = time.perf_counter()
+        posting = self.weigh_posting(segment_postings, df, max_score, scorer)
+        trace.record("segments", start_time)
+        if posting is not None and self.posting_cache is not None:
+            self.posting_cache.put(key, posting, posting_size(posting))
+        return posting
+
+    def posting_key(self, term: str, term_ids: list, scorer: str, champions: bool) -> tuple:
+        # Key of the weighted posting of a term in the posting cache
+        # A term without a champion list has the same posting with or without champions
+        champions = champions and any(segment.has_champion_list(term_id)
+                                      for segment, term_id in zip(self.segments, term_ids) if term_id != -1)
+        return term, scorer, champions
+
+    def warm_posting_cache(self, queries: list) -> int:
+        # Reads the postings of the most frequent terms of past queries (EX: the lines of a query log) into the
+        # posting cache, until they would fill it, and counts how often each term was requested (so the warmed postings
+        # aren't evicted by the first rare terms)
+        # The postings are read as the default query reads them (OR mode, default scorer)
+        # Returns the number of postings read
+        if self.posting_cache is None:
+            return 0
+        term_counts = Counter()
+        for query in queries:
+            term_counts.update(get_token_dict(query.split()).keys())
+        warmed = 0
+        warmed_bytes = 0
+        trace = QueryTrace()
+        for term, count in term_counts.most_common():
+            if warmed_bytes >= self.posting_cache.max_bytes:
+                break
+            term_ids = [segment.find_term(term) for segment in self.segments]
+            self.posting_cache.record(self.posting_key(term, term_ids, DEFAULT_SCORER, self.use_champions), count)
+            posting = self.get_term_posting(term, trace, DEFAULT_SCORER, self.use_champions)
+            if posting is not None:
+                warmed += 1
+                warmed_bytes += posting_size(posting)
+        # The hit rate only counts the lookups of queries
+        self.posting_cache.reset_counters()
+        return warmed
+
+    def weigh_posting(self, segment_postings: list, df: int, max_score: float, scorer: str = DEFAULT_SCORER):
+        # Joins the postings of the segments, drops the removed docs and applies the idf
+        posting = concatenate_postings(segment_postings)
+        if len(self.tombstones) != 0:
+            posting = remove_doc_ids(posting, self.removed_lookup)
+            if len(posting[0]) == 0:
+                return None
+        return self.apply_idf(posting, df, max_score, scorer)
+
+    def apply_idf(self, posting: tuple, df: int, upper_bound: float, scorer: str = DEFAULT_SCORER) -> tuple:
+        # Turns the tf scores of a posting (and their upper bound) into the scores of the scorer
+        # (tf-idf scores if the scorer needs doc stats that the index doesn't have)
+        if self.weights != TF_WEIGHTS:
+            # Postings written before segments existed already hold tf-idf scores
+            return posting, upper_bound
+        # The idf is computed from the document frequencies of all segments
+        # The df of a segment still counts its removed documents until the segments are compacted,
+        # so it's capped at the number of documents (which keeps the idf >= 0)
+        df = min(df, self.doc_count)
+        if scorer == BM25_SCORER and self.doc_stats is not None:
+            posting = self.doc_stats.bm25(posting, bm25_idf(self.doc_count, df))
+            return posting, highest_score(posting[1])
+        idf = math.log10(self.doc_count / df)
+        if scorer == COSINE_SCORER and self.doc_stats is not None:
+            posting = self.doc_stats.cosine(posting, idf)
+            return posting, highest_score(posting[1])
+        # The upper bound of the tf scores is in the lexicon, so the posting doesn't have to be scanned for it
+        return scale_posting(posting, idf), upper_bound * idf
+
+    def expand_wildcards(self, term_dict: defaultdict) -> dict:
+        # Returns the stems that each wildcard of the query stands for (EX: "comput*" -> ["comput", "compani", ...]),
+        # the MAX_WILDCARD_TERMS most frequent stems with a word starting with its prefix
+        return {term: [stem for _, stem, _ in self.complete(term[:-len(WILDCARD)], MAX_WILDCARD_TERMS)]
+                for term in term_dict.keys() if is_wildcard(term)}
+
+    def complete(self, prefix: str, count: int = SUGGESTIONS) -> list:
+        # Returns the (word, stem, df) of the count most frequent stems with a word starting with the prefix
+        if prefix == "":
+            return []
+        return merge_completions([completion_index.complete(prefix.lower(), count)
+                                  for completion_index in self.completion_indexes], count)
+
+    def suggest(self, text: str, count: int = SUGGESTIONS) -> list:
+        # Search-as-you-type: returns the count completions of the last (partly typed) word of the text,
+        # each as the whole text with that word completed (EX: "career fa" -> "career fair", "career faculty", ...)
+        tokens = tokenize(text)
+        if len(tokens) == 0 or not text.endswith(tokens[-1]):
+            return []
+        head = text[:len(text) - len(tokens[-1])]
+        return [{"query": head + word, "word": word, "df": df} for word, _, df in self.complete(tokens[-1], count)]
+
+    def correct_query(self, query: list, trace: QueryTrace = None, budget: float = SPELLING_BUDGET) -> tuple:
+        # Returns the query with its misspelled words corrected (None if it has none), and the "did you mean" query
+        # (None if it's the same as the query), EX: ["carrer", "fiar"] -> ["career", "fair"]
+        # A word that isn't in the index is misspelled, and the search is meant to use its correction instead
+        # A word of the index is only replaced in the "did you mean" query, by a much more frequent word
+        # Correcting stops after budget seconds, the word being corrected and the words left are kept as typed
+        # (a correction picked from the candidates checked so far could be farther than one that wasn't checked)
+        if trace is None:
+            trace = QueryTrace()
+        start_time = time.perf_counter()
+        deadline = start_time + budget
+        corrected = list(query)
+        suggested = list(query)
+        try:
+            for i, term in enumerate(query):
+                # A wildcard completes what was typed (see get_query_tokens)
+                if is_wildcard(term):
+                    continue
+                for token in tokenize(term):
+                    word = token.lower()
+                    if len(self.spelling_indexes) == 0 or not is_correctable(word):
+                        continue
+                    if time.perf_counter() > deadline:
+                        raise SpellingTimeout(word)
+                    df = term_df(self.spelling_indexes, stem_tokens([token])[0])
+                    correction = best_correction(self.spelling_indexes, word, df, deadline)
+                    if correction is None:
+                        continue
+                    suggested[i] = suggested[i].replace(token, correction, 1)
+                    if df == 0:
+                        corrected[i] = corrected[i].replace(token, correction, 1)
+        except SpellingTimeout:
+            trace.count("spelling_timeouts")
+        trace.record("spelling", start_time)
+        return (corrected if corrected != query else None), (suggested if suggested != query else None)
+
+    def get_urls(self, doc_ids: list) -> list:
+        # Each segment holds the urls of its own doc ids -> find the last segment starting at or before the doc id
+        return [self.segments[bisect_right(self.first_doc_ids, doc_id) - 1].get_url(doc_id) for doc_id in doc_ids]
+
+    def get_documents(self, doc_ids: list) -> list:
+        # Returns (url, title, text) of each doc, from the document store of its segment
+        return [self.segments[bisect_right(self.first_doc_ids, doc_id) - 1].get_document(doc_id)
+                for doc_id in doc_ids]
+
+    def docstore_stats(self) -> list:
+        # Block cache statistics of the document store of each segment
+        return [segment.docstore.stats() for segment in self.segments if segment.docstore is not None]
+
+    def posting_cache_stats(self) -> list:
+        return [self.posting_cache.stats()] if self.posting_cache is not None else []
+
+# Index shared by the module-level functions below, opened on first use
+default_index = None
+
+def get_default_index():
+    # Returns the LiveIndex of the current directory, which follows the published build (see live_index.py)
+    global default_index
+    if default_index is None:
+        # Imported here, since live_index.py (through shards.py) builds on this module
+        from live_index import LiveIndex
+        default_index = LiveIndex()
+    return default_index
+
+def get_default_engine() -> SearchEngine:
+    # The engine currently serving the default index
+    return get_default_index().engine
+
+def perform_search(query: list, mode: str = OR_MODE, scorer: str = DEFAULT_SCORER) -> list:
+    # The engine (and the index metadata it holds) is only loaded on the first search
+    # The trace times every stage of the search, from tokenizing the query to looking up the urls
+    # (it starts once the engine is loaded, so the response time of the first search doesn't include loading it)
+    with get_default_index().acquire() as engine:
+        trace = QueryTrace()
+        _, result_urls = engine.search(query, trace=trace, mode=mode, scorer=scorer)
+        index_dir = engine.index_dir
+
+    # Log the time for reference (this is only done for searches from the command line, the web server
+    # never writes files per query, its timings are available at /metrics)
+    with open(os.path.join(index_dir, "txt/time.txt"), "w") as time_file:
+        time_file.write(f"Response time: {trace.total() * 1000} ms\n")
+        for stage, milliseconds in trace.to_dict()["stages_ms"].items():
+            time_file.write(f"  {stage}: {milliseconds} ms\n")
 
-    # Log the time for reference
-    with open("txt/time.txt", "w") as time_file:
-        time_file.write(f"Response time: {elapsed_time1 + elapsed_time2} ms\n")
-    
     return result_urls
 
-def get_token_dict(query: list) -> defaultdict:
-    tokenizer = RegexpTokenizer(r'[a-zA-Z0-9]+')
-    porter_stemmer = PorterStemmer()
-    
-    # Tokenize and stem each term in the query
+def get_query_tokens(query: list) -> list:
+    # Tokenize and stem each term in the query (the same way the indexer does), keeping the query order
+    # A term ending with a wildcard keeps its last token as an unstemmed, lowercase prefix (EX: "Comput*" -> "comput*")
     stemmed_tokens = []
     for term in query:
-        terms = tokenizer.tokenize(term)
-        for token in terms:
-            stemmed_tokens.append(porter_stemmer.stem(token))
+        tokens = tokenize(term)
+        if is_wildcard(term) and len(tokens) != 0:
+            stemmed_tokens.extend(stem_tokens(tokens[:-1]))
+            stemmed_tokens.append(tokens[-1].lower() + WILDCARD)
+        else:
+            stemmed_tokens.extend(stem_tokens(tokens))
+    return stemmed_tokens
 
+def get_token_dict(query: list) -> defaultdict:
     # Call compute_word_frequencies to get dictionary of <token, frequency> pairs
-    return compute_word_frequencies(stemmed_tokens)
+    return compute_word_frequencies(get_query_tokens(query))
 
-def compute_word_frequencies(tokens: list) -> defaultdict:
-    # Returns a dictionary that maps the tokens in the list to the number of their occurrences
-    word_count = defaultdict(int)
-    for t in tokens:
-        word_count[t] += 1
-    return word_count
+def rank_term_postings(term_postings: list, k: int, trace: QueryTrace) -> tuple:
+    # Ranks the union of the postings, returns the number of matched docs and the ranked doc ids (top k if k is given)
+    # term_postings holds a (posting, upper bound of its scores) pair for each query term
+    if len(term_postings) == 0:
+        return 0, []
+    postings = [posting for posting, _ in term_postings]
+    start_time = time.perf_counter()
 
-def get_postings(term_dict: defaultdict) -> list:
-    postings = []
+    # Rank the documents based on the tf-idf score
+    # With NumPy, all postings are scored at once with vectorized operations
+    if np is not None:
+        result = rank_docs_numpy(postings, k)
+        trace.record("rank", start_time)
+        return result
 
-    # Load the char_offsets file into a dictionary
-    with open("json/char_offsets.json", "r") as offset_file:
-        char_offsets = ujson.load(offset_file)
-    
-    # Open the complete index and term_offsets txt files
-    with open('txt/complete_index.txt', 'rb') as index_file, open('txt/term_offsets.txt', 'rb') as offset_file:
-        # Iterate through each unique term in the query
-        for term in term_dict.keys():
-            # Get the first char of the term and its associated start & end position in the offset file
-            start_pos, end_pos = char_offsets[term[0]]
-
-            # Jump to the start position in the offset file
-            offset_file.seek(start_pos)
-            bounds = [0, 0]
-            # Continue while the current position in the offset file is <= end position
-            while offset_file.tell() <= end_pos:
-                # Get the line in the offset file, split into a list with two elements
-                line = offset_file.readline().decode('utf-8').strip().split(":")
-                # 1st element = word, 2nd element = associated position in the complete index
-                word = line[0]
-                pos = int(line[1])
-        
-                # If word comes before term lexicographically, set/reset lower bound
-                # If word comes after term lexicographically, set upper bound --> break out of loop
-                # If word is the term, the lower and upper bound are the same --> break out of loop
-                if word < term:
-                    bounds[0] = pos
-                elif term < word:
-                    bounds[1] = pos
-                    break
-                else:
-                    bounds = [pos, pos]
-                    break
-            
-            # Jump to the start position in the complete index using the lower bound
-            index_file.seek(bounds[0])
-            # Continue while the current position in the complete index file is <= upper bound
-            while index_file.tell() <= bounds[1]:
-                line = index_file.readline().decode('utf-8').strip().split("|")
-                word = line[0]
-                
-                # If match found in the complete index, append that term's posting to the list of postings
-                if word == term:
-                    postings.append(ujson.loads(line[1]))
-                    break
-    
-    # Each posting list in postings corresponds to a term, as it appears in the query
-    # A posting list is a dictionary of <doc_id, tf-idf> pairs
-    # EX: If query is "Antartica global warming", the postings will look like this:
-    # [posting list for "Antartica", posting list for "global", posting list for "warming"]
-    return postings
+    doc_ids = union(postings)
+    start_time = trace.record("union", start_time)
+    # If no doc has any of the terms in the query -> no matched results
+    if len(doc_ids) == 0:
+        return 0, []
+
+    # When only the top k documents are needed, a bounded heap skips ranking the rest
+    if k is None or k >= len(doc_ids):
+        ranked_docs = rank_docs(postings, doc_ids)
+    else:
+        upper_bounds = [upper_bound for _, upper_bound in term_postings]
+        ranked_docs = top_k_docs(postings, upper_bounds, k)
+    trace.record("rank", start_time)
+    return len(doc_ids), ranked_docs
+
+def score_docs(postings: list, doc_ids: list) -> list:
+    # Returns the score of each of the given docs (rounded like the rankings), adding up the postings in order
+    # Each doc id is binary searched in each posting, so this is cheap for the few docs of a top k
+    scores = [0.0] * len(doc_ids)
+    for posting_doc_ids, posting_scores in postings:
+        if np is not None:
+            positions = np.searchsorted(posting_doc_ids, doc_ids)
+            for i, pos in enumerate(positions.tolist()):
+                if pos < len(posting_doc_ids) and posting_doc_ids[pos] == doc_ids[i]:
+                    scores[i] += float(posting_scores[pos])
+        else:
+            for i, doc_id in enumerate(doc_ids):
+                pos = bisect_left(posting_doc_ids, doc_id)
+                if pos < len(posting_doc_ids) and posting_doc_ids[pos] == doc_id:
+                    scores[i] += posting_scores[pos]
+    return [round(score, 5) for score in scores]
 
 def union(postings: list) -> set:
     # Get the union of all the doc ids --> Boolean OR retrieval
     all_doc_ids = set()
     
-    for posting in postings:
-        current_doc_ids = set(posting.keys())
-        all_doc_ids |= current_doc_ids
+    for doc_ids, _ in postings:
+        all_doc_ids.update(doc_ids.tolist())
 
-    # Remove the doc id "0" (b/c this isn't an actual document)
-    # "0" just stored the length of the posting list
-    all_doc_ids.remove("0")
     return all_doc_ids
 
 def rank_docs(postings: list, doc_ids: set) -> list:
     # Initialize a dictionary that will store <doc_id, total score> pairs
-    doc_scores = dict()
+    doc_scores = dict.fromkeys(doc_ids, 0)
     # Sums the tf-idf scores of ALL query terms for each document (each term has an associated posting list)
-    # EX: If doc_ids = {"2", "4", "7"}, and postings look like this...
-    # postings = [{"2": 1, "3": 7, "4": 4, "7": 3, "9": 2},
-    #              {"2": 2, "4": 10, "7": 12},
-    #               {"2": 1, "4": 1, "5": 4, 7": 9, "9": 1, "12": 9}]
+    # EX: If doc_ids = {2, 3, 4, 5, 7, 9, 12}, and postings look like this...
+    # postings = [([2, 3, 4, 7, 9], [1, 7, 4, 3, 2]),
+    #             ([2, 4, 7], [2, 10, 12]),
+    #             ([2, 4, 5, 7, 9, 12], [1, 1, 4, 9, 1, 9])]
     # Then, the scores for doc_ids 
-    # "2" = 1 + 2 + 1 = 4,
-    # "3" = 7,
-    # "4" = 4 + 10 + 1 = 15,
-    # "5" = 4,
-    # "7": 3 + 12 + 9 = 24,
-    # "9": 2 + 1 = 3,
-    # "12": 9
-    for doc_id in doc_ids:
-        doc_scores[int(doc_id)] = round(sum(posting.get(doc_id, 0) for posting in postings), 5)
-
-    # Sort the doc ids by score, descending
-    sorted_by_scores = [key for key, _ in sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)]
+    # 2 = 1 + 2 + 1 = 4,
+    # 3 = 7,
+    # 4 = 4 + 10 + 1 = 15,
+    # 5 = 4,
+    # 7: 3 + 12 + 9 = 24,
+    # 9: 2 + 1 = 3,
+    # 12: 9
+    for posting_doc_ids, scores in postings:
+        for doc_id, score in zip(posting_doc_ids.tolist(), scores.tolist()):
+            doc_scores[doc_id] += score
+    doc_scores = {doc_id: round(score, 5) for doc_id, score in doc_scores.items()}
+
+    # Sort the doc ids by score, descending (ties are broken by doc id, so pages stay consistent across queries)
+    sorted_by_scores = [key for key, _ in sorted(doc_scores.items(), key=lambda x: (-x[1], x[0]))]
     return sorted_by_scores
 
-def get_urls(doc_ids: list) -> list:
-    result_urls = []
-    with open("txt/document_mapping.txt", 'r') as map_file:
-        content = map_file.read().strip()
-        # Split the urls by newline -> Index of content list == doc_id - 1
-        content = content.split("\n")
-        for doc_id in doc_ids:
-            result_urls.append(content[doc_id - 1])
-    return result_urls
+def top_k_docs(postings: list, upper_bounds: list, k: int) -> list:
+    # Returns the k highest scoring doc ids, in the same order as rank_docs, without scoring every document
+    # Uses the MaxScore algorithm: the posting lists are walked together in doc id order (document-at-a-time)
+    # while a min-heap keeps the best k documents seen so far
+    # Once the heap is full, its smallest score is a threshold that a document has to beat
+    # Each term's upper bound (its highest score, precomputed by the indexer) tells which lists can't beat it:
+    # if the bounds of the lowest-bound terms add up to <= threshold, a document that only appears in those
+    # "non-essential" lists can't make the top k, so candidates are only taken from the other "essential" lists
+    # and the non-essential lists are binary searched for each candidate (or skipped if it can't win anyway)
+
+    # Order the terms by upper bound, smallest first
+    order = sorted(range(len(postings)), key=lambda i: upper_bounds[i])
+    doc_lists = [postings[i][0].tolist() for i in order]
+    score_lists = [postings[i][1].tolist() for i in order]
+    # prefix_bounds[i] = sum of the upper bounds of terms 0..i = best score a doc only in lists 0..i could get
+    prefix_bounds = list(accumulate(upper_bounds[i] for i in order))
+
+    num_terms = len(doc_lists)
+    pointers = [0] * num_terms
+    # Lists before first_essential are non-essential
+    first_essential = 0
+    # Min-heap of (score, -doc_id), the root is the weakest document in the current top k
+    # (among equal scores, the larger doc id is weaker, the same tie-break as rank_docs)
+    top_docs = []
+    threshold = -1.0
+
+    while first_essential < num_terms:
+        # The next candidate is the smallest unvisited doc id in the essential lists
+        candidate = -1
+        for i in range(first_essential, num_terms):
+            if pointers[i] < len(doc_lists[i]):
+                doc_id = doc_lists[i][pointers[i]]
+                if candidate == -1 or doc_id < candidate:
+                    candidate = doc_id
+        if candidate == -1:
+            break
+
+        # Add up the candidate's scores in the essential lists
+        score = 0.0
+        for i in range(first_essential, num_terms):
+            pos = pointers[i]
+            if pos < len(doc_lists[i]) and doc_lists[i][pos] == candidate:
+                score += score_lists[i][pos]
+                pointers[i] = pos + 1
+
+        # Look the candidate up in the non-essential lists, highest bound first
+        # Stop as soon as the remaining lists can't lift the score above the threshold
+        for i in range(first_essential - 1, -1, -1):
+            if score + prefix_bounds[i] <= threshold:
+                break
+            pos = bisect_left(doc_lists[i], candidate, pointers[i])
+            pointers[i] = pos
+            if pos < len(doc_lists[i]) and doc_lists[i][pos] == candidate:
+                score += score_lists[i][pos]
+
+        entry = (round(score, 5), -candidate)
+        if len(top_docs) < k:
+            heapq.heappush(top_docs, entry)
+        elif entry > top_docs[0]:
+            heapq.heapreplace(top_docs, entry)
+
+        # Candidates come in increasing doc id order, so a later doc that ties the threshold can never win
+        # -> lists whose bounds add up to <= threshold become non-essential
+        if len(top_docs) == k:
+            threshold = top_docs[0][0]
+            while first_essential < num_terms and prefix_bounds[first_essential] <= threshold:
+                first_essential += 1
+
+    # Sort by score descending, then doc id ascending
+    return [-neg_doc_id for _, neg_doc_id in sorted(top_docs, reverse=True)]
+
+
+def rank_docs_numpy(postings: list, k: int = None) -> tuple:
+    # Vectorized version of rank_docs (+ top_k_docs), returns the number of matched docs and the ranked doc ids
+    # If k is given, only the k highest scoring doc ids are returned
+    # The ranking is the same as rank_docs: score descending (rounded to 5 decimals), then doc id ascending
+    doc_ids = np.concatenate([np.asarray(posting_doc_ids, dtype=np.int64) for posting_doc_ids, _ in postings])
+    scores = np.concatenate([np.asarray(posting_scores, dtype=np.float64) for _, posting_scores in postings])
+
+    # Scatter-add every posting into a dense accumulator indexed by doc id
+    # bincount adds the postings in order, so each sum is computed in the same order as rank_docs
+    # EX: doc_ids = [2, 4, 2], scores = [1, 10, 2] -> accumulator = [0, 0, 3, 0, 10]
+    accumulator = np.bincount(doc_ids, weights=scores)
+    matched = np.zeros(len(accumulator), dtype=bool)
+    matched[doc_ids] = True
+
+    # Doc ids of the matched docs (ascending) and their total scores
+    matched_doc_ids = np.flatnonzero(matched)
+    matched_scores = np.round(accumulator[matched_doc_ids], 5)
+    num_matched = len(matched_doc_ids)
+
+    selected = np.arange(num_matched)
+    if k is not None and k < num_matched:
+        # argpartition finds the k-th highest score in linear time without sorting everything
+        kth_score = matched_scores[np.argpartition(matched_scores, num_matched - k)[num_matched - k]]
+        # Keep everything above it, and fill up the rest with the smallest doc ids that tie with it
+        above = np.flatnonzero(matched_scores > kth_score)
+        ties = np.flatnonzero(matched_scores == kth_score)[:k - len(above)]
+        selected = np.concatenate([above, ties])
 
+    # Sort the selected docs by score descending, then doc id ascending (lexsort uses the last key first)
+    order = np.lexsort((matched_doc_ids[selected], -matched_scores[selected]))
+    return num_matched, matched_doc_ids[selected][order].tolist()
 
-def show_results(result_urls: list) -> None:
+def show_results(result_urls: list, index_dir: str = ".") -> None:
+    # index_dir -> the directory of the build that was searched, which holds the txt directory
     if len(result_urls) == 0:
         print("No matched results\n")
     else:
@@ -179,12 +804,19 @@ def show_results(result_urls: list) -> None:
         print(top_10)
 
     # Store the remaining results inside a file
-    with open("txt/search_results.txt", "w") as result_file:
+    with open(os.path.join(index_dir, "txt/search_results.txt"), "w") as result_file:
         for i, url in enumerate(result_urls, start=1):
             result_file.write(f"{i} | {url}\n")
 
 if __name__ == '__main__':
-    query = sys.argv[1:]
+    parser = argparse.ArgumentParser(description="Searches the index from the command line")
+    parser.add_argument("--mode", choices=QUERY_MODES, default=OR_MODE,
+                        help="match docs with any query term (or), every term (and) or the exact phrase (phrase)")
+    parser.add_argument("--scorer", choices=SCORERS, default=DEFAULT_SCORER,
+                        help="score docs by tf-idf, cosine similarity or BM25 (cosine and bm25 need doc stats)")
+    parser.add_argument("query", nargs="+")
+    args = parser.parse_args()
+    query = args.query
     print(f"?{query}?")
-    result_urls = perform_search(query)
-    show_results(result_urls)
+    result_urls = perform_search(query, args.mode, args.scorer)
+    show_results(result_urls, get_default_engine().index_dir)
@@ -0,0 +1,473 @@
+import os
+import time
+import mmap
+import ujson
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, compress
+from index_format import (DOCUMENT_MAPPING, POSITIONS, POSITIONS_LEXICON, POSITIONS_RECORD, CHAMPIONS,
+                          CHAMPIONS_LEXICON, CHAMPIONS_RECORD, BINARY_FORMAT,
+                          TFIDF_WEIGHTS, SCORE_SCALE, read_lexicon, read_index_info, read_doc_stats, postings_file,
+                          read_varint, decode_varints, decode_binary_posting, decode_text_posting, decode_positions,
+                          IndexIntegrityError, read_build_manifest, check_build_manifest)
+from docstore import open_document_store
+from completions import open_completion_index
+from spelling import open_spelling_index
+# NumPy is optional, without it postings are concatenated and filtered as arrays from the array module
+try:
+    import numpy as np
+except ImportError:
+    np = None
+# Reading the segments of the index, shared by the retrieval system and the compaction of the indexer
+# Imported data structures/functions comments:
+# bisect_left() on a sorted list -> O(log n), where n = # of elements in the list
+# Lookup in set -> O(1) on average
+# np.isin() -> O((n + m) log m), where n = # of postings and m = # of tombstones
+# np.searchsorted() of m sorted values in an array of n -> O(m log n)
+# Galloping search of m sorted values in a list of n -> O(m log(n / m))
+
+class Segment:
+    # One self-contained part of the index: a lexicon, a postings file and the urls of a contiguous range of doc ids
+    # The base segment is written by a full build, delta segments by incremental updates (see inverted_index.py)
+    # Like the SearchEngine, a segment is read-only once loaded, so it can be shared by threads
+
+    def __init__(self, segment_dir: str) -> None:
+        self.segment_dir = segment_dir
+        # Before reading anything, the files are checked against the build manifest (if the segment has one)
+        # Only their sizes are compared here, so opening a segment stays fast: verify() also compares the checksums
+        self.build_manifest = read_build_manifest(segment_dir)
+        if self.build_manifest is not None:
+            check_build_manifest(segment_dir, self.build_manifest)
+        # Sorted list of terms plus parallel arrays of <posting offset, posting length, df, max score>
+        self.terms, self.offsets, self.lengths, self.dfs, self.max_scores = read_lexicon(segment_dir)
+        if self.build_manifest is not None and self.build_manifest["term_count"] not in (None, len(self.terms)):
+            raise IndexIntegrityError(f"{segment_dir} has {len(self.terms)} terms, the build manifest expects "
+                                      f"{self.build_manifest['term_count']}")
+
+        info = read_index_info(segment_dir)
+        self.index_format = info["format"]
+        self.weights = info.get("weights", TFIDF_WEIGHTS)
+        # Doc ids of the segment are first_doc_id, first_doc_id + 1, ...
+        self.first_doc_id = info.get("first_doc_id", 1)
+        # Binary postings longer than the skip interval start with a skip table (0 = no skip tables)
+        self.skip_interval = info.get("skip_interval", 0)
+
+        # Index of the urls list == doc_id - first_doc_id
+        # (a compacted segment keeps the doc ids of removed documents as empty lines)
+        with open(os.path.join(segment_dir, DOCUMENT_MAPPING), "r") as map_file:
+            self.urls = map_file.read().split("\n")
+        # The document mapping ends with a newline, so the last split element is empty
+        self.urls.pop()
+        # Number of documents in the segment (not counting the empty lines)
+        self.doc_count = info.get("doc_count", len(self.urls))
+        # A shard stores the number of documents (and the document frequencies) of the whole collection,
+        # so that every shard computes the same idf (None for an index that isn't sharded)
+        self.collection_doc_count = info.get("collection_doc_count")
+        # Likewise for the average doc length used by BM25
+        self.collection_avg_length = info.get("collection_avg_length")
+        # Lengths and norms of the docs, indexed by doc_id - first_doc_id (None if the segment has no doc stats)
+        self.doc_stats = read_doc_stats(segment_dir)
+
+        # Memory-map the postings file, the OS pages in only the parts that queries touch
+        # (an empty file can't be mapped, a segment without terms has no postings to read anyway)
+        self.index_file = open(os.path.join(segment_dir, postings_file(self.index_format)), "rb")
+        if os.fstat(self.index_file.fileno()).st_size != 0:
+            self.index_map = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.index_map = b""
+
+        # Token positions (only with --positions), mapped like the postings but only read by phrase queries
+        self.has_positions = info.get("positions", False)
+        self.mapped_files = []
+        if self.has_positions:
+            self.positions_lexicon_map = self.map_file(POSITIONS_LEXICON)
+            self.positions_map = self.map_file(POSITIONS)
+        # Champion lists of the long postings (only in the binary format), mapped like the positions
+        self.has_champions = info.get("champion_fraction", 0) != 0
+        if self.has_champions:
+            self.champions_lexicon_map = self.map_file(CHAMPIONS_LEXICON)
+            self.champions_map = self.map_file(CHAMPIONS)
+
+        # Url, title and text of the docs, for the results page (None for a segment written without a document store)
+        self.docstore = open_document_store(segment_dir)
+        # Words of the segment and their stems, for completions and wildcards (None for a segment written without)
+        self.completions = open_completion_index(segment_dir)
+        # Deletes of the segment's words, for spelling correction (None for a segment written without)
+        self.spelling = open_spelling_index(segment_dir, self.completions)
+
+    def verify(self) -> None:
+        # Reads every file of the segment and compares its checksum with the build manifest
+        # (raises IndexIntegrityError on a mismatch, a segment without a build manifest can't be verified)
+        if self.build_manifest is not None:
+            check_build_manifest(self.segment_dir, self.build_manifest, checksums=True)
+
+    def map_file(self, file_name: str):
+        # Memory-maps one of the segment's files, an empty file (nothing to read) becomes b""
+        mapped_file = open(os.path.join(self.segment_dir, file_name), "rb")
+        self.mapped_files.append(mapped_file)
+        if os.fstat(mapped_file.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        if isinstance(self.index_map, mmap.mmap):
+            self.index_map.close()
+        self.index_file.close()
+        file_maps = []
+        if self.has_positions:
+            file_maps.extend((self.positions_lexicon_map, self.positions_map))
+        if self.has_champions:
+            file_maps.extend((self.champions_lexicon_map, self.champions_map))
+        for file_map in file_maps:
+            if isinstance(file_map, mmap.mmap):
+                file_map.close()
+        for mapped_file in self.mapped_files:
+            mapped_file.close()
+        if self.docstore is not None:
+            self.docstore.close()
+
+    def find_term(self, term: str) -> int:
+        # Binary search the sorted lexicon, returns the term's position in the lexicon (or -1 if it's missing)
+        term_id = bisect_left(self.terms, term)
+        if term_id < len(self.terms) and self.terms[term_id] == term:
+            return term_id
+        return -1
+
+    def read_posting(self, term_id: int, trace=None) -> tuple:
+        # A single read of exactly the posting bytes (mmap slicing doesn't move a shared file position)
+        # If a QueryTrace is given, the read and the decoding are timed and counted in it
+        start_time = time.perf_counter()
+        offset = self.offsets[term_id]
+        posting_bytes = self.index_map[offset:offset + self.lengths[term_id]]
+        if trace is not None:
+            start_time = trace.record("posting_io", start_time)
+            trace.count("posting_bytes_read", len(posting_bytes))
+
+        # Both formats are decoded into the same (doc ids, scores) arrays
+        if self.index_format == BINARY_FORMAT:
+            posting = decode_binary_posting(posting_bytes, self.skip_interval)
+        else:
+            posting = decode_text_posting(ujson.loads(posting_bytes))
+        if trace is not None:
+            trace.record("decode", start_time)
+            trace.count("posting_lists_decoded")
+            trace.count("postings_decoded", len(posting[0]))
+        return posting
+
+    def open_posting(self, term_id: int, trace=None):
+        # Returns an object whose match() looks doc ids up in the term's posting
+        # A posting with a skip table is read block by block (only the blocks that can hold the doc ids),
+        # any other posting is read and decoded in full
+        if self.skip_interval != 0:
+            start_time = time.perf_counter()
+            offset = self.offsets[term_id]
+            # The header is 2 varints (at most 10 bytes each): the number of postings and the skip table length
+            header = self.index_map[offset:offset + min(20, self.lengths[term_id])]
+            count, pos = read_varint(header, 0)
+            skip_length, pos = read_varint(header, pos)
+            if trace is not None:
+                trace.record("posting_io", start_time)
+            if skip_length != 0:
+                return BlockPosting(self, offset + pos, count, skip_length, trace)
+        return DecodedPosting(*self.read_posting(term_id, trace))
+
+    def read_positions(self, term_id: int, doc_indexes=None) -> list:
+        # Returns the token positions of the term in the docs at the given indexes of its posting (all docs if None)
+        offset, length = POSITIONS_RECORD.unpack_from(self.positions_lexicon_map, term_id * POSITIONS_RECORD.size)
+        return decode_positions(self.positions_map[offset:offset + length], doc_indexes)
+
+    def has_champion_list(self, term_id: int) -> bool:
+        return self.has_champions and CHAMPIONS_RECORD.unpack_from(self.champions_lexicon_map,
+                                                                   term_id * CHAMPIONS_RECORD.size)[1] != 0
+
+    def read_champions(self, term_id: int, trace=None):
+        # Returns the champion list of the term (its highest scoring docs, as a posting), or None if it has none
+        if not self.has_champions:
+            return None
+        start_time = time.perf_counter()
+        offset, length = CHAMPIONS_RECORD.unpack_from(self.champions_lexicon_map, term_id * CHAMPIONS_RECORD.size)
+        if length == 0:
+            return None
+        champion_bytes = self.champions_map[offset:offset + length]
+        if trace is not None:
+            start_time = trace.record("posting_io", start_time)
+            trace.count("posting_bytes_read", length)
+        posting = decode_binary_posting(champion_bytes)
+        if trace is not None:
+            trace.record("decode", start_time)
+            trace.count("champion_lists_decoded")
+            trace.count("postings_decoded", len(posting[0]))
+        return posting
+
+    def get_url(self, doc_id: int) -> str:
+        return self.urls[doc_id - self.first_doc_id]
+
+    def get_document(self, doc_id: int) -> tuple:
+        # Returns (url, title, text) of the doc, without a document store only the url is known
+        if self.docstore is not None:
+            document = self.docstore.get(doc_id)
+            if document is not None:
+                return document
+        return self.get_url(doc_id), "", ""
+
+class DecodedPosting:
+    # A fully decoded posting (doc ids sorted ascending, scores), see BlockPosting for the other kind
+
+    def __init__(self, doc_ids, scores) -> None:
+        self.doc_ids = doc_ids
+        self.scores = scores
+
+    def match(self, candidates, trace=None) -> tuple:
+        # Looks up the sorted candidate doc ids, returns two arrays parallel to candidates:
+        # the position of each candidate in the posting (-1 if it isn't in it) and its score (0 if it isn't in it)
+        start_time = time.perf_counter()
+        if np is not None:
+            if len(self.doc_ids) == 0:
+                return np.full(len(candidates), -1, dtype=np.int64), np.zeros(len(candidates))
+            # One vectorized binary search per candidate
+            positions = np.searchsorted(self.doc_ids, candidates)
+            clipped = np.minimum(positions, len(self.doc_ids) - 1)
+            found = self.doc_ids[clipped] == candidates
+            result = np.where(found, positions, -1), np.where(found, self.scores[clipped], 0.0)
+        else:
+            positions = array("q")
+            scores = array("d")
+            for candidate, pos in zip(candidates, gallop_search(self.doc_ids, candidates)):
+                if pos < len(self.doc_ids) and self.doc_ids[pos] == candidate:
+                    positions.append(pos)
+                    scores.append(self.scores[pos])
+                else:
+                    positions.append(-1)
+                    scores.append(0.0)
+            result = positions, scores
+        if trace is not None:
+            trace.record("intersect", start_time)
+        return result
+
+class BlockPosting:
+    # A binary posting with a skip table (see encode_binary_posting in index_format.py), read one block at a time
+    # Only the skip table is read up front: a doc id can only be in the first block whose last doc id is >= it,
+    # so looking up a few doc ids in a long posting reads and decodes only a few of its blocks
+
+    def __init__(self, segment: Segment, skip_table_offset: int, count: int, skip_length: int, trace=None) -> None:
+        start_time = time.perf_counter()
+        self.segment = segment
+        self.count = count
+        skip_bytes = segment.index_map[skip_table_offset:skip_table_offset + skip_length]
+        if trace is not None:
+            start_time = trace.record("posting_io", start_time)
+            trace.count("posting_bytes_read", skip_length)
+        skip_table = decode_varints(skip_bytes)
+        # Byte positions of the gaps and the scores, relative to the start of the gaps
+        self.gap_ends = list(accumulate(skip_table[1::3].tolist()))
+        self.score_ends = list(accumulate(skip_table[2::3].tolist()))
+        self.gaps_offset = skip_table_offset + skip_length
+        self.scores_offset = self.gaps_offset + self.gap_ends[-1]
+        last_doc_ids = list(accumulate(skip_table[0::3].tolist()))
+        self.last_doc_ids = np.array(last_doc_ids, dtype=np.int64) if np is not None else last_doc_ids
+        if trace is not None:
+            trace.record("decode", start_time)
+
+    def read_block(self, block: int, trace=None) -> tuple:
+        # Reads and decodes the doc ids and scores of one block
+        start_time = time.perf_counter()
+        gap_start = self.gaps_offset + (self.gap_ends[block - 1] if block != 0 else 0)
+        score_start = self.scores_offset + (self.score_ends[block - 1] if block != 0 else 0)
+        gap_bytes = self.segment.index_map[gap_start:self.gaps_offset + self.gap_ends[block]]
+        score_bytes = self.segment.index_map[score_start:self.scores_offset + self.score_ends[block]]
+        if trace is not None:
+            start_time = trace.record("posting_io", start_time)
+            trace.count("posting_bytes_read", len(gap_bytes) + len(score_bytes))
+
+        # The first gap of a block is relative to the last doc id of the previous block
+        base = int(self.last_doc_ids[block - 1]) if block != 0 else 0
+        gaps = decode_varints(gap_bytes)
+        if np is not None:
+            doc_ids = np.cumsum(gaps).astype(np.int64) + base
+            scores = decode_varints(score_bytes).astype(np.float64) / SCORE_SCALE
+        else:
+            doc_ids = array("q", accumulate(gaps, initial=base))[1:]
+            scores = array("d", [value / SCORE_SCALE for value in decode_varints(score_bytes)])
+        if trace is not None:
+            trace.record("decode", start_time)
+            trace.count("posting_blocks_decoded")
+            trace.count("postings_decoded", len(doc_ids))
+        return doc_ids, scores
+
+    def match(self, candidates, trace=None) -> tuple:
+        # Same as DecodedPosting.match(), decoding only the blocks that the candidates fall in
+        start_time = time.perf_counter()
+        block_count = len(self.gap_ends)
+        # Block of each candidate = first block whose last doc id is >= the candidate (block_count if there's none)
+        if np is not None:
+            blocks = np.searchsorted(self.last_doc_ids, candidates)
+            positions = np.full(len(candidates), -1, dtype=np.int64)
+            scores = np.zeros(len(candidates))
+        else:
+            blocks = gallop_search(self.last_doc_ids, candidates)
+            positions = array("q", [-1] * len(candidates))
+            scores = array("d", [0.0] * len(candidates))
+        if trace is not None:
+            start_time = trace.record("intersect", start_time)
+
+        # The candidates are sorted, so the candidates of each block are next to each other
+        blocks_read = 0
+        start = 0
+        while start < len(candidates) and blocks[start] < block_count:
+            block = int(blocks[start])
+            if np is not None:
+                end = int(np.searchsorted(blocks, block, side="right"))
+            else:
+                end = bisect_right(blocks, block, start)
+            block_positions, block_scores = DecodedPosting(*self.read_block(block, trace)).match(candidates[start:end],
+                                                                                                trace)
+            # Positions within the block -> positions within the whole posting
+            offset = block * self.segment.skip_interval
+            if np is not None:
+                positions[start:end] = np.where(block_positions >= 0, block_positions + offset, -1)
+            else:
+                positions[start:end] = array("q", [pos + offset if pos >= 0 else -1 for pos in block_positions])
+            scores[start:end] = block_scores
+            blocks_read += 1
+            start = end
+        if trace is not None:
+            trace.count("posting_blocks_skipped", block_count - blocks_read)
+        return positions, scores
+
+def gallop_search(values, targets) -> list:
+    # Returns bisect_left(values, target) for every target, the targets being sorted ascending
+    # Galloping (exponential) search: each search starts where the previous one ended and doubles its step until it
+    # passes the target, then binary searches the last step -> O(log d) for a target d positions further on
+    positions = []
+    low = 0
+    length = len(values)
+    for target in targets:
+        step = 1
+        while low + step < length and values[low + step] < target:
+            step *= 2
+        low = bisect_left(values, target, low, min(low + step + 1, length))
+        positions.append(low)
+    return positions
+
+def open_segments(index_dir: str, manifest: dict) -> list:
+    # Opens the base segment and the delta segments listed in the manifest (in doc id order)
+    return [Segment(os.path.join(index_dir, segment_dir)) for segment_dir in [manifest["base"]] + manifest["deltas"]]
+
+def concatenate_postings(postings: list) -> tuple:
+    # Joins the postings of one term from several segments into a single (doc ids, scores) pair
+    # Later segments only hold higher doc ids, so joining them in segment order keeps the doc ids sorted
+    if len(postings) == 1:
+        return postings[0]
+    if np is not None:
+        return (np.concatenate([doc_ids for doc_ids, _ in postings]),
+                np.concatenate([scores for _, scores in postings]))
+    doc_ids = array("q")
+    scores = array("d")
+    for posting_doc_ids, posting_scores in postings:
+        doc_ids.extend(posting_doc_ids)
+        scores.extend(posting_scores)
+    return doc_ids, scores
+
+def removed_doc_id_lookup(removed_doc_ids: set):
+    # Prepares the removed doc ids for remove_doc_ids(): a sorted NumPy array when NumPy is installed, else the set
+    if np is not None:
+        return np.array(sorted(removed_doc_ids), dtype=np.int64)
+    return removed_doc_ids
+
+def remove_doc_ids(posting: tuple, removed_lookup) -> tuple:
+    # Drops the removed (tombstoned) documents from a posting
+    doc_ids, scores = posting
+    if np is not None:
+        keep = np.isin(doc_ids, removed_lookup, assume_unique=True, invert=True)
+        return doc_ids[keep], scores[keep]
+    keep = [i for i, doc_id in enumerate(doc_ids) if doc_id not in removed_lookup]
+    return array("q", [doc_ids[i] for i in keep]), array("d", [scores[i] for i in keep])
+
+def union_doc_ids(postings: list):
+    # Returns the sorted doc ids found in any of the postings
+    if np is not None:
+        return np.unique(np.concatenate([doc_ids for doc_ids, _ in postings]))
+    return array("q", sorted(set().union(*(doc_ids for doc_ids, _ in postings))))
+
+def intersect_doc_ids(doc_ids, other_doc_ids):
+    # Returns the sorted doc ids found in both sorted arrays of doc ids
+    if np is not None:
+        return np.intersect1d(doc_ids, other_doc_ids, assume_unique=True)
+    return array("q", sorted(set(doc_ids).intersection(other_doc_ids)))
+
+def keep_doc_ids(posting: tuple, kept_doc_ids) -> tuple:
+    # Keeps the documents of a posting that are in kept_doc_ids (sorted), the opposite of remove_doc_ids
+    doc_ids, scores = posting
+    if np is not None:
+        keep = np.isin(doc_ids, kept_doc_ids, assume_unique=True)
+        return doc_ids[keep], np.asarray(scores)[keep]
+    kept = set(kept_doc_ids)
+    keep = [i for i, doc_id in enumerate(doc_ids) if doc_id in kept]
+    return array("q", [doc_ids[i] for i in keep]), array("d", [scores[i] for i in keep])
+
+def select(values, found):
+    # Keeps the values where found is true (found is a NumPy bool array, or a list of bools without NumPy)
+    if np is not None:
+        return values[found]
+    return array(values.typecode, compress(values, found))
+
+def intersect_postings(segment: Segment, term_ids: list, removed_lookup=None, trace=None) -> tuple:
+    # Finds the docs of the segment that have every term (Boolean AND), the term with the lowest df first
+    # Returns the matched doc ids (sorted ascending) and, for each term in term_ids, a (positions of the docs in the
+    # term's posting, scores) pair of arrays parallel to the doc ids
+    # Only the rarest posting is decoded in full, every other term is looked up for the remaining candidates only
+    # (block by block with a skip table), so the postings of very common terms are barely read
+    order = sorted(range(len(term_ids)), key=lambda i: segment.dfs[term_ids[i]])
+    matches = [None] * len(term_ids)
+    rarest = DecodedPosting(*segment.read_posting(term_ids[order[0]], trace))
+    candidates = rarest.doc_ids
+    if removed_lookup is not None:
+        candidates = remove_doc_ids((rarest.doc_ids, rarest.scores), removed_lookup)[0]
+
+    matched = []
+    for i in order:
+        posting = rarest if i == order[0] else segment.open_posting(term_ids[i], trace)
+        positions, scores = posting.match(candidates, trace)
+        start_time = time.perf_counter()
+        # Keep the candidates found in this posting, as well as their matches in the postings before it
+        found = positions >= 0 if np is not None else [pos >= 0 for pos in positions]
+        candidates = select(candidates, found)
+        for j in matched:
+            matches[j] = (select(matches[j][0], found), select(matches[j][1], found))
+        matches[i] = (select(positions, found), select(scores, found))
+        matched.append(i)
+        if trace is not None:
+            trace.record("intersect", start_time)
+        if len(candidates) == 0:
+            # No doc of the segment has every term
+            return candidates, []
+    return candidates, matches
+
+def match_phrase(segment: Segment, term_ids: list, matches: list, phrase: list, trace=None) -> list:
+    # Returns, for each doc found by intersect_postings, whether the terms appear in it one after the other
+    # phrase holds the index (in term_ids) of each word of the phrase, EX: "to be or not to be" -> [0, 1, 2, 3, 0, 1]
+    start_time = time.perf_counter()
+    # doc_positions[i][d] = positions of the i-th term in the d-th matched doc
+    doc_positions = [segment.read_positions(term_id, positions.tolist())
+                     for term_id, (positions, _) in zip(term_ids, matches)]
+    found = []
+    for doc in range(len(matches[0][0])):
+        # Positions where the phrase could start: where its first word is, narrowed down to the positions
+        # where every following word is at the right distance
+        starts = set(doc_positions[phrase[0]][doc])
+        for distance, term in enumerate(phrase[1:], start=1):
+            starts &= {position - distance for position in doc_positions[term][doc]}
+            if len(starts) == 0:
+                break
+        found.append(len(starts) != 0)
+    if trace is not None:
+        trace.record("positions", start_time)
+        trace.count("position_lists_read", len(term_ids))
+    return np.array(found, dtype=bool) if np is not None else found
+
+def scale_posting(posting: tuple, factor: float) -> tuple:
+    # Multiplies every score of a posting by the same factor (EX: the term's idf)
+    doc_ids, scores = posting
+    if np is not None:
+        return doc_ids, np.asarray(scores) * factor
+    return doc_ids, array("d", [score * factor for score in scores])
@@ -0,0 +1,260 @@
+import os
+import sys
+import time
+import heapq
+import argparse
+import threading
+import multiprocessing
+from queue import SimpleQueue, Empty
+from bisect import bisect_right
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.connection import Listener, Client
+from query_log import read_query_log
+from index_format import (DOCUMENT_MAPPING, read_index_info, read_shard_manifest, index_signature, current_build_dir,
+                          read_build_manifest, check_build_manifest)
+from query_cache import QueryCache
+from docstore import open_document_store
+from completions import open_completion_index
+from spelling import open_spelling_index
+from metrics import QueryTrace
+from search import SearchEngine, OR_MODE
+from scoring import DEFAULT_SCORER
+from text_processing import load_stem_table
+# Scatter-gather query execution over the shards of a sharded index (built with inverted_index.py --shards N)
+# Every shard is searched by its own process, either a local process pool or shard servers listening on sockets
+# Imported data structures/functions comments:
+# heapq.merge() of k sorted iterables -> O(n log k), where n = # of elements in all iterables
+# bisect_right() on a sorted list -> O(log n), where n = # of elements in the list
+
+# Shard servers only listen on the loopback interface, connections are authenticated with this key
+SHARD_AUTHKEY = b"zotsearch-shards"
+
+# SearchEngine of the shard served by this process (in a pool worker or a shard server)
+shard_engine = None
+
+def open_shard(shard_dir: str, champions: bool = False) -> None:
+    # Runs once in each shard process, loads the shard's lexicon and urls and maps its postings
+    # (champions -> answer top-k OR queries from the champion lists first, see SearchEngine.rank_champions)
+    global shard_engine
+    shard_engine = SearchEngine(shard_dir, champions=champions)
+
+def search_shard(terms: list, k: int, mode: str = OR_MODE, tokens: list = None,
+                 scorer: str = DEFAULT_SCORER, expansions: dict = None) -> tuple:
+    # Returns the number of docs matched in the shard, its top k doc ids, their scores
+    # and the counters of the search (EX: bytes of postings read)
+    trace = QueryTrace()
+    num_matched, ranked_docs, scores = shard_engine.rank_with_scores(dict.fromkeys(terms), k, trace, mode, tokens,
+                                                                     scorer, expansions)
+    return num_matched, ranked_docs, scores, dict(trace.counters)
+
+def warm_shard(queries: list) -> int:
+    # Warms the posting cache of the shard with the terms of past queries (see SearchEngine.warm_posting_cache)
+    return shard_engine.warm_posting_cache(queries)
+
+def shard_posting_cache_stats() -> list:
+    return shard_engine.posting_cache_stats()
+
+def merge_shard_results(results: list, k: int = None) -> tuple:
+    # Merges the rankings of the shards into the ranking of the whole collection
+    # Each shard holds different docs, so the matched counts add up, and each shard's ranking is already sorted
+    # by (score descending, doc id ascending) -> a k-way merge on the same key gives the top k of the collection
+    # (every shard returns its own top k, so the global top k is always among them)
+    num_matched = sum(shard_matched for shard_matched, _, _, _ in results)
+    rankings = [zip(doc_ids, scores) for _, doc_ids, scores, _ in results]
+    merged = heapq.merge(*rankings, key=lambda entry: (-entry[1], entry[0]))
+    return num_matched, [doc_id for doc_id, _ in islice(merged, k)]
+
+class ShardedSearchEngine(SearchEngine):
+    # Query coordinator of a sharded index, used like a SearchEngine (same search() and query cache)
+    # A query is tokenized here, sent to every shard at once, and the per-shard top k are merged
+    # Without a port, each shard is searched by its own process in a local pool (one single-process executor
+    # per shard, so each process only loads one shard)
+    # With a port, the shards are searched by the shard servers started with "python3 shards.py",
+    # shard i listening on port + i (several coordinators, EX: gunicorn workers, can share the same servers)
+
+    def __init__(self, index_dir: str = ".", port: int = None, champions: bool = False) -> None:
+        self.index_dir = index_dir
+        # The files kept in the index directory are checked like those of a segment (the shards check their own)
+        build_manifest = read_build_manifest(index_dir)
+        if build_manifest is not None:
+            check_build_manifest(index_dir, build_manifest)
+        load_stem_table(index_dir)
+        self.shard_dirs = [os.path.join(index_dir, shard_dir) for shard_dir in read_shard_manifest(index_dir)["shards"]]
+
+        # The urls of every shard are kept here, so that a ranking only has to return doc ids
+        self.first_doc_ids = []
+        self.shard_urls = []
+        for shard_dir in self.shard_dirs:
+            self.first_doc_ids.append(read_index_info(shard_dir).get("first_doc_id", 1))
+            with open(os.path.join(shard_dir, DOCUMENT_MAPPING), "r") as map_file:
+                self.shard_urls.append(map_file.read().split("\n")[:-1])
+        # The document store isn't split, the indexer writes it for the whole collection in the index directory
+        self.docstore = open_document_store(index_dir)
+        # Same for the completion and spelling indexes, whose dfs are those of the whole collection (wildcards are
+        # expanded and words corrected here, so every shard gets the same stems)
+        completion_index = open_completion_index(index_dir)
+        self.completion_indexes = [completion_index] if completion_index is not None else []
+        spelling_index = open_spelling_index(index_dir, completion_index)
+        self.spelling_indexes = [spelling_index] if spelling_index is not None else []
+
+        self.port = port
+        if port is None:
+            self.executors = [ProcessPoolExecutor(1, initializer=open_shard, initargs=(shard_dir, champions))
+                              for shard_dir in self.shard_dirs]
+        else:
+            # Idle connections to each shard server, a connection is only used by one query at a time
+            self.connections = [SimpleQueue() for _ in self.shard_dirs]
+
+        # Ranked results of recent queries, dropped automatically when the files of any shard change
+        self.query_cache = QueryCache(lambda: (index_signature(index_dir),) +
+                                      tuple(index_signature(shard_dir) for shard_dir in self.shard_dirs))
+
+    def close(self) -> None:
+        if self.docstore is not None:
+            self.docstore.close()
+        if self.port is None:
+            for executor in self.executors:
+                executor.shutdown()
+        else:
+            for idle_connections in self.connections:
+                while True:
+                    try:
+                        idle_connections.get_nowait().close()
+                    except Empty:
+                        break
+
+    def verify(self) -> None:
+        # Compares the checksums of the files of the index directory and of every shard with their build manifests
+        # (the shard processes only compare the file sizes when they open their shard, see Segment.__init__)
+        for index_dir in [self.index_dir] + self.shard_dirs:
+            build_manifest = read_build_manifest(index_dir)
+            if build_manifest is not None:
+                check_build_manifest(index_dir, build_manifest, checksums=True)
+
+    def rank(self, term_dict: dict, k: int = None, trace: QueryTrace = None, mode: str = OR_MODE,
+             tokens: list = None, scorer: str = DEFAULT_SCORER, expansions: dict = None) -> tuple:
+        if trace is None:
+            trace = QueryTrace()
+        terms = list(term_dict.keys())
+        if len(terms) == 0:
+            return 0, []
+        start_time = time.perf_counter()
+
+        # Scatter: every shard starts ranking before any result is collected, so the shards work in parallel
+        if self.port is None:
+            futures = [executor.submit(search_shard, terms, k, mode, tokens, scorer, expansions)
+                       for executor in self.executors]
+            results = [future.result() for future in futures]
+        else:
+            connections = [self.get_connection(shard) for shard in range(len(self.shard_dirs))]
+            for connection in connections:
+                connection.send((terms, k, mode, tokens, scorer, expansions))
+            results = [connection.recv() for connection in connections]
+            for shard, connection in enumerate(connections):
+                self.connections[shard].put(connection)
+
+        # Gather: merge the top k of every shard
+        # The stages inside the shards run in parallel in other processes, so only their counters are added up
+        result = merge_shard_results(results, k)
+        trace.record("shards", start_time)
+        for _, _, _, counters in results:
+            for counter, amount in counters.items():
+                trace.count(counter, amount)
+        return result
+
+    def get_connection(self, shard: int):
+        # Reuses an idle connection to the shard server, or opens a new one
+        try:
+            return self.connections[shard].get_nowait()
+        except Empty:
+            return Client(("127.0.0.1", self.port + shard), authkey=SHARD_AUTHKEY)
+
+    def get_urls(self, doc_ids: list) -> list:
+        # Find the shard holding each doc id -> the last shard starting at or before the doc id
+        urls = []
+        for doc_id in doc_ids:
+            shard = bisect_right(self.first_doc_ids, doc_id) - 1
+            urls.append(self.shard_urls[shard][doc_id - self.first_doc_ids[shard]])
+        return urls
+
+    def get_documents(self, doc_ids: list) -> list:
+        documents = []
+        for doc_id, url in zip(doc_ids, self.get_urls(doc_ids)):
+            document = self.docstore.get(doc_id) if self.docstore is not None else None
+            documents.append(document if document is not None else (url, "", ""))
+        return documents
+
+    def docstore_stats(self) -> list:
+        return [self.docstore.stats()] if self.docstore is not None else []
+
+    def warm_posting_cache(self, queries: list) -> int:
+        # Every shard has its own posting cache, warmed in the shard's process
+        # (shard servers warm their caches when they start, see serve_shard)
+        if self.port is not None:
+            return 0
+        futures = [executor.submit(warm_shard, queries) for executor in self.executors]
+        return sum(future.result() for future in futures)
+
+    def posting_cache_stats(self) -> list:
+        # The posting cache statistics of every shard (not available from shard servers)
+        if self.port is not None:
+            return []
+        futures = [executor.submit(shard_posting_cache_stats) for executor in self.executors]
+        return [stats for future in futures for stats in future.result()]
+
+def open_engine(index_dir: str = ".", port: int = None, champions: bool = False) -> SearchEngine:
+    # Returns a ShardedSearchEngine for a sharded index, a SearchEngine otherwise
+    # The engine opens the published build of the index directory, if it has one (see current_build_dir)
+    # (shard servers use the champion lists if they were started with --champions, whatever champions is)
+    index_dir = current_build_dir(index_dir)
+    if read_shard_manifest(index_dir) is not None:
+        return ShardedSearchEngine(index_dir, port, champions)
+    return SearchEngine(index_dir, champions=champions)
+
+def serve_shard(shard_dir: str, port: int, queries: list = None, champions: bool = False) -> None:
+    # Shard server: answers (terms, k, mode, tokens, scorer, expansions) requests from coordinators,
+    # one thread per connection
+    # The posting cache is first warmed with the terms of the queries (EX: a query log), if any
+    open_shard(shard_dir, champions)
+    if queries:
+        warm_shard(queries)
+    with Listener(("127.0.0.1", port), authkey=SHARD_AUTHKEY) as listener:
+        print(f"Serving {shard_dir} on port {port}")
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=handle_connection, args=(connection,), daemon=True).start()
+
+def handle_connection(connection) -> None:
+    # Answers requests on one connection until the coordinator closes it
+    with connection:
+        while True:
+            try:
+                request = connection.recv()
+            except EOFError:
+                return
+            connection.send(search_shard(*request))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serves the shards of a sharded index over sockets")
+    parser.add_argument("--port", type=int, default=6000, help="port of the first shard (shard i uses port + i)")
+    parser.add_argument("--index-dir", default=".", help="directory of the sharded index")
+    parser.add_argument("--query-log", help="warm the posting caches with the terms of the queries in this log")
+    parser.add_argument("--champions", action="store_true",
+                        help="answer top-k OR queries from the champion lists first (approximate, see README)")
+    args = parser.parse_args()
+
+    # The servers serve the build published when they start, they have to be restarted to serve a new build
+    index_dir = current_build_dir(args.index_dir)
+    shard_manifest = read_shard_manifest(index_dir)
+    if shard_manifest is None:
+        sys.exit("The index isn't sharded, build it with inverted_index.py --shards N")
+    # One server process per shard
+    queries = read_query_log(args.query_log) if args.query_log else None
+    servers = [multiprocessing.Process(target=serve_shard, args=(os.path.join(index_dir, shard_dir),
+                                                                 args.port + shard, queries, args.champions))
+               for shard, shard_dir in enumerate(shard_manifest["shards"])]
+    for server in servers:
+        server.start()
+    for server in servers:
+        server.join()
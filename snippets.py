@@ -0,0 +1,109 @@
+import re
+from text_processing import stem_cache
+# Query-term highlighted snippets of the results page, made from the text kept in the document store
+# Only the results of the requested page get a snippet, so a query makes at most one snippet per result shown
+# Imported data structures/functions comments:
+# re.finditer() -> O(n), where n = # of characters in the text
+# stem() of the stem cache -> O(1) on cache hits
+
+# Number of characters of text in a snippet
+SNIPPET_LENGTH = 200
+# Only the start of the text is searched for the query terms (the document store keeps at most this much anyway)
+SNIPPET_SCAN_LENGTH = 20000
+ELLIPSIS = "..."
+
+def find_query_terms(text: str, stems: set) -> list:
+    # Returns the (start, end, stem) of every word of the text whose stem is a query stem, in text order
+    # Stemming every word of the text would be slow, so the words are first found by a regular expression:
+    # the Porter stemmer mostly changes the end of a word, so a word whose stem is a query stem starts with that
+    # stem minus its last letter (EX: "happi" <- "happy", "gener" <- "generating"), and only those words are stemmed
+    prefixes = {stem[:-1] if len(stem) > 2 else stem for stem in stems}
+    # Longest prefixes first, so the alternation tries the most specific ones first
+    pattern = re.compile(r"(?<![a-zA-Z0-9])(?:" + "|".join(re.escape(prefix) for prefix in
+                                                            sorted(prefixes, key=len, reverse=True)) +
+                         r")[a-zA-Z0-9]*", re.IGNORECASE)
+    matches = []
+    for match in pattern.finditer(text):
+        stem = stem_cache.stem(match.group())
+        if stem in stems:
+            matches.append((match.start(), match.end(), stem))
+    return matches
+
+def best_window(matches: list, length: int) -> tuple:
+    # Returns the (first, last + 1) indexes of the matches in the window of at most length characters that holds
+    # the most distinct query terms (then the most matches, then the earliest)
+    # The window slides over the matches with two pointers, so each match enters and leaves it once
+    best = (0, 0)
+    best_key = (0, 0)
+    counts = dict()
+    end = 0
+    for start in range(len(matches)):
+        while end < len(matches) and matches[end][1] - matches[start][0] <= length:
+            counts[matches[end][2]] = counts.get(matches[end][2], 0) + 1
+            end += 1
+        key = (len(counts), end - start)
+        if key > best_key:
+            best, best_key = (start, end), key
+        if end == start:
+            # The match alone is longer than the window
+            end += 1
+            continue
+        stem = matches[start][2]
+        counts[stem] -= 1
+        if counts[stem] == 0:
+            del counts[stem]
+    return best
+
+def make_snippet(text: str, stems: set, length: int = SNIPPET_LENGTH) -> list:
+    # Returns the snippet of the text for the query stems, as a list of (string, highlighted) parts
+    # EX: [("...the ", False), ("career", True), (" fair is held in ", False), ("fall", True), ("...", False)]
+    # The snippet is the part of the text with the most distinct query terms, or the start of the text if it has none
+    text = text[:SNIPPET_SCAN_LENGTH]
+    if text == "":
+        return []
+    matches = find_query_terms(text, stems) if len(stems) != 0 else []
+    first, last = best_window(matches, length)
+
+    if first == last:
+        start, end = 0, min(len(text), length)
+        span_start = span_end = 0
+    else:
+        span_start, span_end = matches[first][0], matches[last - 1][1]
+        # Center the matches in the window
+        start = max(0, span_start - (length - (span_end - span_start)) // 2)
+        end = min(len(text), start + length)
+        start = max(0, end - length)
+    # Don't cut words at the edges of the window (unless that would cut off a match)
+    if start > 0:
+        space = text.find(" ", start, span_start if first != last else end)
+        if space != -1:
+            start = space + 1
+    if end < len(text):
+        space = text.rfind(" ", span_end, end)
+        if space != -1:
+            end = space
+
+    parts = [(ELLIPSIS, False)] if start > 0 else []
+    position = start
+    for match_start, match_end, _ in matches[first:last]:
+        if match_start > position:
+            parts.append((text[position:match_start], False))
+        parts.append((text[match_start:match_end], True))
+        position = match_end
+    if end > position:
+        parts.append((text[position:end], False))
+    if end < len(text):
+        parts.append((ELLIPSIS, False))
+    return parts
+
+def snippet_text(parts: list) -> tuple:
+    # Returns the snippet as a string, and the [start, end) character offsets of its highlighted words
+    text = []
+    highlights = []
+    position = 0
+    for part, highlighted in parts:
+        if highlighted:
+            highlights.append((position, position + len(part)))
+        text.append(part)
+        position += len(part)
+    return "".join(text), highlights
@@ -0,0 +1,191 @@
+import os
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from index_format import SPELLING_HASHES, SPELLING_WORDS
+# Spelling correction of query words with a symmetric delete index (the SymSpell algorithm)
+# Two words are within edit distance d of each other only if deleting at most d characters from each of them
+# gives the same string (EX: "carrer" and "career" both become "carer"), so the indexer stores every delete of every
+# word of the completion index (see completions.py), and a query word is corrected by looking up its own deletes:
+# the words found are the only candidates, and only those get their edit distance computed
+# Only the deletes of the first PREFIX_LENGTH characters of each word are stored, which keeps the index small
+# (the full words of the candidates are still compared with the query word)
+# The deletes are stored as the sorted CRC-32 hashes of the strings, each with the position of its word in the
+# completion words file: a lookup is a binary search, and a hash collision only adds a candidate that the edit
+# distance then rejects
+# Imported data structures/functions comments:
+# bisect_left() on an array -> O(log n), where n = # of stored deletes
+# zlib.crc32() -> O(n), where n = # of characters in the string
+# Lookup in/insertion into dict or set -> O(1) on average
+
+# Largest edit distance of a correction, words of at most SHORT_WORD_LENGTH characters are only corrected by 1 edit
+# (2 edits turn most short words into many others)
+MAX_EDIT_DISTANCE = 2
+SHORT_WORD_LENGTH = 4
+# Number of leading characters of each word whose deletes are stored
+PREFIX_LENGTH = 7
+# Shorter words are neither corrected nor suggested as corrections
+MIN_WORD_LENGTH = 3
+# Words whose stem is in fewer docs aren't suggested as corrections (most of them are typos themselves)
+MIN_CORRECTION_DF = 2
+# A word of the index is only corrected ("did you mean") to a word whose stem is in this many times more docs
+SUGGESTION_RATIO = 20
+# Time (in seconds) that correcting the words of a query may take, the words left once it's spent stay as typed
+SPELLING_BUDGET = 0.005
+
+class SpellingTimeout(Exception):
+    # Raised by a lookup that ran out of time before checking every candidate: its matches are incomplete, so
+    # the best of them may not be the right correction
+    pass
+
+def word_deletes(word: str, max_distance: int) -> set:
+    # Returns the strings made by deleting at most max_distance characters from the word (the word included)
+    deletes = {word}
+    edge = {word}
+    for _ in range(max_distance):
+        edge = {delete[:i] + delete[i + 1:] for delete in edge if len(delete) > 1 for i in range(len(delete))}
+        deletes.update(edge)
+    return deletes
+
+def max_edit_distance(word: str) -> int:
+    return 1 if len(word) <= SHORT_WORD_LENGTH else MAX_EDIT_DISTANCE
+
+def is_correctable(word: str) -> bool:
+    # Only words of letters are corrected (EX: not numbers or ids)
+    return len(word) >= MIN_WORD_LENGTH and word.isalpha()
+
+def edit_distance(source: str, target: str, max_distance: int) -> int:
+    # Returns the Damerau-Levenshtein distance between the words (the optimal string alignment distance: insertions,
+    # deletions, substitutions and swaps of 2 adjacent characters), or max_distance + 1 once it's known to be larger
+    if abs(len(source) - len(target)) > max_distance:
+        return max_distance + 1
+    # A common prefix or suffix doesn't change the distance (the candidates of a word often share a long prefix)
+    start = 0
+    while start < len(source) and start < len(target) and source[start] == target[start]:
+        start += 1
+    source_end = len(source)
+    target_end = len(target)
+    while source_end > start and target_end > start and source[source_end - 1] == target[target_end - 1]:
+        source_end -= 1
+        target_end -= 1
+    source = source[start:source_end]
+    target = target[start:target_end]
+    if len(source) == 0 or len(target) == 0:
+        return min(len(source) + len(target), max_distance + 1)
+
+    # Only the cells within max_distance of the diagonal can hold a distance <= max_distance
+    too_far = max_distance + 1
+    before_previous = None
+    previous = list(range(len(target) + 1))
+    for i in range(1, len(source) + 1):
+        current = [too_far] * (len(target) + 1)
+        if i <= max_distance:
+            current[0] = i
+        row_min = too_far
+        for j in range(max(1, i - max_distance), min(len(target), i + max_distance) + 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (source[i - 1] != target[j - 1]))
+            if (i > 1 and j > 1 and source[i - 1] == target[j - 2] and source[i - 2] == target[j - 1]
+                    and before_previous[j - 2] + 1 < distance):
+                distance = before_previous[j - 2] + 1
+            current[j] = distance
+            if distance < row_min:
+                row_min = distance
+        # The distance can only grow from the smallest value of a row
+        if row_min > max_distance:
+            return too_far
+        before_previous, previous = previous, current
+    return min(previous[-1], too_far)
+
+def write_spelling_index(index_dir: str, words: list, dfs) -> None:
+    # Writes the spelling index of the sorted words of a completion index (and the dfs of their stems)
+    entries = []
+    for position, word in enumerate(words):
+        if is_correctable(word) and dfs[position] >= MIN_CORRECTION_DF:
+            for delete in word_deletes(word[:PREFIX_LENGTH], max_edit_distance(word)):
+                entries.append((zlib.crc32(delete.encode("utf-8")), position))
+    entries.sort()
+
+    with open(os.path.join(index_dir, SPELLING_WORDS), "wb") as words_file:
+        array("I", [position for _, position in entries]).tofile(words_file)
+    # The hashes file is written last, an index without it has no spelling index (see open_spelling_index)
+    with open(os.path.join(index_dir, SPELLING_HASHES), "wb") as hashes_file:
+        array("I", [delete_hash for delete_hash, _ in entries]).tofile(hashes_file)
+
+class SpellingIndex:
+    # The spelling index of an index directory, over the words of its completion index
+    # Read-only once loaded, so it can be shared by threads
+
+    def __init__(self, index_dir: str, completion_index) -> None:
+        self.completion_index = completion_index
+        self.hashes = array("I")
+        with open(os.path.join(index_dir, SPELLING_HASHES), "rb") as hashes_file:
+            self.hashes.frombytes(hashes_file.read())
+        self.positions = array("I")
+        with open(os.path.join(index_dir, SPELLING_WORDS), "rb") as words_file:
+            self.positions.frombytes(words_file.read())
+        # <stem, df> pairs of every stem of the lexicon (a stem without a word is a word of its own in the completion
+        # index), to tell the words of the index from misspelled ones
+        self.term_dfs = dict(zip(completion_index.terms, completion_index.dfs))
+        self.max_df = max(completion_index.dfs, default=0)
+
+    def lookup(self, word: str, max_distance: int, deadline: float) -> list:
+        # Returns the (word, stem, distance) of the words of the index within max_distance of the (lowercase) word,
+        # checking the candidates until the deadline (a time.perf_counter() time)
+        # Raises SpellingTimeout if the deadline passes before every candidate was checked
+        # Words within max_distance share a delete of at most max_distance characters, even if more were stored
+        candidates = set()
+        for delete in word_deletes(word[:PREFIX_LENGTH], max_distance):
+            delete_hash = zlib.crc32(delete.encode("utf-8"))
+            position = bisect_left(self.hashes, delete_hash)
+            while position < len(self.hashes) and self.hashes[position] == delete_hash:
+                candidates.add(self.positions[position])
+                position += 1
+
+        words = self.completion_index.words
+        terms = self.completion_index.terms
+        matches = []
+        for position in candidates:
+            if time.perf_counter() > deadline:
+                raise SpellingTimeout(word)
+            distance = edit_distance(word, words[position], max_distance)
+            if distance <= max_distance:
+                matches.append((words[position], terms[position], distance))
+        return matches
+
+def open_spelling_index(index_dir: str, completion_index):
+    # Returns the SpellingIndex of the index directory, or None if it has none
+    # (EX: an index built before spelling correction existed)
+    if completion_index is None or not os.path.exists(os.path.join(index_dir, SPELLING_HASHES)):
+        return None
+    return SpellingIndex(index_dir, completion_index)
+
+def term_df(spelling_indexes: list, term: str) -> int:
+    # The df of a stem in every segment (like the completions, removed docs still count until compaction)
+    return sum(spelling_index.term_dfs.get(term, 0) for spelling_index in spelling_indexes)
+
+def best_correction(spelling_indexes: list, word: str, df: int, deadline: float):
+    # Returns the correction of a (lowercase) query word whose stem is in df docs, or None if it has none
+    # A word that isn't in the index gets its closest word (then the most frequent), a word of the index only gets a
+    # word 1 edit away whose stem is in SUGGESTION_RATIO times more docs
+    # A frequent word can't have a correction frequent enough, its deletes aren't even looked up
+    # Raises SpellingTimeout if the deadline passes during the lookup (see SpellingIndex.lookup)
+    if df != 0 and SUGGESTION_RATIO * df > sum(spelling_index.max_df for spelling_index in spelling_indexes):
+        return None
+    max_distance = max_edit_distance(word) if df == 0 else 1
+    matches = dict()
+    for spelling_index in spelling_indexes:
+        for match, term, distance in spelling_index.lookup(word, max_distance, deadline):
+            matches[match] = (distance, term)
+
+    best = None
+    for match, (distance, term) in matches.items():
+        if match == word:
+            continue
+        match_df = term_df(spelling_indexes, term)
+        if match_df < MIN_CORRECTION_DF or (df != 0 and match_df < SUGGESTION_RATIO * df):
+            continue
+        key = (distance, -match_df, match)
+        if best is None or key < best:
+            best = key
+    return best[2] if best is not None else None
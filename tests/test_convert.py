@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import unittest
+from index_format import current_build_dir, read_index_info, read_lexicon, read_shard_manifest, verify_index
+from search import SearchEngine
+# Builds small text indexes (with positions, or sharded), converts them to the binary format with --convert, then
+# opens them
+# Run from the project root: python3 -m pytest tests (or python3 -m unittest discover tests)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ["<html><head><title>career fair</title></head><body><p>career fair on campus</p></body></html>",
+         "<html><body><p>the career center hosts the fair</p></body></html>",
+         "<html><body><p>computer science career</p></body></html>"]
+
+def run_indexer(index_dir: str, *args) -> None:
+    subprocess.run([sys.executable, os.path.join(PROJECT_DIR, "inverted_index.py")] + list(args), cwd=index_dir,
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                   env=dict(os.environ, PYTHONPATH=PROJECT_DIR))
+
+class ConvertTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.index_dir = tempfile.mkdtemp()
+        corpus_dir = os.path.join(self.index_dir, "corpus", "domain")
+        os.makedirs(corpus_dir)
+        for page_number, page in enumerate(PAGES):
+            with open(os.path.join(corpus_dir, f"page{page_number}.json"), "w") as page_file:
+                json.dump({"url": f"https://domain.example.edu/page{page_number}", "content": page,
+                           "encoding": "utf-8"}, page_file)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.index_dir)
+
+    def test_convert_positional_index(self) -> None:
+        run_indexer(self.index_dir, "--corpus", "corpus", "--positions")
+        run_indexer(self.index_dir, "--convert")
+        build_dir = current_build_dir(self.index_dir)
+        info = read_index_info(build_dir)
+        self.assertEqual(info["format"], "binary")
+        self.assertTrue(info["positions"])
+        # The build manifest matches the rewritten index info
+        verify_index(build_dir)
+        engine = SearchEngine(build_dir)
+        try:
+            total_results, _ = engine.search(["career", "fair"], mode="phrase")
+            self.assertEqual(total_results, 1)
+        finally:
+            engine.close()
+
+    def test_convert_sharded_index(self) -> None:
+        # Every shard keeps the document count and the dfs of the whole collection, so its scores stay comparable
+        # with the other shards'
+        run_indexer(self.index_dir, "--corpus", "corpus", "--shards", str(len(PAGES)))
+        build_dir = current_build_dir(self.index_dir)
+        shard_dirs = [os.path.join(build_dir, shard_dir) for shard_dir in read_shard_manifest(build_dir)["shards"]]
+        text_stats = [self.shard_stats(shard_dir) for shard_dir in shard_dirs]
+        run_indexer(self.index_dir, "--convert")
+        for shard_dir, (doc_count, avg_length, dfs) in zip(shard_dirs, text_stats):
+            self.assertEqual(read_index_info(shard_dir)["format"], "binary")
+            self.assertIsNotNone(avg_length)
+            self.assertEqual(self.shard_stats(shard_dir), (doc_count, avg_length, dfs))
+            self.assertEqual(doc_count, len(PAGES))
+            self.assertEqual(dfs["career"], len(PAGES))
+        verify_index(build_dir)
+
+    def shard_stats(self, shard_dir: str) -> tuple:
+        # Returns the document count of the engine of a shard, the average doc length of the collection and the
+        # <term, df> pairs of its lexicon
+        engine = SearchEngine(shard_dir)
+        try:
+            doc_count = engine.doc_count
+        finally:
+            engine.close()
+        terms, _, _, dfs, _ = read_lexicon(shard_dir)
+        return doc_count, read_index_info(shard_dir).get("collection_avg_length"), dict(zip(terms, dfs))
+
+if __name__ == '__main__':
+    unittest.main()
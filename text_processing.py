@@ -0,0 +1,96 @@
+import os
+import json
+from nltk.stem import PorterStemmer
+from nltk.tokenize import RegexpTokenizer
+from collections import defaultdict
+from index_format import STEM_TABLE
+# Tokenizing and stemming shared by the indexer and the retrieval system, so both turn text into terms the same way
+# Imported data structures/functions comments:
+# stem() method of PorterStemmer -> O(m * n), m = # of words, n = # avg length of words
+# tokenize() method from RegexpTokenizer -> O(n), where n = # of characters in input string
+# Lookup in/insertion into dict -> O(1) on average
+
+# Default number of <token, stem> pairs kept by the stem cache
+STEM_CACHE_SIZE = 500000
+
+tokenizer = RegexpTokenizer(r'[a-zA-Z0-9]+')
+porter_stemmer = PorterStemmer()
+
+class StemCache:
+    # Memoizes PorterStemmer.stem() in a size-capped dictionary of <token, stem> pairs
+    # Web text is Zipfian: a few thousand words make up most token occurrences, and those words are seen
+    # (and cached) early, so once the cache is full new tokens are simply stemmed without being cached
+    # Lookups and insertions are single dict operations, so the cache can be shared by threads
+    # (the hit/miss counters may undercount slightly under concurrency, they're only statistics)
+
+    def __init__(self, max_size: int = STEM_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.stems = dict()
+        # Tokens cached since the last call to take_new_stems()
+        self.new_tokens = []
+        self.hits = 0
+        self.misses = 0
+
+    def stem(self, token: str) -> str:
+        stem = self.stems.get(token)
+        if stem is not None:
+            self.hits += 1
+            return stem
+
+        self.misses += 1
+        stem = porter_stemmer.stem(token)
+        if len(self.stems) < self.max_size:
+            self.stems[token] = stem
+            self.new_tokens.append(token)
+        return stem
+
+    def update(self, stems: dict) -> None:
+        # Adds precomputed <token, stem> pairs (EX: from a stem table, or from another process's cache)
+        for token, stem in stems.items():
+            if len(self.stems) >= self.max_size:
+                break
+            self.stems[token] = stem
+
+    def take_new_stems(self) -> dict:
+        # Returns the <token, stem> pairs cached since the last call
+        # Worker processes send these back to the main process, so the main cache ends up with every stem
+        new_stems = {token: self.stems[token] for token in self.new_tokens}
+        self.new_tokens = []
+        return new_stems
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"size": len(self.stems), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups != 0 else 0.0}
+
+# Cache shared by everything in this process that stems text
+stem_cache = StemCache()
+
+def tokenize(content: str) -> list:
+    # Get a list of all tokens from a content string (token = alphanumeric sequence)
+    return tokenizer.tokenize(content)
+
+def stem_tokens(tokens: list) -> list:
+    # Use Porter Stemmer for stemming (through the cache)
+    return [stem_cache.stem(token) for token in tokens]
+
+def compute_word_frequencies(tokens: list) -> defaultdict:
+    # Returns a dictionary that maps the tokens in the list to the number of their occurrences
+    word_count = defaultdict(int)
+    for t in tokens:
+        word_count[t] += 1
+    return word_count
+
+def save_stem_table(index_dir: str = ".") -> None:
+    # Persists the cached stems next to the index, so later runs start with a warm cache
+    with open(os.path.join(index_dir, STEM_TABLE), "w") as table_file:
+        json.dump(stem_cache.stems, table_file)
+
+def load_stem_table(index_dir: str = ".") -> None:
+    # Warms up the cache with a saved stem table (does nothing if there isn't one)
+    # Stemming is a pure function of the token, so a table from an older build is still correct
+    try:
+        with open(os.path.join(index_dir, STEM_TABLE), "r") as table_file:
+            stem_cache.update(json.load(table_file))
+    except FileNotFoundError:
+        pass